@@ -1,7 +1,9 @@
 import duckdb
 import pandas as pd
+import pyarrow as pa
 import sys
 import json
+import argparse
 from pathlib import Path
 
 # --- プロジェクトルートを基準にパスを解決 ---
@@ -31,38 +33,23 @@ def load_settings():
         print(f"[エラー] 設定ファイルの読み込み中に予期せぬ問題が発生しました: {e}", file=sys.stderr)
         sys.exit(1)
 
-def analyze_project_balance():
+def estimate_overrun_causes(con: duckdb.DuckDBPyConnection, target_year: int = None) -> pa.Table:
     """
-    事業ごとの予算・支出バランスをチェックし、超過原因を推定する。
+    支出総額が予算総額を超過している事業を抽出し、超過原因を推定した結果をArrowテーブルで返す。
+    国庫債務負担行為の有無・マイナス予算の有無の判定と原因の分類を、単一の集合演算クエリで行う。
+    target_year を指定した場合は、その予算年度の予算額のみを比較対象とする。
     """
-    settings = load_settings()
-    try:
-        db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
-        results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
-    except KeyError as e:
-        print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
-        sys.exit(1)
-    
-    if not db_file_path.is_file():
-        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
-        sys.exit(1)
-
-    print(f"--- データベース '{db_file_path}' の事業ごと予算・支出バランスを分析します ---")
-    
-    try:
-        con = duckdb.connect(database=str(db_file_path), read_only=True)
-    except Exception as e:
-        print(f"[エラー] DB接続に失敗しました: {e}", file=sys.stderr)
-        return
-
-    # --- ステップ1: 予算超過リストを作成 ---
-    base_query = """
+    year_filter = f"WHERE 予算年度 = {int(target_year)}" if target_year is not None else ""
+    query = f"""
     WITH
+    BudgetRows AS (
+        SELECT * FROM "予算・執行_サマリ" {year_filter}
+    ),
     BudgetTotal AS (
         SELECT
             予算事業ID, 事業名,
             SUM("計（歳出予算現額合計）") AS "歳出予算現額合計"
-        FROM "予算・執行_サマリ"
+        FROM BudgetRows
         GROUP BY 予算事業ID, 事業名
     ),
     ExpenditureTotal AS (
@@ -70,72 +57,82 @@ def analyze_project_balance():
         FROM "支出先_支出情報"
         WHERE "金額" IS NOT NULL
         GROUP BY 予算事業ID
+    ),
+    -- 国庫債務負担行為による契約がある事業
+    KokkoSaimu AS (
+        SELECT DISTINCT 予算事業ID FROM "支出先_国庫債務負担行為等による契約"
+    ),
+    -- 予算項目にマイナスがある事業
+    NegativeBudget AS (
+        SELECT DISTINCT 予算事業ID FROM BudgetRows
+        WHERE "当初予算（合計）" < 0 OR "補正予算（合計）" < 0 OR "前年度からの繰越し（合計）" < 0 OR "予備費等（合計）" < 0
     )
     SELECT
         b.予算事業ID, b.事業名,
         b."歳出予算現額合計" AS "実質的な予算総額",
         e.事業全体の支出総額,
-        (e.事業全体の支出総額 - b."歳出予算現額合計") AS "超過額"
-    FROM BudgetTotal AS b JOIN ExpenditureTotal AS e ON b.予算事業ID = e.予算事業ID
+        (e.事業全体の支出総額 - b."歳出予算現額合計") AS "超過額",
+        CASE
+            WHEN k.予算事業ID IS NOT NULL THEN '国庫債務負担行為の可能性'
+            WHEN n.予算事業ID IS NOT NULL THEN '収入/返還等（マイナス予算）の可能性'
+            WHEN b."歳出予算現額合計" = 0 THEN '予算額ゼロ（別会計/繰越金等）'
+            -- 予算額がマイナスの場合も特殊なケースとして分類
+            WHEN b."歳出予算現額合計" < 0 THEN '予算額マイナス（会計上の調整）'
+            ELSE '原因不明（要詳細調査）'
+        END AS "超過原因の推定"
+    FROM BudgetTotal AS b
+    JOIN ExpenditureTotal AS e ON b.予算事業ID = e.予算事業ID
+    LEFT JOIN KokkoSaimu AS k ON b.予算事業ID = k.予算事業ID
+    LEFT JOIN NegativeBudget AS n ON b.予算事業ID = n.予算事業ID
     WHERE e.事業全体の支出総額 > b."歳出予算現額合計"
+    ORDER BY "超過額" DESC
     """
-    print("  - チェック中: 支出総額が予算総額を超過している事業...")
+    return con.execute(query).to_arrow_table()
+
+def analyze_project_balance(target_year: int = None):
+    """
+    事業ごとの予算・支出バランスをチェックし、超過原因を推定する。
+    """
+    settings = load_settings()
+    try:
+        db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+        results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
+    except KeyError as e:
+        print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
+        sys.exit(1)
+    
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    print(f"--- データベース '{db_file_path}' の事業ごと予算・支出バランスを分析します ---")
     
     try:
-        issue_df = con.execute(base_query).fetchdf()
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
     except Exception as e:
-        print(f"    [エラー] 予算超過リストの作成中にクエリエラーが発生しました: {e}", file=sys.stderr)
-        con.close()
-        return
-    
-    if issue_df.empty:
-        print("\n[成功] 予算超過の事業は見つかりませんでした。")
-        con.close()
+        print(f"[エラー] DB接続に失敗しました: {e}", file=sys.stderr)
         return
 
-    print(f"    -> {len(issue_df)}件の予算超過が疑われる事業を検出しました。")
-    
-    # --- ステップ2: 超過原因を推定するための情報を収集 ---
-    issue_ids = tuple(issue_df['予算事業ID'].tolist())
+    if target_year is not None:
+        print(f"  - 対象予算年度: {target_year}")
+    print("  - チェック中: 支出総額が予算総額を超過している事業と、その原因...")
     
     try:
-        # 国庫債務負担行為の対象IDを取得
-        kokko_saimu_ids_df = con.execute(f'SELECT DISTINCT 予算事業ID FROM "支出先_国庫債務負担行為等による契約" WHERE 予算事業ID IN {issue_ids}').fetchdf()
-        kokko_saimu_ids = set(kokko_saimu_ids_df['予算事業ID'].tolist())
-
-        # 予算項目にマイナスがあるIDを取得
-        negative_budget_ids_df = con.execute(f"""
-            SELECT DISTINCT 予算事業ID FROM "予算・執行_サマリ"
-            WHERE 予算事業ID IN {issue_ids} AND (
-                "当初予算（合計）" < 0 OR "補正予算（合計）" < 0 OR "前年度からの繰越し（合計）" < 0 OR "予備費等（合計）" < 0
-            )
-        """).fetchdf()
-        negative_budget_ids = set(negative_budget_ids_df['予算事業ID'].tolist())
+        issue_table = estimate_overrun_causes(con, target_year)
     except Exception as e:
-        print(f"    [エラー] 超過原因の調査中にクエリエラーが発生しました: {e}", file=sys.stderr)
-        kokko_saimu_ids = set()
-        negative_budget_ids = set()
-
-    # --- ステップ3: 原因を推定し、結果をDataFrameに追加 ---
-    def estimate_cause(row):
-        business_id = row['予算事業ID']
-        budget_total = row['実質的な予算総額']
-        
-        if business_id in kokko_saimu_ids:
-            return "国庫債務負担行為の可能性"
-        if business_id in negative_budget_ids:
-            return "収入/返還等（マイナス予算）の可能性"
-        if budget_total == 0:
-            return "予算額ゼロ（別会計/繰越金等）"
-        # 予算額がマイナスの場合も特殊なケースとして分類
-        if budget_total < 0:
-            return "予算額マイナス（会計上の調整）"
-        return "原因不明（要詳細調査）"
+        print(f"    [エラー] 予算超過の分析中にクエリエラーが発生しました: {e}", file=sys.stderr)
+        con.close()
+        return
 
-    issue_df['超過原因の推定'] = issue_df.apply(estimate_cause, axis=1)
-    
     con.close()
 
+    if issue_table.num_rows == 0:
+        print("\n[成功] 予算超過の事業は見つかりませんでした。")
+        return
+
+    print(f"    -> {issue_table.num_rows}件の予算超過が疑われる事業を検出しました。")
+    issue_df = issue_table.to_pandas()
+
     # --- 結果の表示と保存 ---
     print("\n--- 予算超過が疑われる事業リスト (原因推定付き) ---")
     pd.set_option('display.max_columns', None)
@@ -148,7 +145,7 @@ def analyze_project_balance():
     print(issue_df['超過原因の推定'].value_counts().to_string())
     print("----------------------")
 
-    output_filename = "project_balance_analysis_report.csv"
+    output_filename = "project_balance_analysis_report.csv" if target_year is None else f"project_balance_analysis_report_{target_year}.csv"
     output_path = results_folder / output_filename
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
@@ -157,4 +154,15 @@ def analyze_project_balance():
 
 
 if __name__ == '__main__':
-    analyze_project_balance()
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="事業ごとの予算・支出バランスをチェックし、予算超過の原因を推定します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '-y', '--year',
+        type=int,
+        default=None,
+        help="比較対象とする予算年度 (例: 2024)。\n指定しない場合は、全年度の予算額合計と比較します。"
+    )
+    args = parser.parse_args()
+    analyze_project_balance(args.year)
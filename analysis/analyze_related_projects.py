@@ -14,6 +14,10 @@ except NameError:
 SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
 # ---------------------------------------------
 
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.build_business_clusters import get_cluster
+
 def load_settings():
     """設定ファイルを読み込む"""
     try:
@@ -65,6 +69,31 @@ def analyze_related_projects(business_id: int, business_name: str, con: duckdb.D
 
     return related_df
 
+def analyze_cluster(business_id: int, con: duckdb.DuckDBPyConnection):
+    """
+    指定された事業が属するクラスタ (関連事業を間接的なつながりまで含めてまとめたもの) を表示し、
+    クラスタ内の全事業のDataFrameを返す。business_cluster テーブルを1回引くだけで求まる。
+    """
+    print(f"\n--- ID: {business_id} が属するクラスタ (間接的な関連事業を含む) を分析中... ---")
+    try:
+        cluster_df = get_cluster(con, business_id)
+    except duckdb.CatalogException:
+        print(" -> 'business_cluster' テーブルが見つかりません。最新の `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+        return None
+
+    if cluster_df.empty:
+        print(" -> この事業はクラスタ表に登録されていませんでした。")
+        return None
+
+    cluster = cluster_df.iloc[0]
+    print("\n--- クラスタのサマリー ---")
+    print(f"クラスタID: {cluster['クラスタID']}")
+    print(f"クラスタの事業数: {cluster['クラスタの事業数']}件 (府省庁数: {cluster['クラスタの府省庁数']})")
+    print(f"クラスタの予算額合計: {cluster['クラスタの予算額合計']:,.0f}")
+    print("--------------------")
+
+    return cluster_df
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description="指定された(または予算最大の)事業の関連事業を分析します。",
@@ -108,5 +137,12 @@ if __name__ == '__main__':
         
         analysis_result_df.to_csv(output_path, index=False, encoding='utf-8-sig')
         print(f"\n[成功] 詳細な関連事業リストを '{output_path}' に保存しました。")
+
+    cluster_df = analyze_cluster(target_id, con)
+    if cluster_df is not None:
+        output_path = results_folder / f"related_project_cluster_for_ID_{target_id}.csv"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        cluster_df.to_csv(output_path, index=False, encoding='utf-8-sig')
+        print(f"\n[成功] クラスタ内の事業リストを '{output_path}' に保存しました。")
     
     con.close()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import duckdb
+import pandas as pd
+import hashlib
+import datetime
+from pathlib import Path
+
+# --- RAGの回答キャッシュ (意味的キャッシュ) ---
+# ask_with_rag.py で生成・実行に成功したSQLを、質問文のEmbeddingとともに保存する。
+# 新しい質問のEmbeddingとのコサイン類似度がしきい値以上の質問があれば、ベクトル検索・プロンプト構築・
+# LLMによるSQL生成を省略し、保存済みのSQLをそのまま実行する (言い回しが少し違うだけの質問に対応するため)。
+# キャッシュは「DBのビルドID + schema.yaml のハッシュ」(コンテキストキー) ごとに有効で、
+# どちらかが変わると、古いエントリは開いたときに削除される。
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS answer_cache (
+        question_hash VARCHAR,
+        question VARCHAR,
+        model VARCHAR,
+        ministry VARCHAR,
+        context_key VARCHAR,
+        question_embedding FLOAT[],
+        generated_sql VARCHAR,
+        result_fingerprint VARCHAR,
+        row_count BIGINT,
+        hit_count BIGINT,
+        created_at TIMESTAMP,
+        last_used_at TIMESTAMP
+    )
+"""
+
+def question_hash(question: str, ministry: str = None) -> str:
+    """質問文 (前後の空白を除く) と絞り込みの府省庁から、完全一致用のキーを計算する"""
+    return hashlib.sha256(f"{ministry or ''}\x1f{question.strip()}".encode('utf-8')).hexdigest()
+
+def cache_context_key(con: duckdb.DuckDBPyConnection, schema_path: Path) -> str:
+    """
+    DBのビルドID (import_manifest) と schema.yaml の内容から、キャッシュの有効範囲を表すキーを計算する。
+    どちらかが変わると、保存済みのSQLや結果が今のDBと合わなくなる可能性があるため。
+    """
+    try:
+        build_id = con.execute("SELECT MAX(build_id) FROM import_manifest").fetchone()[0]
+    except duckdb.Error:
+        build_id = None
+    schema_path = Path(schema_path)
+    schema_sha256 = hashlib.sha256(schema_path.read_bytes()).hexdigest() if schema_path.is_file() else ''
+    return f"{build_id or 'unknown'}:{schema_sha256[:16]}"
+
+def result_fingerprint(df: pd.DataFrame) -> str:
+    """クエリ結果の指紋 (列名と各行の値のハッシュ)。キャッシュのSQLを再実行したときに結果が変わっていないかを確かめる"""
+    digest = hashlib.sha256("\x1f".join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df.astype(str), index=False).values.tobytes())
+    return digest.hexdigest()
+
+class AnswerCache:
+    """
+    質問文のEmbeddingで引く、生成済みSQLのキャッシュ。
+    with文で使うと、終了時に接続を閉じる。
+    """
+
+    def __init__(self, cache_db_path: Path, model: str, context_key: str):
+        self.cache_db_path = Path(cache_db_path)
+        self.model = model
+        self.context_key = context_key
+        self.cache_db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = duckdb.connect(database=str(self.cache_db_path))
+        self.con.execute(CACHE_SCHEMA)
+        self.num_invalidated = self.invalidate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    def invalidate(self) -> int:
+        """DBのビルドや schema.yaml が変わる前に保存されたエントリを削除し、その件数を返す"""
+        num_stale = self.con.execute(
+            "SELECT COUNT(*) FROM answer_cache WHERE context_key <> ?", [self.context_key]
+        ).fetchone()[0]
+        if num_stale:
+            self.con.execute("DELETE FROM answer_cache WHERE context_key <> ?", [self.context_key])
+        return num_stale
+
+    def lookup_exact(self, question: str, ministry: str = None):
+        """同じ質問文のエントリを返す (Embeddingの計算も省略できる)。無ければ None"""
+        row = self.con.execute("""
+            SELECT question, generated_sql, result_fingerprint, row_count, 1.0 AS similarity
+            FROM answer_cache
+            WHERE question_hash = ? AND model = ? AND context_key = ?
+            ORDER BY created_at DESC
+            LIMIT 1
+        """, [question_hash(question, ministry), self.model, self.context_key]).fetchdf()
+        return self._touch(row, question_hash(question, ministry))
+
+    def lookup_similar(self, question_embedding: list, ministry: str = None, threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        """質問文のEmbeddingとの類似度が threshold 以上で最も近いエントリを返す。無ければ None"""
+        row = self.con.execute("""
+            SELECT question_hash, question, generated_sql, result_fingerprint, row_count,
+                   list_cosine_similarity(question_embedding, CAST(? AS FLOAT[])) AS similarity
+            FROM answer_cache
+            WHERE model = ? AND context_key = ? AND ministry IS NOT DISTINCT FROM ?
+            ORDER BY similarity DESC
+            LIMIT 1
+        """, [list(question_embedding), self.model, self.context_key, ministry]).fetchdf()
+        if row.empty or row['similarity'].iloc[0] < threshold:
+            return None
+        return self._touch(row.drop(columns='question_hash'), row['question_hash'].iloc[0])
+
+    def _touch(self, row: pd.DataFrame, hit_hash: str):
+        """ヒットしたエントリの利用回数と最終利用日時を更新し、エントリを辞書で返す"""
+        if row.empty:
+            return None
+        self.con.execute(
+            "UPDATE answer_cache SET hit_count = hit_count + 1, last_used_at = ? WHERE question_hash = ? AND model = ? AND context_key = ?",
+            [datetime.datetime.now(), hit_hash, self.model, self.context_key]
+        )
+        return row.iloc[0].to_dict()
+
+    def put(self, question: str, question_embedding: list, generated_sql: str, result_df: pd.DataFrame, ministry: str = None):
+        """実行に成功したSQLと結果の指紋を保存する (同じ質問文のエントリは置き換える)"""
+        key = question_hash(question, ministry)
+        now = datetime.datetime.now()
+        self.con.execute(
+            "DELETE FROM answer_cache WHERE question_hash = ? AND model = ? AND context_key = ?",
+            [key, self.model, self.context_key]
+        )
+        self.con.execute(
+            "INSERT INTO answer_cache VALUES (?, ?, ?, ?, ?, CAST(? AS FLOAT[]), ?, ?, ?, 0, ?, ?)",
+            [key, question.strip(), self.model, ministry, self.context_key, list(question_embedding),
+             generated_sql, result_fingerprint(result_df), len(result_df), now, now]
+        )
+
+    def count(self) -> int:
+        """現在のコンテキストで有効なエントリの件数"""
+        return self.con.execute(
+            "SELECT COUNT(*) FROM answer_cache WHERE model = ? AND context_key = ?", [self.model, self.context_key]
+        ).fetchone()[0]
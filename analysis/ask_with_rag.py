@@ -1,13 +1,9 @@
 import duckdb
-import chromadb
-import google.generativeai as genai
 import pandas as pd
 import sys
 import json
 from pathlib import Path
-import os
 import argparse
-from dotenv import load_dotenv
 
 # --- プロジェクトルートを基準にパスを解決 ---
 try:
@@ -18,6 +14,15 @@ except NameError:
 SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
 # ---------------------------------------------
 
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.llm_backends import get_backend, BACKEND_NAMES
+from analysis.vector_store import search, search_quantized, vector_dimension
+from analysis.quantized_embeddings import QuantizedIndex
+from analysis.answer_cache import AnswerCache, cache_context_key, result_fingerprint, DEFAULT_SIMILARITY_THRESHOLD
+from analysis.schema_index import SchemaIndex, DEFAULT_TOP_TABLES, DEFAULT_TOP_COLUMNS
+from analysis.sql_guard import SQLGuardError, apply_limits, execute_guarded, DEFAULT_MEMORY_LIMIT
+
 def load_settings():
     """設定ファイルを読み込む"""
     try:
@@ -27,105 +32,244 @@ def load_settings():
         print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
         sys.exit(1)
 
-def configure_genai():
-    """
-    .envファイルからAPIキーを読み込み、Google AIを設定する
-    """
-    load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        print("[エラー] .envファイルに GOOGLE_API_KEY が設定されていません。")
-        sys.exit(1)
-    genai.configure(api_key=api_key)
+def load_guard_limits(settings: dict) -> dict:
+    """設定ファイルの rag.sql_guard から、execute_guarded に渡す上限 (行数・実行時間・推定行数) を読み込む"""
+    guard_settings = settings.get('rag', {}).get('sql_guard', {})
+    return {key: guard_settings[key] for key in ('row_limit', 'timeout_seconds', 'max_estimated_rows') if key in guard_settings}
+
+def clean_sql(response_text: str) -> str:
+    """LLMの出力から余計な文字を削除する"""
+    return response_text.strip().replace('```sql', '').replace('```', '')
+
+def execute_and_print(con: duckdb.DuckDBPyConnection, generated_sql: str, guard_limits: dict = None):
+    """SQLをガード (sql_guard.py) を通して実行して結果を表示し、結果のDataFrameを返す。失敗した場合は SQLGuardError を送出する"""
+    result_df, estimated_rows, truncated = execute_guarded(con, generated_sql, **(guard_limits or {}))
+    print(f" -> 実行計画の推定行数 (最大): {estimated_rows:,}行")
+    print("\n--- 最終的な回答 ---")
+    pd.set_option('display.max_rows', 100)
+    pd.set_option('display.width', 120)
+    print(result_df.to_string())
+    print("--------------------")
+    if truncated:
+        print(f" -> 結果が多いため、先頭の {len(result_df):,}行のみ取得しました。")
+    return result_df
+
+def answer_from_cache(con: duckdb.DuckDBPyConnection, cached: dict, guard_limits: dict = None) -> bool:
+    """キャッシュ済みのSQLを実行して回答する。結果が保存時と違う場合は警告する"""
+    print(f"--- キャッシュ済みの回答を使用します (類似度 {cached['similarity']:.3f}: 「{cached['question']}」) ---")
+    print(f" -> キャッシュ済みのSQL:\n{cached['generated_sql']}\n")
+    try:
+        result_df = execute_and_print(con, cached['generated_sql'], guard_limits)
+    except SQLGuardError as e:
+        print(f" [エラー] キャッシュ済みのSQLを実行できません。改めてSQLを生成します: {e}", file=sys.stderr)
+        return False
+    if result_fingerprint(result_df) != cached['result_fingerprint']:
+        print(" !! 警告: 結果がキャッシュ保存時と異なります。", file=sys.stderr)
+    return True
+
+def repair_sql(backend, prompt: str, generated_sql: str, error: SQLGuardError):
+    """実行できなかったSQLとエラーの内容をLLMに渡し、修正したSQLを返す (失敗した場合は None)"""
+    try:
+        repair_template_path = PROJECT_ROOT / "prompts" / "rag_sql_repair_prompt.txt"
+        repair_template = repair_template_path.read_text(encoding='utf-8')
+    except FileNotFoundError:
+        print(f"[エラー] プロンプトテンプレート '{repair_template_path}' が見つかりません。", file=sys.stderr)
+        return None
+    try:
+        return clean_sql(backend.generate(repair_template.format(prompt=prompt, generated_sql=generated_sql, error=error)))
+    except Exception as e:
+        print(f"[エラー] LLM APIの呼び出しに失敗しました: {e}", file=sys.stderr)
+        return None
+
+def build_schema_info(schema_index: SchemaIndex, query_embedding: list, top_tables: int = DEFAULT_TOP_TABLES, top_columns: int = DEFAULT_TOP_COLUMNS) -> str:
+    """プロンプトに埋め込むスキーマ情報。schema_index があれば質問に関連する部分だけ、無ければ schema.yaml の全体"""
+    if schema_index is not None:
+        return schema_index.schema_info(query_embedding, top_tables, top_columns)
+    try:
+        return (PROJECT_ROOT / "schema.yaml").read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return "スキーマ情報なし"
 
-def rag_text_to_sql(question: str):
+def run_rag_pipeline(con: duckdb.DuckDBPyConnection, backend, question: str, ministry: str = None,
+                     answer_cache: AnswerCache = None, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                     schema_index: SchemaIndex = None, guard_limits: dict = None, quantized_index: QuantizedIndex = None):
     """
-    RAGを使って自然言語の質問からSQLを生成し、実行する。
+    ベクトル検索 → プロンプト構築 → SQL生成 → 実行 の各ステップを行う。
+    answer_cache を渡すと、似た質問の回答が保存済みであれば、ベクトル検索以降を省略してそのSQLを実行する。
+    schema_index を渡すと、プロンプトには質問に関連するVIEWと列だけを載せる (渡さない場合は schema.yaml の全体)。
+    生成されたSQLは guard_limits の上限のもとで実行し、検証・実行計画の段階で失敗した場合はLLMに1回だけ修正させる。
+    quantized_index を渡すと、ベクトル検索の類似度を rag_documents の全精度のEmbeddingではなく量子化Embeddingで計算する。
     """
-    settings = load_settings()
-    db_file_path = str(PROJECT_ROOT / settings['database']['output_db_file'])
-    vector_store_path = str(PROJECT_ROOT / "vector_store")
-    
-    configure_genai()
+    if answer_cache is not None:
+        cached = answer_cache.lookup_exact(question, ministry)
+        if cached is not None and answer_from_cache(con, cached, guard_limits):
+            return
 
     print("--- Step 1: ベクトル検索で関連情報を取得中... ---")
     try:
-        client = chromadb.PersistentClient(path=vector_store_path)
-        collection = client.get_collection(name="rs_system_rag")
+        query_embedding = backend.embed_query(question)
     except Exception as e:
-        print(f"[エラー] ベクトルDBの読み込みに失敗しました: {e}", file=sys.stderr)
-        print(f"  -> まず `analysis/build_vector_store.py` を実行してください。")
+        print(f"[エラー] 質問文のEmbeddingに失敗しました: {e}", file=sys.stderr)
         return
 
+    if answer_cache is not None:
+        cached = answer_cache.lookup_similar(query_embedding, ministry, threshold)
+        if cached is not None and answer_from_cache(con, cached, guard_limits):
+            return
+
     try:
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=question,
-            task_type="RETRIEVAL_QUERY"
-        )
-        query_embedding = result['embedding']
-        results = collection.query(query_embeddings=[query_embedding], n_results=10)
+        where, params = ("府省庁 = ?", [ministry]) if ministry else (None, None)
+        if quantized_index is not None:
+            results_df = search_quantized(con, quantized_index, query_embedding, k=10, where=where, params=params)
+        else:
+            results_df = search(con, query_embedding, k=10, where=where, params=params)
+    except duckdb.CatalogException as e:
+        print(f"[エラー] ベクトルストアの読み込みに失敗しました: {e}", file=sys.stderr)
+        print(f"  -> まず `analysis/build_vector_store.py` を実行してください。")
+        return
     except Exception as e:
-        print(f"[エラー] ベクトル検索中にAPIエラーが発生しました: {e}", file=sys.stderr)
+        print(f"[エラー] ベクトル検索中にエラーが発生しました: {e}", file=sys.stderr)
         return
 
-    relevant_ids = sorted(list({item['予算事業ID'] for item in results['metadatas'][0]}))
-    context_info = "\n".join(f"- {doc}" for doc in results['documents'][0])
-    
+    # 同じ説明文の明細は1文書にまとめて登録されているため、予算事業IDの一覧から展開する
+    relevant_ids = sorted({
+        int(business_id)
+        for business_ids in results_df['予算事業ID一覧'].dropna()
+        for business_id in business_ids.split(',') if business_id
+    })
+    context_info = "\n".join(f"- {doc}" for doc in results_df['document_text'])
+
     print(f" -> 関連性の高い事業ID: {relevant_ids}")
-    
+
     print("--- Step 2: LLMへのプロンプトを構築中... ---")
-    try:
-        schema_info = (PROJECT_ROOT / "schema.yaml").read_text(encoding='utf-8')
-    except FileNotFoundError:
-        schema_info = "スキーマ情報なし"
-    
+    schema_info = build_schema_info(schema_index, query_embedding)
+
     try:
         prompt_template_path = PROJECT_ROOT / "prompts" / "rag_sql_generation_prompt.txt"
         prompt_template = prompt_template_path.read_text(encoding='utf-8')
     except FileNotFoundError:
         print(f"[エラー] プロンプトテンプレート '{prompt_template_path}' が見つかりません。", file=sys.stderr)
         return
-    
+
     prompt = prompt_template.format(
         schema_info=schema_info,
         relevant_ids=relevant_ids,
         context_info=context_info,
         question=question
     )
+    print(f" -> プロンプト: {len(prompt):,}文字 (うちスキーマ情報 {len(schema_info):,}文字)")
 
-    print("--- Step 3: LLM (Gemini) にSQLを生成させています... ---")
+    print(f"--- Step 3: LLM ({backend.name}) にSQLを生成させています... ---")
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        response = model.generate_content(prompt)
-        # LLMの出力から余計な文字を削除
-        generated_sql = response.text.strip().replace('```sql', '').replace('```', '')
+        generated_sql = clean_sql(backend.generate(prompt))
     except Exception as e:
         print(f"[エラー] LLM APIの呼び出しに失敗しました: {e}", file=sys.stderr)
         return
-    
+
     print(f" -> 生成されたSQL (クリーニング後):\n{generated_sql}\n")
-    
+
     print("--- Step 4: 生成されたSQLをDuckDBで実行しています... ---")
     try:
-        con = duckdb.connect(database=db_file_path, read_only=True)
-        result_df = con.execute(generated_sql).fetchdf()
-        
-        print("\n--- 最終的な回答 ---")
-        pd.set_option('display.max_rows', 100)
-        pd.set_option('display.width', 120)
-        print(result_df.to_string())
-        print("--------------------")
+        result_df = execute_and_print(con, generated_sql, guard_limits)
+    except SQLGuardError as e:
+        print(f" [エラー] {e}", file=sys.stderr)
+        if not e.repairable:
+            return
+        print(f"--- Step 5: エラーの内容をLLM ({backend.name}) に伝えて、SQLを修正させています... ---")
+        generated_sql = repair_sql(backend, prompt, generated_sql, e)
+        if generated_sql is None:
+            return
+        print(f" -> 修正されたSQL:\n{generated_sql}\n")
+        try:
+            result_df = execute_and_print(con, generated_sql, guard_limits)
+        except SQLGuardError as e:
+            print(f" [エラー] 修正後のSQLも実行できませんでした: {e}", file=sys.stderr)
+            return
+    if answer_cache is not None:
+        answer_cache.put(question, query_embedding, generated_sql, result_df, ministry)
 
+def open_answer_cache(con: duckdb.DuckDBPyConnection, settings: dict, backend):
+    """設定ファイルの rag.answer_cache_file を開く。開けない場合 (他のプロセスが使用中など) はキャッシュなしで続行する"""
+    cache_path = PROJECT_ROOT / settings.get('rag', {}).get('answer_cache_file', 'cache/answer_cache.duckdb')
+    try:
+        answer_cache = AnswerCache(cache_path, backend.embedding_model, cache_context_key(con, PROJECT_ROOT / "schema.yaml"))
+    except Exception as e:
+        print(f" !! 警告: 回答キャッシュ '{cache_path}' を開けません。キャッシュを使わずに実行します: {e}", file=sys.stderr)
+        return None
+    if answer_cache.num_invalidated:
+        print(f" -> DBまたは schema.yaml が更新されたため、回答キャッシュの {answer_cache.num_invalidated}件を削除しました。")
+    return answer_cache
+
+def open_schema_index(settings: dict, backend):
+    """schema.yaml のVIEW・列の説明文のEmbeddingを用意する。失敗した場合はスキーマの全体を使う"""
+    embedding_cache_path = PROJECT_ROOT / settings.get('vector_store', {}).get('embedding_cache_file', 'cache/embedding_cache.duckdb')
+    try:
+        return SchemaIndex(PROJECT_ROOT / "schema.yaml", backend, embedding_cache_path)
+    except Exception as e:
+        print(f" !! 警告: スキーマの索引を作成できません。schema.yaml の全体をプロンプトに含めます: {e}", file=sys.stderr)
+        return None
+
+def open_quantized_index(con: duckdb.DuckDBPyConnection):
+    """build_vector_store.py が保存した量子化Embedding (cache/quantized) を開く。開けない場合は全精度のベクトル検索を使う"""
+    index_dir = PROJECT_ROOT / "cache" / "quantized"
+    try:
+        quantized_index = QuantizedIndex(index_dir)
     except Exception as e:
-        print(f" [エラー] 生成されたSQLの実行に失敗しました: {e}", file=sys.stderr)
+        print(f" !! 警告: 量子化Embedding '{index_dir}' を開けません。rag_documents のEmbeddingで検索します: {e}", file=sys.stderr)
+        return None
+    # rag_documents と次元数が異なる場合 (別のモデルで作成した索引) は使わない
+    try:
+        dimension = vector_dimension(con)
+    except duckdb.Error:
+        dimension = None
+    if quantized_index.meta['dimension'] != dimension:
+        print(f" !! 警告: 量子化Embedding '{index_dir}' の次元数が rag_documents と異なるため、rag_documents のEmbeddingで検索します。", file=sys.stderr)
+        return None
+    print(f" -> 量子化Embedding ({quantized_index.dtype}, {len(quantized_index):,}件) でベクトル検索します。")
+    return quantized_index
+
+def rag_text_to_sql(question: str, backend_name: str = None, ministry: str = None, use_cache: bool = True, threshold: float = None, full_schema: bool = False,
+                    quantized: bool = False):
+    """
+    RAGを使って自然言語の質問からSQLを生成し、実行する。
+    backend_name でEmbedding・LLMのバックエンドを指定できる (fake はオフライン用)。
+    ministry を指定すると、ベクトル検索をその府省庁の文書に絞り込む。
+    use_cache が真の場合、類似度が threshold 以上の質問の回答が保存済みであれば、LLMを呼び出さずにそのSQLを実行する。
+    full_schema が真の場合、質問に関連するVIEW・列に絞り込まずに schema.yaml の全体をプロンプトに含める。
+    quantized が真の場合、ベクトル検索に量子化Embedding (cache/quantized) を使う (メモリの少ない環境向け)。
+    """
+    settings = load_settings()
+    db_file_path = str(PROJECT_ROOT / settings['database']['output_db_file'])
+    if threshold is None:
+        threshold = settings.get('rag', {}).get('answer_cache_similarity', DEFAULT_SIMILARITY_THRESHOLD)
+    try:
+        backend = get_backend(backend_name)
+    except Exception as e:
+        print(f"[エラー] バックエンドの初期化に失敗しました: {e}", file=sys.stderr)
+        return
+
+    # ベクトル検索 (rag_documents テーブル) と生成SQLの実行は、同じDBファイルへの1つの接続で行う
+    con = duckdb.connect(database=db_file_path, read_only=True)
+    # 生成されたSQLが共有の分析サーバーのメモリを使い切らないよう、接続に上限を設定する
+    apply_limits(con, settings.get('rag', {}).get('sql_guard', {}).get('memory_limit', DEFAULT_MEMORY_LIMIT))
+    answer_cache = open_answer_cache(con, settings, backend) if use_cache else None
+    schema_index = None if full_schema else open_schema_index(settings, backend)
+    quantized_index = open_quantized_index(con) if quantized else None
+    try:
+        run_rag_pipeline(con, backend, question, ministry, answer_cache, threshold, schema_index, load_guard_limits(settings), quantized_index)
     finally:
-        if 'con' in locals():
-            con.close()
+        if answer_cache is not None:
+            answer_cache.close()
+        con.close()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="RAGを使って自然言語の質問からSQLを生成・実行します。")
     parser.add_argument('question', type=str, help="データベースに対する質問 (日本語で自由に入力)")
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default=None, help="Embedding・LLMのバックエンド (デフォルト: 環境変数 RS_LLM_BACKEND、または設定ファイルの llm.backend)")
+    parser.add_argument('-m', '--ministry', type=str, help="ベクトル検索の対象を、指定した府省庁の文書に絞り込みます。 (例: '国土交通省')")
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help="回答キャッシュを使わずに、毎回LLMでSQLを生成します。")
+    parser.add_argument('--threshold', type=float, default=None, help=f"回答キャッシュを使う質問の類似度のしきい値 (デフォルト: 設定ファイルの rag.answer_cache_similarity、または {DEFAULT_SIMILARITY_THRESHOLD})")
+    parser.add_argument('--full-schema', action='store_true', help="質問に関連するVIEW・列に絞り込まずに、schema.yaml の全体をプロンプトに含めます。")
+    parser.add_argument('--quantized', action='store_true', help="ベクトル検索に、build_vector_store.py が保存した量子化Embedding (cache/quantized) を使います。")
     args = parser.parse_args()
-    
-    rag_text_to_sql(args.question)
\ No newline at end of file
+    rag_text_to_sql(args.question, args.backend, args.ministry, args.use_cache, args.threshold, args.full_schema, args.quantized)
@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+
+# --- 非同期のEmbedding実行 ---
+# バッチを複数同時にAPIへ送り (同時実行数を制限)、トークンバケットでリクエスト数をAPIの上限内に抑える。
+# 一時的なエラー (429 / 5xx) は指数バックオフで再試行する。
+# 完了したバッチは呼び出し元のコールバック (キャッシュへの書き込みなど) に渡すため、中断しても再開できる。
+
+# 再試行するHTTPステータス (レート制限とサーバー側の一時的なエラー)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def is_retryable(error: Exception) -> bool:
+    """再試行すべき一時的なエラーかどうか"""
+    # google.api_core の例外は、code 属性にHTTPステータスを持つ
+    code = getattr(error, 'code', None)
+    try:
+        if int(code) in RETRYABLE_STATUS_CODES:
+            return True
+    except (TypeError, ValueError):
+        pass
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+class TokenBucket:
+    """
+    トークンバケットによるレート制限。1分あたり requests_per_minute 回までのリクエストを許可し、
+    最大 burst 回までは連続して送れる。
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """トークンを1つ取得する (無ければ補充されるまで待つ)"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncEmbedder:
+    """
+    同期のEmbedding関数 (テキストのリスト → ベクトルのリスト) を、スレッド上で並行に呼び出す。
+
+    使い方:
+        embedder = AsyncEmbedder(embed_fn, concurrency=8, requests_per_minute=1500)
+        embedder.run(batches, on_batch_done=lambda index, texts, embeddings: ...)
+    """
+
+    def __init__(self, embed_fn, concurrency: int = 4, requests_per_minute: float = 1500,
+                 max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.embed_fn = embed_fn
+        self.concurrency = concurrency
+        self.requests_per_minute = requests_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.num_retries = 0
+
+    async def _embed_with_retry(self, texts: list, bucket: TokenBucket, semaphore: asyncio.Semaphore) -> list:
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                await bucket.acquire()
+                try:
+                    return await asyncio.to_thread(self.embed_fn, texts)
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    # 指数バックオフ (ジッター付き)
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                    self.num_retries += 1
+                    await asyncio.sleep(delay)
+
+    async def _run(self, batches: list, on_batch_done) -> list:
+        bucket = TokenBucket(self.requests_per_minute, burst=self.concurrency)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = [None] * len(batches)
+
+        async def run_batch(index: int):
+            return index, await self._embed_with_retry(batches[index], bucket, semaphore)
+
+        tasks = [asyncio.create_task(run_batch(i)) for i in range(len(batches))]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                index, embeddings = await finished
+                results[index] = embeddings
+                if on_batch_done is not None:
+                    on_batch_done(index, batches[index], embeddings)
+        except BaseException:
+            # 1つのバッチが再試行しても失敗した場合は、残りのバッチを中止する (完了分はコールバック済み)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return results
+
+    def run(self, batches: list, on_batch_done=None) -> list:
+        """
+        すべてのバッチをEmbeddingし、バッチの順にベクトルのリストを返す。
+        on_batch_done(バッチ番号, テキスト, ベクトル) は、バッチが完了するたびに呼ばれる。
+        """
+        return asyncio.run(self._run(batches, on_batch_done))
@@ -3,10 +3,7 @@ import pandas as pd
 import sys
 import json
 from pathlib import Path
-import os
 import argparse
-from dotenv import load_dotenv
-import google.generativeai as genai
 from tqdm import tqdm
 import time
 import re
@@ -19,6 +16,10 @@ except NameError:
 SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
 # ---------------------------------------------
 
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.llm_backends import get_backend, BACKEND_NAMES
+
 def load_settings():
     """設定ファイルを読み込む"""
     try:
@@ -27,25 +28,74 @@ def load_settings():
     except Exception as e:
         raise IOError(f"設定ファイル '{SETTINGS_FILE}' の読み込みに失敗しました: {e}")
 
-def configure_genai():
-    """APIキーを設定する"""
-    load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError(".envファイルに GOOGLE_API_KEY が設定されていません。")
-    genai.configure(api_key=api_key)
+AUDIT_PROMPT_TEMPLATE = """
+あなたは、細部にまで気を配る、経験豊富な政府の会計検査官です。
+以下の「事業名」と「契約概要」のペアを評価し、両者の内容が論理的に整合しているかを判断してください。
+
+# 事業名:
+{business_name}
+
+# 契約概要:
+{contract_outline}
+
+# あなたの評価:
+両者の整合性について、1 (全く無関係) から 5 (完全に一致) の5段階でスコアを付け、その理由を簡潔に述べてください。
+回答は必ず以下のJSON形式で出力してください。
+{{"score": [スコア], "reason": "[理由]"}}
+"""
 
-def audit_text_consistency(ministry: str = None, sort_by: str = None, top_n: int = None, sample_size: int = 100, free_tier_safe: bool = False):
+def audit_row(model, row: pd.Series, free_tier_safe: bool = False) -> dict:
+    """
+    1件の (事業名, 契約概要) をLLMに監査させ、スコアと理由を加えた辞書を返す。
+    LLMの呼び出しに失敗した場合は score=0 とし、理由にエラーを記録する。
+    """
+    prompt = AUDIT_PROMPT_TEMPLATE.format(
+        business_name=row['事業名'],
+        contract_outline=row['契約概要']
+    )
+
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            response_text = model.generate(prompt)
+            json_response = json.loads(response_text.strip().replace("```json", "").replace("```", ""))
+
+            return {
+                '事業名': row['事業名'],
+                '契約概要': row['契約概要'],
+                '金額': row['金額'],
+                '府省庁': row['府省庁'],
+                'score': json_response.get('score'),
+                'reason': json_response.get('reason')
+            }
+
+        except Exception as e:
+            if free_tier_safe and "429" in str(e):
+                wait_time = 60
+                match = re.search(r'seconds: (\d+)', str(e))
+                if match:
+                    wait_time = int(match.group(1)) + 1
+
+                print(f"\n[情報] レートリミット到達。{wait_time}秒待機して再試行します... ({attempt + 1}/{max_retries})")
+                time.sleep(wait_time)
+            else:
+                print(f"\n[警告] LLM APIで予期せぬエラー。スキップします。 Error: {e}")
+                return {**row.to_dict(), 'score': 0, 'reason': f'API error: {e}'}
+
+    print(f"\n[エラー] {max_retries}回のリトライ失敗。処理を中止。")
+    return {**row.to_dict(), 'score': 0, 'reason': 'Max retries exceeded'}
+
+def audit_text_consistency(ministry: str = None, sort_by: str = None, top_n: int = None, sample_size: int = 100, free_tier_safe: bool = False, backend: str = None):
     """
     事業名と契約概要の整合性をLLMに監査させ、レポートを出力する。
+    backend でLLMのバックエンドを指定できる (fake はオフライン用)。
     """
     settings = load_settings()
     db_file_path = str(PROJECT_ROOT / settings['database']['output_db_file'])
     results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
     
-    configure_genai()
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
+        model = get_backend(backend)
     except Exception as e:
         raise RuntimeError(f"LLMモデルの初期化に失敗しました: {e}")
 
@@ -98,61 +148,10 @@ def audit_text_consistency(ministry: str = None, sort_by: str = None, top_n: int
     if free_tier_safe:
         print("[情報] 無料API向けの安全モードが有効です (リクエスト間に1秒の待機を入れます)。")
     
-    prompt_template = """
-あなたは、細部にまで気を配る、経験豊富な政府の会計検査官です。
-以下の「事業名」と「契約概要」のペアを評価し、両者の内容が論理的に整合しているかを判断してください。
-
-# 事業名:
-{business_name}
-
-# 契約概要:
-{contract_outline}
-
-# あなたの評価:
-両者の整合性について、1 (全く無関係) から 5 (完全に一致) の5段階でスコアを付け、その理由を簡潔に述べてください。
-回答は必ず以下のJSON形式で出力してください。
-{{"score": [スコア], "reason": "[理由]"}}
-"""
 
     # ▼▼▼【修正点】sample_dfが定義された関数スコープ内でループ処理を行う▼▼▼
     for _, row in tqdm(sample_df.iterrows(), total=len(sample_df), desc="Auditing Progress"):
-        prompt = prompt_template.format(
-            business_name=row['事業名'],
-            contract_outline=row['契約概要']
-        )
-        
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                response = model.generate_content(prompt)
-                json_response = json.loads(response.text.strip().replace("```json", "").replace("```", ""))
-                
-                audit_results.append({
-                    '事業名': row['事業名'],
-                    '契約概要': row['契約概要'],
-                    '金額': row['金額'],
-                    '府省庁': row['府省庁'],
-                    'score': json_response.get('score'),
-                    'reason': json_response.get('reason')
-                })
-                break
-                
-            except Exception as e:
-                if free_tier_safe and "429" in str(e):
-                    wait_time = 60
-                    match = re.search(r'seconds: (\d+)', str(e))
-                    if match:
-                        wait_time = int(match.group(1)) + 1
-                    
-                    print(f"\n[情報] レートリミット到達。{wait_time}秒待機して再試行します... ({attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
-                else:
-                    print(f"\n[警告] LLM APIで予期せぬエラー。スキップします。 Error: {e}")
-                    audit_results.append({**row.to_dict(), 'score': 0, 'reason': f'API error: {e}'})
-                    break
-        else:
-            print(f"\n[エラー] {max_retries}回のリトライ失敗。処理を中止。")
-            audit_results.append({**row.to_dict(), 'score': 0, 'reason': 'Max retries exceeded'})
+        audit_results.append(audit_row(model, row, free_tier_safe))
 
         if free_tier_safe:
             time.sleep(1)
@@ -186,6 +185,7 @@ if __name__ == '__main__':
         action='store_true',
         help="Google AIの無料枠レートリミットを回避するための安全モードを有効にします (1秒/リクエスト + 自動リトライ)。"
     )
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default=None, help="LLMのバックエンド (デフォルト: 環境変数 RS_LLM_BACKEND、または設定ファイルの llm.backend)。\nfake はAPIを使わないオフライン用です。")
     args = parser.parse_args()
     
     size = args.top_n if args.top_n else args.sample_size
@@ -196,7 +196,8 @@ if __name__ == '__main__':
             sort_by=args.sort_by,
             top_n=args.top_n,
             sample_size=size,
-            free_tier_safe=args.free_tier_safe
+            free_tier_safe=args.free_tier_safe,
+            backend=args.backend
         )
     except (IOError, ValueError, RuntimeError) as e:
         print(f"\n[処理中断] {e}")
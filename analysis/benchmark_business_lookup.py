@@ -0,0 +1,100 @@
+import duckdb
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.business_lookup import BusinessLookup
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def legacy_lookup(con: duckdb.DuckDBPyConnection, business_id: int) -> dict:
+    """比較用: 従来の方式 (VIEWごとに DESCRIBE と SELECT を発行し、pandas経由で辞書化)"""
+    result = {"予算事業ID": business_id}
+    views = [row[0] for row in con.execute("SELECT view_name FROM table_index ORDER BY view_name").fetchall()]
+    for view_name in views:
+        if '予算事業ID' in [c[0] for c in con.execute(f'DESCRIBE "{view_name}"').fetchall()]:
+            df = con.execute(f'SELECT * FROM "{view_name}" WHERE 予算事業ID = {business_id}').fetchdf()
+            if not df.empty:
+                records = df.to_dict('records')
+                result[view_name] = records[0] if len(records) == 1 else records
+    return result
+
+def measure(label: str, func, business_ids: list) -> list:
+    """各IDについて func を呼び出し、所要時間(ミリ秒)のリストを返す"""
+    timings = []
+    for business_id in business_ids:
+        start = time.perf_counter()
+        func(business_id)
+        timings.append((time.perf_counter() - start) * 1000)
+    p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"  {label:<28} n={len(timings):>5}  平均={statistics.mean(timings):8.2f}ms  中央値={statistics.median(timings):8.2f}ms  p95={p95:8.2f}ms")
+    return timings
+
+def benchmark_business_lookup(sample_size: int = 200, include_legacy: bool = False, seed: int = 0):
+    """
+    BusinessLookup の1件検索の所要時間を計測する。
+    キャッシュなしの検索 (cold) と、キャッシュ済みの検索 (warm) を分けて報告する。
+    """
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。")
+        sys.exit(1)
+
+    con = duckdb.connect(database=str(db_file_path), read_only=True)
+    all_ids = [row[0] for row in con.execute(
+        'SELECT DISTINCT 予算事業ID FROM "基本情報_組織情報" WHERE 予算事業ID IS NOT NULL'
+    ).fetchall()]
+    random.Random(seed).shuffle(all_ids)
+    business_ids = all_ids[:sample_size]
+
+    print(f"--- 事業情報の1件検索ベンチマーク ({len(business_ids)}件, DB: '{db_file_path.name}') ---")
+
+    start = time.perf_counter()
+    lookup = BusinessLookup(db_file_path, cache_size=len(business_ids), con=con)
+    print(f"  初期化 (列カタログの読み込み)     {(time.perf_counter() - start) * 1000:8.2f}ms")
+    if lookup.use_lookup_documents:
+        print("  検索方式: 検索用テーブル (business_lookup_documents) の索引検索")
+    else:
+        print("  検索方式: VIEWごとの元テーブル検索 (business_lookup_documents が無いため。DBを再構築すると高速になります)")
+
+    measure("BusinessLookup (cold)", lookup.get, business_ids)
+    measure("BusinessLookup (warm/LRU)", lookup.get, business_ids)
+    print(f"  キャッシュ: ヒット {lookup.hits}件 / ミス {lookup.misses}件")
+
+    if include_legacy:
+        # 従来方式は遅いため、件数を絞って計測する
+        measure("従来方式 (VIEWごとに問い合わせ)", lambda i: legacy_lookup(con, i), business_ids[:min(20, len(business_ids))])
+
+    con.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="予算事業IDによる事業情報の1件検索の所要時間を計測します。")
+    parser.add_argument('-n', '--sample_size', type=int, default=200, help="計測に使う事業IDの件数 (デフォルト: 200)")
+    parser.add_argument('--legacy', action='store_true', help="比較のため、従来方式 (VIEWごとのDESCRIBE/SELECT) も計測します。")
+    parser.add_argument('--seed', type=int, default=0, help="事業IDを選ぶ乱数のシード (デフォルト: 0)")
+    args = parser.parse_args()
+
+    benchmark_business_lookup(args.sample_size, args.legacy, args.seed)
@@ -0,0 +1,106 @@
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.quantized_embeddings import QUANTIZED_DTYPES, QuantizedIndex, normalize_rows, save_quantized
+
+def load_baseline(cache_path: Path):
+    """比較の基準: Parquetのキャッシュを pandas で読み込み、float32 の行列にする (従来の読み込み方)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = pd.read_parquet(cache_path, columns=['doc_id', 'embedding'])
+    matrix = np.asarray(df['embedding'].tolist(), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df['doc_id'].tolist(), matrix, elapsed, peak
+
+def synthetic_embeddings(num_documents: int, dimension: int, seed: int):
+    """キャッシュが無い環境向けの合成データ (クラスタ構造を持つランダムなベクトル)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, num_documents // 50), dimension)).astype(np.float32)
+    matrix = centers[rng.integers(0, len(centers), num_documents)] + 0.5 * rng.normal(size=(num_documents, dimension)).astype(np.float32)
+    return [f"doc_{i}" for i in range(num_documents)], matrix
+
+def recall_at_k(baseline_scores: np.ndarray, scores: np.ndarray, k: int) -> float:
+    """全精度の上位k件のうち、量子化後の上位k件にも含まれる割合 (質問ごとの平均)"""
+    hits = 0
+    for expected_row, actual_row in zip(baseline_scores, scores):
+        expected = set(np.argpartition(-expected_row, k - 1)[:k].tolist())
+        actual = set(np.argpartition(-actual_row, k - 1)[:k].tolist())
+        hits += len(expected & actual)
+    return hits / (k * len(baseline_scores))
+
+def benchmark_quantized_embeddings(cache_path: Path, num_queries: int = 100, k: int = 10, synthetic: int = 0, seed: int = 0):
+    """
+    全精度 (float32) と量子化 (float16 / int8) のEmbeddingについて、
+    メモリ使用量・読み込み時間・検索時間・recall@k を比較する。
+    """
+    if synthetic:
+        doc_ids, matrix = synthetic_embeddings(synthetic, 768, seed)
+        print(f"--- 量子化Embeddingのベンチマーク (合成データ: {len(doc_ids):,}件 x {matrix.shape[1]}次元) ---")
+        load_info = ""
+    else:
+        if not cache_path.is_file():
+            print(f"[エラー] キャッシュファイル '{cache_path}' が見つかりません。`analysis/build_vector_store.py` を実行するか、--synthetic を指定してください。")
+            sys.exit(1)
+        doc_ids, matrix, elapsed, peak = load_baseline(cache_path)
+        print(f"--- 量子化Embeddingのベンチマーク ('{cache_path.name}': {len(doc_ids):,}件 x {matrix.shape[1]}次元) ---")
+        load_info = f"  読み込み={elapsed * 1000:9.1f}ms  (Parquet読み込み時のピーク {peak / 1024**2:,.1f}MB)"
+
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(doc_ids), size=min(num_queries, len(doc_ids)), replace=False)
+    # 質問は文書ベクトルに雑音を加えたもの (文書そのものだと自分自身が必ず1位になるため)
+    queries = matrix[query_rows] + 0.1 * rng.normal(size=(len(query_rows), matrix.shape[1])).astype(np.float32)
+    normalized = normalize_rows(matrix)
+    start = time.perf_counter()
+    baseline_scores = normalize_rows(queries) @ normalized.T
+    baseline_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"  {'float32 (基準)':<18} メモリ={matrix.nbytes / 1024**2:9.1f}MB  検索={baseline_ms:9.2f}ms/質問{load_info}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for dtype in QUANTIZED_DTYPES:
+            index_dir = Path(temp_dir) / dtype
+            save_quantized(matrix, doc_ids, index_dir, dtype)
+
+            start = time.perf_counter()
+            index = QuantizedIndex(index_dir)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            scores = index.scores(queries)
+            search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+            recall = recall_at_k(baseline_scores, scores, k)
+            print(f"  {dtype:<18} メモリ={index.nbytes / 1024**2:9.1f}MB  読み込み={load_ms:9.1f}ms  検索={search_ms:9.2f}ms/質問  recall@{k}={recall:.4f}")
+            del index, scores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Embeddingを量子化 (float16 / int8) した場合の、メモリ使用量・読み込み時間・recall@k を全精度と比較します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('-q', '--num_queries', type=int, default=100, help="recallの計測に使う質問の件数 (デフォルト: 100)")
+    parser.add_argument('-k', type=int, default=10, help="recall@k の k (デフォルト: 10)")
+    parser.add_argument('--synthetic', type=int, default=0, metavar='件数', help="キャッシュの代わりに、指定件数の合成データで計測します。")
+    parser.add_argument('--seed', type=int, default=0, help="質問を選ぶ乱数のシード (デフォルト: 0)")
+    args = parser.parse_args()
+
+    cache_path = PROJECT_ROOT / "cache" / "embeddings.parquet"
+    benchmark_quantized_embeddings(cache_path, args.num_queries, args.k, args.synthetic, args.seed)
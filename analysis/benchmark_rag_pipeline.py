@@ -0,0 +1,193 @@
+import duckdb
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import pandas as pd
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.llm_backends import FakeBackend, get_backend, BACKEND_NAMES
+from analysis.async_embedder import AsyncEmbedder, is_retryable
+from analysis.audit_text_consistency import audit_row
+
+EMBEDDING_BATCH_SIZE = 100
+
+# SQL生成の一時的なエラー (429 / 5xx) の再試行 (Embeddingと同じ指数バックオフ)
+GENERATION_MAX_RETRIES = 3
+GENERATION_BASE_DELAY = 0.1
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def load_sample_texts(db_file_path: Path, num_texts: int) -> list:
+    """DBから契約概要のテキストを取得する (DBが無ければ合成したテキストを使う)"""
+    if db_file_path.is_file():
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+        try:
+            texts = [row[0] for row in con.execute(
+                'SELECT 事業名 || \' \' || 契約概要 FROM "支出先_支出情報_明細" WHERE 契約概要 IS NOT NULL LIMIT ?', [num_texts]
+            ).fetchall()]
+        finally:
+            con.close()
+        if texts:
+            return texts
+    return [f"事業{i % 50}の業務委託。契約番号{i}に関する調査・設計" for i in range(num_texts)]
+
+def load_audit_samples(db_file_path: Path, num_samples: int) -> pd.DataFrame:
+    """監査対象の (事業名, 契約概要, 金額, 府省庁) を取得する (DBが無ければ合成したデータを使う)"""
+    if db_file_path.is_file():
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+        try:
+            sample_df = con.execute(
+                'SELECT 事業名, 契約概要, 金額, 府省庁 FROM "支出先_支出情報_明細" '
+                'WHERE 事業名 IS NOT NULL AND 契約概要 IS NOT NULL LIMIT ?', [num_samples]
+            ).fetchdf()
+        finally:
+            con.close()
+        if not sample_df.empty:
+            return sample_df
+    return pd.DataFrame({
+        '事業名': [f"事業{i % 50}" for i in range(num_samples)],
+        '契約概要': [f"契約番号{i}に関する調査・設計の業務委託" for i in range(num_samples)],
+        '金額': [1_000_000.0 * (i + 1) for i in range(num_samples)],
+        '府省庁': ["(合成データ)"] * num_samples,
+    })
+
+def summarize(label: str, timings: list):
+    """所要時間(ミリ秒)のリストの統計を表示する"""
+    p95 = sorted(timings)[max(0, int(len(timings) * 0.95) - 1)]
+    print(f"  {label:<24} n={len(timings):>5}  平均={statistics.mean(timings):8.2f}ms  中央値={statistics.median(timings):8.2f}ms  p95={p95:8.2f}ms")
+
+def benchmark_embedding(backend, texts: list, concurrency: int, requests_per_minute: float):
+    """文書のEmbeddingのスループットを計測する (build_vector_store.py と同じ並行実行)"""
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    embedder = AsyncEmbedder(backend.embed, concurrency=concurrency, requests_per_minute=requests_per_minute, base_delay=0.1)
+    start = time.perf_counter()
+    embedder.run(batches)
+    elapsed = time.perf_counter() - start
+    print(f"  Embedding                {len(texts):,}文書 / {len(batches):,}バッチ  {elapsed:8.2f}s  "
+          f"({len(texts) / elapsed:,.0f}文書/s, 同時実行数={concurrency}, 再試行={embedder.num_retries}回)")
+
+def generate_with_retry(backend, prompt: str) -> tuple:
+    """SQLを生成し、(生成されたテキスト, 再試行の回数) を返す。一時的なエラーは指数バックオフで再試行する"""
+    for attempt in range(GENERATION_MAX_RETRIES + 1):
+        try:
+            return backend.generate(prompt), attempt
+        except Exception as e:
+            if attempt == GENERATION_MAX_RETRIES or not is_retryable(e):
+                raise
+            time.sleep(GENERATION_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.0))
+
+def benchmark_generation(backend, db_file_path: Path, num_questions: int):
+    """SQL生成のプロンプト → 生成 → DuckDBでの実行 の所要時間を計測する (ask_with_rag.py の Step 3-4 相当)"""
+    prompt_template = (PROJECT_ROOT / "prompts" / "rag_sql_generation_prompt.txt").read_text(encoding='utf-8')
+    con = duckdb.connect(database=str(db_file_path), read_only=True) if db_file_path.is_file() else None
+    generation_timings, execution_timings = [], []
+    num_valid = num_retries = 0
+    failures = []
+    try:
+        for i in range(num_questions):
+            prompt = prompt_template.format(
+                schema_info="(省略)",
+                relevant_ids=[i + 1, i + 2, i + 3],
+                context_info="- (省略)",
+                question=f"ベンチマーク用の質問 {i}"
+            )
+            start = time.perf_counter()
+            try:
+                generated_text, retries = generate_with_retry(backend, prompt)
+            except Exception as e:
+                failures.append(e)
+                continue
+            num_retries += retries
+            generated_sql = generated_text.strip().replace('```sql', '').replace('```', '')
+            # 再試行の待ち時間を含む (実際の利用者が待つ時間)
+            generation_timings.append((time.perf_counter() - start) * 1000)
+            if con is None:
+                continue
+            start = time.perf_counter()
+            try:
+                con.execute(generated_sql).fetchall()
+                num_valid += 1
+            except duckdb.Error:
+                pass
+            execution_timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        if con is not None:
+            con.close()
+
+    if generation_timings:
+        summarize("SQL生成 (LLM)", generation_timings)
+    print(f"  生成できたSQL: {len(generation_timings)}/{num_questions}件  (再試行={num_retries}回, 失敗={len(failures)}件)")
+    if failures:
+        print(f" !! 警告: SQL生成に{len(failures)}件失敗しました (最後のエラー: {failures[-1]})", file=sys.stderr)
+    if execution_timings:
+        summarize("SQL実行 (DuckDB)", execution_timings)
+        print(f"  実行できたSQL: {num_valid}/{len(execution_timings)}件")
+
+def benchmark_audit(backend, db_file_path: Path, num_samples: int):
+    """事業名と契約概要の整合性監査 (audit_text_consistency.py の1件ごとの処理) の所要時間と成否を計測する"""
+    sample_df = load_audit_samples(db_file_path, num_samples)
+    timings, scores = [], []
+    num_failed = 0
+    for _, row in sample_df.iterrows():
+        start = time.perf_counter()
+        result = audit_row(backend, row)
+        timings.append((time.perf_counter() - start) * 1000)
+        # audit_row はLLMの呼び出しに失敗すると score=0 を返す
+        if result['score'] in (None, 0):
+            num_failed += 1
+        else:
+            scores.append(result['score'])
+
+    if timings:
+        summarize("監査 (LLM)", timings)
+    print(f"  監査できた件数: {len(scores)}/{len(sample_df)}件  (失敗={num_failed}件"
+          + (f", 平均スコア={statistics.mean(scores):.2f}" if scores else "") + ")")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="RAG・監査パイプライン (Embedding、SQL生成と実行、整合性監査) のスループットを計測します。\nデフォルトはAPIを使わない fake バックエンドのため、オフライン環境やCIでも実行できます。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default='fake', help="計測するバックエンド (デフォルト: fake)")
+    parser.add_argument('-n', '--num_texts', type=int, default=2000, help="Embeddingする文書の件数 (デフォルト: 2000)")
+    parser.add_argument('-q', '--num_questions', type=int, default=20, help="SQL生成を行う質問の件数 (デフォルト: 20)")
+    parser.add_argument('-a', '--num_audits', type=int, default=20, help="整合性監査を行う件数 (デフォルト: 20)")
+    parser.add_argument('--concurrency', type=int, default=4, help="Embeddingの同時実行数 (デフォルト: 4)")
+    parser.add_argument('--rpm', type=float, default=1500, help="1分あたりの最大リクエスト数 (デフォルト: 1500)")
+    parser.add_argument('--latency_ms', type=float, default=50.0, help="fake: 1回の呼び出しの模擬的な待ち時間 (デフォルト: 50ms)")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="fake: 429/503 エラーを返す確率 (デフォルト: 0)")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+
+    if args.backend == 'fake':
+        backend = FakeBackend(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    else:
+        backend = get_backend(args.backend)
+
+    texts = load_sample_texts(db_file_path, args.num_texts)
+    print(f"--- RAGパイプラインのベンチマーク (バックエンド: {backend.name}, DB: '{db_file_path.name}') ---")
+    benchmark_embedding(backend, texts, args.concurrency, args.rpm)
+    benchmark_generation(backend, db_file_path, args.num_questions)
+    benchmark_audit(backend, db_file_path, args.num_audits)
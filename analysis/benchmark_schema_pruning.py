@@ -0,0 +1,158 @@
+import duckdb
+import re
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.llm_backends import FakeBackend, get_backend, BACKEND_NAMES
+from analysis.schema_index import SchemaIndex, load_schema, DEFAULT_TOP_TABLES, DEFAULT_TOP_COLUMNS
+from analysis.ask_with_rag import build_schema_info
+from analysis.vector_store import search
+
+# 計測に使う質問 (-f でファイルを指定しない場合)
+SAMPLE_QUESTIONS = [
+    "道路の補修に関連する事業の支出先トップ5は？",
+    "一者応札の割合が高い府省庁はどこですか？",
+    "落札率が99%以上の契約を教えてください",
+    "執行率が50%未満の事業の一覧",
+    "当初予算が最も大きい事業は？",
+    "国土交通省の事業で、補正予算が計上されたもの",
+    "外部有識者による点検の対象になった事業",
+    "補助率が2分の1の補助事業",
+    "成果目標の達成率が低い事業",
+    "支出先の費目・使途で人件費が多い事業",
+    "法令に基づいて実施されている子育て支援の事業",
+    "国庫債務負担行為による契約額が大きい契約先",
+]
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def referenced_views(sql: str, view_names: list) -> set:
+    """SQLの中でダブルクォーテーションで囲んで参照されているVIEW名"""
+    quoted = set(re.findall(r'"([^"]+)"', sql))
+    return quoted & set(view_names)
+
+def run_mode(label: str, backend, con, questions: list, embeddings: list, contexts: list, schema_index, prompt_template: str,
+             view_names: list, top_tables: int, top_columns: int):
+    """1つの方式 (スキーマ全体 / 絞り込み) で全質問のプロンプトを作り、SQLを生成・検証する"""
+    prompt_sizes, build_timings, generation_timings = [], [], []
+    num_generated = num_valid = num_covered = 0
+    for question, query_embedding, (relevant_ids, context_info) in zip(questions, embeddings, contexts):
+        start = time.perf_counter()
+        schema_info = build_schema_info(schema_index, query_embedding, top_tables, top_columns)
+        prompt = prompt_template.format(schema_info=schema_info, relevant_ids=relevant_ids, context_info=context_info, question=question)
+        build_timings.append((time.perf_counter() - start) * 1000)
+        prompt_sizes.append(len(prompt))
+
+        start = time.perf_counter()
+        try:
+            generated_sql = backend.generate(prompt).strip().replace('```sql', '').replace('```', '')
+        except Exception:
+            continue
+        generation_timings.append((time.perf_counter() - start) * 1000)
+        num_generated += 1
+
+        # プロンプトに載せたVIEWだけでSQLが書けているか (絞り込みで必要なVIEWが落ちていないか)
+        if schema_index is None:
+            prompt_views = set(view_names)
+        else:
+            prompt_views = {view_names[table_no] for table_no, _ in schema_index.select(query_embedding, top_tables, top_columns)}
+        if referenced_views(generated_sql, view_names) <= prompt_views:
+            num_covered += 1
+        # DuckDBがSQLを解釈・計画できるか (実行はしない)
+        if con is not None:
+            try:
+                con.execute(f"EXPLAIN {generated_sql}")
+                num_valid += 1
+            except duckdb.Error:
+                pass
+
+    print(f"  [{label}]")
+    print(f"    プロンプト        平均={statistics.mean(prompt_sizes):10,.0f}文字  最大={max(prompt_sizes):10,.0f}文字")
+    print(f"    プロンプト構築    平均={statistics.mean(build_timings):10.2f}ms")
+    if generation_timings:
+        print(f"    SQL生成 (LLM)     平均={statistics.mean(generation_timings):10.2f}ms  中央値={statistics.median(generation_timings):10.2f}ms")
+    print(f"    生成できたSQL: {num_generated}/{len(questions)}件  "
+          f"プロンプト内のVIEWだけを参照: {num_covered}/{num_generated}件  "
+          + (f"EXPLAIN成功: {num_valid}/{num_generated}件" if con is not None else "(DBが無いためEXPLAINは省略)"))
+    return statistics.mean(prompt_sizes)
+
+def benchmark_schema_pruning(backend, db_file_path: Path, embedding_cache_path: Path, questions: list,
+                             top_tables: int = DEFAULT_TOP_TABLES, top_columns: int = DEFAULT_TOP_COLUMNS):
+    """
+    SQL生成のプロンプトに schema.yaml の全体を載せる場合と、質問に関連するVIEW・列だけに絞り込む場合とで、
+    プロンプトの大きさ・SQL生成の所要時間・生成されたSQLの妥当性 (EXPLAINの成否) を比較する。
+    """
+    schema_path = PROJECT_ROOT / "schema.yaml"
+    view_names = [table['view_name'] for table in load_schema(schema_path)]
+    prompt_template = (PROJECT_ROOT / "prompts" / "rag_sql_generation_prompt.txt").read_text(encoding='utf-8')
+
+    start = time.perf_counter()
+    schema_index = SchemaIndex(schema_path, backend, embedding_cache_path)
+    index_ms = (time.perf_counter() - start) * 1000
+    embeddings = [backend.embed_query(question) for question in questions]
+
+    con = duckdb.connect(database=str(db_file_path), read_only=True) if db_file_path.is_file() else None
+    try:
+        # ベクトル検索のコンテキストは両方式で共通 (ベクトルストアが無ければ空)
+        contexts = []
+        for query_embedding in embeddings:
+            try:
+                results_df = search(con, query_embedding, k=10)
+                relevant_ids = sorted({int(i) for ids in results_df['予算事業ID一覧'].dropna() for i in ids.split(',') if i})
+                contexts.append((relevant_ids, "\n".join(f"- {doc}" for doc in results_df['document_text'])))
+            except Exception:
+                contexts.append(([], "- (なし)"))
+
+        print(f"--- スキーマ絞り込みのベンチマーク (バックエンド: {backend.name}, 質問: {len(questions)}件, "
+              f"VIEW上位{top_tables}件 x 列上位{top_columns}件) ---")
+        print(f"  スキーマの索引: VIEW {len(schema_index.tables)}件・列 {len(schema_index.column_owners)}件 ({index_ms:,.0f}ms)")
+        full_size = run_mode("スキーマ全体", backend, con, questions, embeddings, contexts, None, prompt_template, view_names, top_tables, top_columns)
+        pruned_size = run_mode("絞り込み", backend, con, questions, embeddings, contexts, schema_index, prompt_template, view_names, top_tables, top_columns)
+        print(f"  -> プロンプトの大きさ: {pruned_size / full_size:.1%} (1/{full_size / pruned_size:.1f})")
+    finally:
+        if con is not None:
+            con.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="SQL生成のプロンプトに載せるスキーマを、質問に関連するVIEW・列に絞り込んだ場合の効果を計測します。\n"
+                    "デフォルトはAPIを使わない fake バックエンドです (SQL生成の所要時間の比較には --backend gemini を指定)。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default='fake', help="計測するバックエンド (デフォルト: fake)")
+    parser.add_argument('-f', '--questions_file', type=Path, help="質問を1行に1件ずつ書いたテキストファイル (デフォルト: 組み込みの質問)")
+    parser.add_argument('--top_tables', type=int, default=DEFAULT_TOP_TABLES, help=f"プロンプトに載せるVIEWの件数 (デフォルト: {DEFAULT_TOP_TABLES})")
+    parser.add_argument('--top_columns', type=int, default=DEFAULT_TOP_COLUMNS, help=f"VIEWごとに載せる列の件数 (デフォルト: {DEFAULT_TOP_COLUMNS})")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    embedding_cache_path = PROJECT_ROOT / settings.get('vector_store', {}).get('embedding_cache_file', 'cache/embedding_cache.duckdb')
+    if args.questions_file:
+        questions = [line.strip() for line in args.questions_file.read_text(encoding='utf-8').splitlines() if line.strip()]
+    else:
+        questions = SAMPLE_QUESTIONS
+
+    backend = FakeBackend() if args.backend == 'fake' else get_backend(args.backend)
+    benchmark_schema_pruning(backend, db_file_path, embedding_cache_path, questions, args.top_tables, args.top_columns)
@@ -0,0 +1,123 @@
+import duckdb
+import pandas as pd
+import numpy as np
+import argparse
+import sys
+import json
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.graph_index import connected_components
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def build_business_clusters(con: duckdb.DuckDBPyConnection):
+    """
+    関連事業の登録 (基本情報_関連事業) を無向の辺とみなし、Union-Findで連結成分 (クラスタ) を求めて
+    business_cluster テーブルを作成する。関連事業の登録が無い事業は、1事業だけのクラスタになる。
+    クラスタIDは、クラスタ内で最小の予算事業ID (DBを作り直しても変わらない)。
+    """
+    business_ids = con.execute("""
+        SELECT 予算事業ID FROM "基本情報_組織情報" WHERE 予算事業ID IS NOT NULL
+        UNION
+        SELECT CAST(関連事業の事業ID AS BIGINT) FROM "基本情報_関連事業" WHERE 関連事業の事業ID IS NOT NULL
+        ORDER BY 1
+    """).fetchnumpy()['予算事業ID']
+    edges = con.execute("""
+        SELECT DISTINCT 予算事業ID AS 事業ID, CAST(関連事業の事業ID AS BIGINT) AS 関連事業ID
+        FROM "基本情報_関連事業"
+        WHERE 予算事業ID IS NOT NULL AND 関連事業の事業ID IS NOT NULL
+    """).fetchnumpy()
+
+    # 予算事業IDをノード番号 (0..n-1) に変換して連結成分を求める
+    business_ids = np.asarray(business_ids, dtype=np.int64)
+    sources = np.searchsorted(business_ids, np.asarray(edges['事業ID'], dtype=np.int64))
+    targets = np.searchsorted(business_ids, np.asarray(edges['関連事業ID'], dtype=np.int64))
+    labels = connected_components(len(business_ids), sources, targets)
+
+    clusters_df = pd.DataFrame({'予算事業ID': business_ids, 'label': labels})
+    clusters_df['クラスタID'] = clusters_df.groupby('label')['予算事業ID'].transform('min')
+    clusters_df = clusters_df.drop(columns='label')
+
+    con.register('business_cluster_df', clusters_df)
+    try:
+        con.execute("""
+            CREATE OR REPLACE TABLE business_cluster AS
+            WITH
+            Budget AS (
+                -- analyze_related_projects.py の「予算額最大の事業」と同じく、全年度の歳出予算現額を合計する
+                SELECT 予算事業ID, SUM("計（歳出予算現額合計）") AS 予算額
+                FROM "予算・執行_サマリ"
+                GROUP BY 予算事業ID
+            ),
+            Organization AS (
+                SELECT 予算事業ID, FIRST(事業名) AS 事業名, FIRST(府省庁) AS 府省庁
+                FROM "基本情報_組織情報"
+                GROUP BY 予算事業ID
+            )
+            SELECT
+                c.予算事業ID,
+                o.事業名,
+                o.府省庁,
+                c.クラスタID,
+                COUNT(*) OVER (PARTITION BY c.クラスタID) AS クラスタの事業数,
+                b.予算額 AS 事業の予算額,
+                SUM(b.予算額) OVER (PARTITION BY c.クラスタID) AS クラスタの予算額合計,
+                COUNT(DISTINCT o.府省庁) OVER (PARTITION BY c.クラスタID) AS クラスタの府省庁数
+            FROM business_cluster_df AS c
+            LEFT JOIN Budget AS b ON c.予算事業ID = b.予算事業ID
+            LEFT JOIN Organization AS o ON c.予算事業ID = o.予算事業ID
+            ORDER BY クラスタの予算額合計 DESC NULLS LAST, c.クラスタID, c.予算事業ID
+        """)
+    finally:
+        con.unregister('business_cluster_df')
+
+    num_clusters, num_linked = con.execute(
+        "SELECT COUNT(DISTINCT クラスタID), COUNT(DISTINCT クラスタID) FILTER (WHERE クラスタの事業数 > 1) FROM business_cluster"
+    ).fetchone()
+    print(f" -> 'business_cluster' ({len(clusters_df):,}事業, {num_clusters:,}クラスタ, うち複数事業のクラスタ {num_linked:,}件) を作成しました。")
+
+def get_cluster(con: duckdb.DuckDBPyConnection, business_id: int) -> pd.DataFrame:
+    """指定された事業と同じクラスタに属する全事業を返す"""
+    return con.execute("""
+        SELECT * FROM business_cluster
+        WHERE クラスタID = (SELECT クラスタID FROM business_cluster WHERE 予算事業ID = ?)
+        ORDER BY 事業の予算額 DESC NULLS LAST
+    """, [business_id]).fetchdf()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="関連事業の登録から、事業のクラスタ (連結成分) 表 business_cluster を作成します。\n通常は import_zips_to_duckdb.py の実行時に自動で作成されます。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    # クラスタ表を書き込むため、書き込み可能な接続で開く
+    print(f"--- データベース '{db_file_path}' に事業のクラスタ表を作成します ---")
+    con = duckdb.connect(database=str(db_file_path), read_only=False)
+    build_business_clusters(con)
+    con.close()
+    print("[成功] 処理が完了しました。")
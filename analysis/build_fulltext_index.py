@@ -0,0 +1,222 @@
+import duckdb
+import pandas as pd
+import argparse
+import sys
+import json
+import time
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# 全角英数記号・全角空白を半角に揃えるための対応表 (検索語と本文の両方に同じ正規化をかける)
+FULLWIDTH_CHARS = ''.join(chr(c) for c in range(0xFF01, 0xFF5F)) + '　'
+HALFWIDTH_CHARS = ''.join(chr(c) for c in range(0x21, 0x7F)) + ' '
+
+# BM25 のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def sql_literal(text: str) -> str:
+    """文字列をSQLの文字列リテラルにする"""
+    return "'" + text.replace("'", "''") + "'"
+
+def build_fulltext_index(con: duckdb.DuckDBPyConnection):
+    """
+    自由記述の列 (事業名・事業の目的・事業の概要・契約概要) の全文検索用索引を作成する。
+
+    日本語は単語の区切りが無いため、文字bigram (2文字ずつ) を語とする転置索引を自前のテーブルで持つ。
+      - fts_documents : 検索対象の文書 (事業ごと、または契約ごと)
+      - fts_postings  : 語 → 文書 の出現回数 (語の順に並べて格納し、語による絞り込みを速くする)
+      - fts_terms     : 語ごとの文書頻度と IDF
+      - fts_stats     : 文書数と平均文書長
+    検索はSQLのテーブルマクロ fts_search(検索語, k := 20, min_match := 0) で行い、BM25のスコア順に返す。
+    """
+    con.execute(f"""
+        CREATE OR REPLACE MACRO fts_normalize(s) AS
+            lower(translate(CAST(s AS VARCHAR), {sql_literal(FULLWIDTH_CHARS)}, {sql_literal(HALFWIDTH_CHARS)}))
+    """)
+
+    con.execute("""
+        CREATE OR REPLACE TABLE fts_documents AS
+        SELECT
+            ROW_NUMBER() OVER (ORDER BY 種別, 予算事業ID, 見出し, 本文) AS doc_id,
+            *
+        FROM (
+            SELECT
+                '事業' AS 種別,
+                予算事業ID,
+                事業名 AS 見出し,
+                concat_ws(' ', 事業名, 事業の目的, 事業の概要) AS 本文
+            FROM "基本情報_事業概要等"
+            UNION
+            SELECT
+                '契約' AS 種別,
+                予算事業ID,
+                支出先名 AS 見出し,
+                契約概要 AS 本文
+            FROM "支出先_支出情報_明細"
+            WHERE 契約概要 IS NOT NULL
+        )
+        WHERE length(本文) >= 2
+    """)
+
+    con.execute("""
+        CREATE OR REPLACE TABLE fts_postings AS
+        SELECT term, doc_id, COUNT(*)::INTEGER AS tf
+        FROM (
+            SELECT doc_id, substring(正規化本文, i, 2) AS term
+            FROM (
+                SELECT doc_id, fts_normalize(本文) AS 正規化本文, UNNEST(range(1, length(本文))) AS i
+                FROM fts_documents
+            )
+        )
+        WHERE NOT regexp_matches(term, '\\s')
+        GROUP BY term, doc_id
+        ORDER BY term, doc_id
+    """)
+
+    con.execute("""
+        CREATE OR REPLACE TABLE fts_stats AS
+        SELECT COUNT(*) AS 文書数, AVG(length(本文) - 1) AS 平均文書長
+        FROM fts_documents
+    """)
+
+    con.execute("""
+        CREATE OR REPLACE TABLE fts_terms AS
+        SELECT
+            p.term,
+            COUNT(*) AS df,
+            ln((s.文書数 - COUNT(*) + 0.5) / (COUNT(*) + 0.5) + 1) AS idf
+        FROM fts_postings AS p, fts_stats AS s
+        GROUP BY p.term, s.文書数
+        ORDER BY p.term
+    """)
+
+    # 一致率 (min_match) は空白区切りのキーワードごとに「文書に含まれるbigramの割合」を求め、その最大値で判定する。
+    # min_match := 1 とすると、いずれかのキーワードの全bigramを含む文書だけを返す
+    # (「インフラ」が「イン」だけを共有する「オンライン申請」に一致するような、部分的な一致を除く)。
+    con.execute(f"""
+        CREATE OR REPLACE MACRO fts_search(query_text, k := 20, min_match := 0) AS TABLE
+        WITH
+        Query AS (
+            SELECT string_split_regex(trim(fts_normalize(query_text)), '\\s+') AS keywords
+        ),
+        KeywordTerms AS (
+            SELECT DISTINCT keyword_no, substring(keywords[keyword_no], i, 2) AS term
+            FROM Query, range(1, len(keywords) + 1) AS kw(keyword_no), range(1, length(keywords[keyword_no])) AS r(i)
+        ),
+        KeywordSizes AS (
+            SELECT keyword_no, COUNT(*) AS 語数 FROM KeywordTerms GROUP BY keyword_no
+        ),
+        QueryTerms AS (
+            SELECT DISTINCT term FROM KeywordTerms
+        ),
+        Matches AS MATERIALIZED (
+            SELECT p.doc_id, p.term, p.tf
+            FROM QueryTerms AS q
+            JOIN fts_postings AS p ON p.term = q.term
+        ),
+        Scored AS (
+            SELECT
+                m.doc_id,
+                SUM(
+                    t.idf * m.tf * ({BM25_K1} + 1)
+                    / (m.tf + {BM25_K1} * (1 - {BM25_B} + {BM25_B} * (length(d.本文) - 1) / s.平均文書長))
+                ) AS score,
+                COUNT(*) AS 一致した語数
+            FROM Matches AS m
+            JOIN fts_terms AS t ON t.term = m.term
+            JOIN fts_documents AS d ON d.doc_id = m.doc_id
+            CROSS JOIN fts_stats AS s
+            GROUP BY m.doc_id
+        ),
+        Coverage AS (
+            SELECT doc_id, MAX(一致した語数 / 語数) AS キーワード一致率
+            FROM (
+                SELECT m.doc_id, kt.keyword_no, COUNT(*) AS 一致した語数
+                FROM Matches AS m
+                JOIN KeywordTerms AS kt ON kt.term = m.term
+                GROUP BY m.doc_id, kt.keyword_no
+            )
+            JOIN KeywordSizes USING (keyword_no)
+            GROUP BY doc_id
+        )
+        SELECT
+            d.doc_id,
+            d.種別,
+            d.予算事業ID,
+            d.見出し,
+            d.本文,
+            sc.score,
+            sc.一致した語数 / (SELECT COUNT(*) FROM QueryTerms) AS 一致率,
+            cv.キーワード一致率
+        FROM Scored AS sc
+        JOIN Coverage AS cv ON cv.doc_id = sc.doc_id
+        JOIN fts_documents AS d ON d.doc_id = sc.doc_id
+        WHERE cv.キーワード一致率 >= min_match
+        ORDER BY sc.score DESC, d.doc_id
+        LIMIT k
+    """)
+
+    num_documents, num_terms, num_postings = con.execute("""
+        SELECT (SELECT COUNT(*) FROM fts_documents), (SELECT COUNT(*) FROM fts_terms), (SELECT COUNT(*) FROM fts_postings)
+    """).fetchone()
+    print(f" -> 全文検索索引を作成しました ({num_documents:,}文書, {num_terms:,}語, {num_postings:,}件の出現)。")
+
+def search(con: duckdb.DuckDBPyConnection, query_text: str, k: int = 20, min_match: float = 0) -> pd.DataFrame:
+    """
+    全文検索を行い、BM25のスコア順に上位 k 件を返す (検索語は2文字以上)。
+    min_match=1 で、いずれかのキーワードの全bigramを含む文書だけに絞り込む。
+    """
+    return con.execute("SELECT * FROM fts_search(?, k := ?, min_match := ?)", [query_text, k, min_match]).fetchdf()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="事業名・事業の目的・事業の概要・契約概要の全文検索用索引 (文字bigramの転置索引) を作成します。\n通常は import_zips_to_duckdb.py の実行時に自動で作成されます。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--search', type=str, metavar='検索語', help="作成済みの索引で検索し、結果を表示します (再作成は行いません)。")
+    parser.add_argument('-k', type=int, default=20, help="検索結果の件数 (デフォルト: 20)")
+    parser.add_argument('--min-match', type=float, default=0, help="キーワード一致率の下限。1 でいずれかのキーワードを完全に含む文書のみ (デフォルト: 0)")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    if args.search:
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+        start = time.perf_counter()
+        df = search(con, args.search, args.k, args.min_match)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        con.close()
+        pd.set_option('display.max_columns', None)
+        pd.set_option('display.width', 150)
+        pd.set_option('display.max_colwidth', 60)
+        print(df)
+        print(f"\n{len(df)}件 ({elapsed_ms:.1f}ms)")
+    else:
+        # 索引を書き込むため、書き込み可能な接続で開く
+        print(f"--- データベース '{db_file_path}' に全文検索用の索引を作成します ---")
+        con = duckdb.connect(database=str(db_file_path), read_only=False)
+        build_fulltext_index(con)
+        con.close()
+        print("[成功] 処理が完了しました。")
@@ -0,0 +1,250 @@
+import duckdb
+import pandas as pd
+import numpy as np
+import argparse
+import sys
+import json
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.graph_index import build_csr, out_degree, in_degree, enumerate_paths
+
+# 担当組織 (資金の出発点) を表すブロック名
+ORGANIZATION_BLOCK = '担当組織'
+
+# 経路を辿る最大の深さ (これを超える経路は打ち切りとして記録する)
+MAX_DEPTH = 20
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def load_flow_edges(con: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    """支出ブロックのつながりを、(予算事業ID, 支出元ブロック, 支出先ブロック) の辺の一覧として読み込む"""
+    return con.execute(f"""
+        SELECT DISTINCT
+            予算事業ID,
+            CASE
+                WHEN COALESCE(担当組織からの支出, FALSE) THEN '{ORGANIZATION_BLOCK}'
+                ELSE CAST(支出元の支出先ブロック AS VARCHAR)
+            END AS 支出元,
+            CAST(支出先の支出先ブロック AS VARCHAR) AS 支出先
+        FROM "支出先_支出ブロックのつながり"
+        WHERE 予算事業ID IS NOT NULL
+          AND 支出先の支出先ブロック IS NOT NULL
+          AND (COALESCE(担当組織からの支出, FALSE) OR 支出元の支出先ブロック IS NOT NULL)
+    """).fetchdf()
+
+def build_flow_index(edges: pd.DataFrame):
+    """
+    辺の一覧からノード表とCSR配列を作成する。
+    ノードは (予算事業ID, ブロック) の組で、事業ID・ブロック順に連番を振る (同じ事業のノードが連続する)。
+    """
+    endpoints = pd.concat([
+        edges[['予算事業ID', '支出元']].set_axis(['予算事業ID', 'ブロック'], axis=1),
+        edges[['予算事業ID', '支出先']].set_axis(['予算事業ID', 'ブロック'], axis=1),
+    ])
+    nodes = endpoints.drop_duplicates().sort_values(['予算事業ID', 'ブロック']).reset_index(drop=True)
+    nodes['node_id'] = np.arange(len(nodes), dtype=np.int64)
+
+    src = edges.merge(nodes, how='left', left_on=['予算事業ID', '支出元'], right_on=['予算事業ID', 'ブロック'])['node_id'].to_numpy()
+    dst = edges.merge(nodes, how='left', left_on=['予算事業ID', '支出先'], right_on=['予算事業ID', 'ブロック'])['node_id'].to_numpy()
+    indptr, indices = build_csr(src, dst, len(nodes))
+    return nodes, indptr, indices
+
+def compute_flow_paths(nodes: pd.DataFrame, indptr: np.ndarray, indices: np.ndarray, max_depth: int = MAX_DEPTH):
+    """
+    全事業の資金の流れの経路を一括で列挙する。
+    起点は入次数0のノード (通常は担当組織) とし、末端ブロックに至るまでの経路を求める。
+    """
+    roots = np.nonzero(in_degree(indices, len(nodes)) == 0)[0]
+    paths = enumerate_paths(indptr, indices, roots, max_depth)
+
+    blocks = nodes['ブロック'].to_numpy()
+    business_ids = nodes['予算事業ID'].to_numpy()
+    root_nodes = roots[paths['root']]
+
+    paths_df = pd.DataFrame({
+        '予算事業ID': business_ids[root_nodes],
+        '起点ブロック': blocks[root_nodes],
+        '末端ブロック': [blocks[p[-1]] for p in paths['nodes']],
+        '経路': [blocks[p].tolist() for p in paths['nodes']],
+        '深さ': paths['depth'],
+        '打ち切り': paths['truncated'],
+    })
+    paths_df = paths_df.sort_values(['予算事業ID', '深さ'], kind='stable').reset_index(drop=True)
+    paths_df.insert(1, '経路番号', paths_df.groupby('予算事業ID').cumcount() + 1)
+
+    # 事業ごとのグラフの形 (ブロック数・接続数・最大ファンアウト・循環の有無)
+    degree = out_degree(indptr)
+    node_stats = pd.DataFrame({
+        '予算事業ID': business_ids,
+        '出次数': degree,
+        '組織の出次数': np.where(blocks == ORGANIZATION_BLOCK, degree, 0),
+        'ブロック': (blocks != ORGANIZATION_BLOCK).astype(np.int64),
+    })
+    shape_df = node_stats.groupby('予算事業ID').agg(
+        ブロック数=('ブロック', 'sum'),
+        接続数=('出次数', 'sum'),
+        最大ファンアウト=('出次数', 'max'),
+        組織からの直接支出ブロック数=('組織の出次数', 'sum'),
+    ).reset_index()
+    cyclic_ids = set(business_ids[roots[paths['root_has_cycle']]].tolist())
+    shape_df['循環あり'] = shape_df['予算事業ID'].isin(cyclic_ids)
+    return paths_df, shape_df
+
+def build_fund_flow_graph(con: duckdb.DuckDBPyConnection, max_depth: int = MAX_DEPTH):
+    """
+    資金の流れの経路表 (fund_flow_paths) と事業ごとの要約表 (fund_flow_summary) を作成する。
+    末端ブロックの金額は tbl_5_1_summary (ブロックの合計支出額) と tbl_5_1_details (明細の合計) から結合する。
+    """
+    edges = load_flow_edges(con)
+    if edges.empty:
+        print(" -> 支出ブロックのつながりのデータが無いため、スキップしました。")
+        return
+
+    nodes, indptr, indices = build_flow_index(edges)
+    paths_df, shape_df = compute_flow_paths(nodes, indptr, indices, max_depth)
+
+    con.register('flow_paths_df', paths_df)
+    con.register('flow_shape_df', shape_df)
+    try:
+        con.execute("""
+            CREATE OR REPLACE TABLE fund_flow_paths AS
+            WITH
+            BlockTotal AS (
+                SELECT
+                    予算事業ID,
+                    CAST(支出先ブロック番号 AS VARCHAR) AS ブロック,
+                    FIRST(支出先ブロック名) AS ブロック名,
+                    MAX(ブロックの合計支出額) AS ブロックの合計支出額
+                FROM tbl_5_1_summary
+                GROUP BY 予算事業ID, CAST(支出先ブロック番号 AS VARCHAR)
+            ),
+            BlockDetails AS (
+                SELECT
+                    予算事業ID,
+                    CAST(支出先ブロック番号 AS VARCHAR) AS ブロック,
+                    COUNT(*) AS 明細件数,
+                    SUM("金額") AS 明細支出額
+                FROM tbl_5_1_details
+                GROUP BY 予算事業ID, CAST(支出先ブロック番号 AS VARCHAR)
+            )
+            SELECT
+                p.予算事業ID,
+                p.経路番号,
+                p.起点ブロック,
+                p.末端ブロック,
+                t.ブロック名 AS 末端ブロック名,
+                p.経路,
+                p.深さ,
+                p.打ち切り,
+                t.ブロックの合計支出額 AS 末端ブロックの合計支出額,
+                d.明細件数 AS 末端ブロックの明細件数,
+                d.明細支出額 AS 末端ブロックの明細支出額
+            FROM flow_paths_df AS p
+            LEFT JOIN BlockTotal AS t ON p.予算事業ID = t.予算事業ID AND p.末端ブロック = t.ブロック
+            LEFT JOIN BlockDetails AS d ON p.予算事業ID = d.予算事業ID AND p.末端ブロック = d.ブロック
+            ORDER BY p.予算事業ID, p.経路番号
+        """)
+        con.execute("""
+            CREATE OR REPLACE TABLE fund_flow_summary AS
+            WITH PathStats AS (
+                SELECT
+                    予算事業ID,
+                    COUNT(*) AS 経路数,
+                    MAX(深さ) AS 最大深さ,
+                    COUNT(*) FILTER (WHERE 打ち切り) AS 打ち切り経路数
+                FROM fund_flow_paths
+                GROUP BY 予算事業ID
+            ),
+            TerminalBlocks AS (
+                -- 複数の経路が同じ末端ブロックに至る場合があるため、ブロック単位で重複を除いて合計する
+                SELECT
+                    予算事業ID,
+                    COUNT(*) AS 末端ブロック数,
+                    SUM(末端ブロックの合計支出額) AS 末端ブロックの支出額合計,
+                    SUM(末端ブロックの明細支出額) AS 末端ブロックの明細支出額合計
+                FROM (
+                    SELECT DISTINCT 予算事業ID, 末端ブロック, 末端ブロックの合計支出額, 末端ブロックの明細支出額
+                    FROM fund_flow_paths
+                )
+                GROUP BY 予算事業ID
+            )
+            SELECT
+                s.予算事業ID,
+                s.ブロック数,
+                s.接続数,
+                s.組織からの直接支出ブロック数,
+                s.最大ファンアウト,
+                p.経路数,
+                p.最大深さ,
+                p.打ち切り経路数,
+                s.循環あり,
+                t.末端ブロック数,
+                t.末端ブロックの支出額合計,
+                t.末端ブロックの明細支出額合計
+            FROM flow_shape_df AS s
+            LEFT JOIN PathStats AS p ON s.予算事業ID = p.予算事業ID
+            LEFT JOIN TerminalBlocks AS t ON s.予算事業ID = t.予算事業ID
+            ORDER BY s.予算事業ID
+        """)
+    finally:
+        con.unregister('flow_paths_df')
+        con.unregister('flow_shape_df')
+
+    print(f" -> 'fund_flow_paths' ({len(paths_df):,}経路) と 'fund_flow_summary' ({len(shape_df):,}事業) を作成しました。")
+
+def trace_fund_flow(con: duckdb.DuckDBPyConnection, business_id: int) -> pd.DataFrame:
+    """指定された事業の資金の流れの経路 (最終的な支出先ブロックまで) を返す"""
+    return con.execute(
+        "SELECT * FROM fund_flow_paths WHERE 予算事業ID = ? ORDER BY 経路番号", [business_id]
+    ).fetchdf()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="支出ブロックのつながりから、全事業の資金の流れの経路表を作成します。\n通常は import_zips_to_duckdb.py の実行時に自動で作成されます。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--trace', type=int, metavar='ID', help="作成済みの経路表から、指定した予算事業IDの経路を表示します (再作成は行いません)。")
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, help=f"経路を辿る最大の深さ (デフォルト: {MAX_DEPTH})")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    if args.trace is not None:
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+        df = trace_fund_flow(con, args.trace)
+        con.close()
+        if df.empty:
+            print(f"事業ID {args.trace} の経路は見つかりませんでした。")
+        else:
+            pd.set_option('display.max_columns', None)
+            pd.set_option('display.width', 150)
+            print(df)
+    else:
+        # 経路表を書き込むため、書き込み可能な接続で開く
+        print(f"--- データベース '{db_file_path}' に資金の流れの経路表を作成します ---")
+        con = duckdb.connect(database=str(db_file_path), read_only=False)
+        build_fund_flow_graph(con, args.max_depth)
+        con.close()
+        print("[成功] 処理が完了しました。")
@@ -0,0 +1,277 @@
+import duckdb
+import pandas as pd
+import numpy as np
+import argparse
+import sys
+import json
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.graph_index import build_csr, in_degree, enumerate_paths
+
+# チェーンを辿る最大の深さ (これを超えるチェーンは打ち切りとして記録する)
+MAX_DEPTH = 20
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def build_outcome_nodes(con: duckdb.DuckDBPyConnection):
+    """
+    アクティビティ・アウトプット・アウトカムを1行1ノードとした outcome_nodes テーブルを作成する。
+    目標・実績の年度列 ('2007'〜) を縦持ちに変換し、ノードごとの目標値・実績値の件数と最新値を集計する。
+    つながりにのみ現れるノードも含める。
+    """
+    con.execute("""
+        CREATE OR REPLACE TABLE outcome_nodes AS
+        WITH
+        YearValues AS (
+            SELECT
+                予算事業ID, 種別, 番号, 区分,
+                TRY_CAST(年度 AS INTEGER) AS 年度,
+                TRY_CAST(値 AS DOUBLE) AS 値
+            FROM (
+                UNPIVOT (
+                    SELECT
+                        予算事業ID,
+                        "種別（アクティビティ・アウトプット・アウトカム）" AS 種別,
+                        "アクティビティ・アウトプット・アウトカムの番号" AS 番号,
+                        "目標年度／目標値／実績値／達成率" AS 区分,
+                        COLUMNS('^[0-9]{4}$')
+                    FROM "効果発現経路_目標・実績"
+                )
+                ON COLUMNS('^[0-9]{4}$')
+                INTO NAME 年度 VALUE 値
+            )
+        ),
+        NodeValues AS (
+            SELECT
+                予算事業ID, 種別, 番号,
+                COUNT(値) FILTER (WHERE 区分 = '目標値') AS 目標値の件数,
+                COUNT(値) FILTER (WHERE 区分 = '実績値') AS 実績値の件数,
+                MAX(年度) FILTER (WHERE 区分 = '実績値' AND 値 IS NOT NULL) AS 最新実績年度,
+                arg_max(値, 年度) FILTER (WHERE 区分 = '実績値' AND 値 IS NOT NULL) AS 最新実績値,
+                MAX(年度) FILTER (WHERE 区分 = '目標値' AND 値 IS NOT NULL) AS 最終目標年度,
+                arg_max(値, 年度) FILTER (WHERE 区分 = '目標値' AND 値 IS NOT NULL) AS 最終目標値
+            FROM YearValues
+            GROUP BY 予算事業ID, 種別, 番号
+        ),
+        NodeInfo AS (
+            SELECT
+                予算事業ID,
+                "種別（アクティビティ・アウトプット・アウトカム）" AS 種別,
+                "アクティビティ・アウトプット・アウトカムの番号" AS 番号,
+                FIRST("アクティビティ／活動目標／成果目標") AS 内容,
+                FIRST("活動指標／成果指標") AS 指標,
+                FIRST(単位) AS 単位,
+                FIRST(定性的なアウトカムに関する成果実績) AS 定性的な成果実績
+            FROM "効果発現経路_目標・実績"
+            GROUP BY ALL
+        ),
+        LinkedNodes AS (
+            SELECT 予算事業ID, "派生元ー種別（アクティビティ・アウトプット・アウトカム）" AS 種別, "派生元ーアクティビティ・アウトプット・アウトカムの番号" AS 番号
+            FROM "効果発現経路_目標のつながり"
+            UNION
+            SELECT 予算事業ID, "派生先ー種別（アクティビティ・アウトプット・アウトカム）", "派生先ーアクティビティ・アウトプット・アウトカムの番号"
+            FROM "効果発現経路_目標のつながり"
+        ),
+        AllNodes AS (
+            SELECT 予算事業ID, 種別, 番号 FROM NodeInfo
+            UNION
+            SELECT 予算事業ID, 種別, 番号 FROM LinkedNodes
+        )
+        SELECT
+            n.予算事業ID,
+            n.種別,
+            n.番号,
+            i.内容,
+            i.指標,
+            i.単位,
+            i.定性的な成果実績,
+            COALESCE(v.目標値の件数, 0) AS 目標値の件数,
+            COALESCE(v.実績値の件数, 0) AS 実績値の件数,
+            v.最新実績年度,
+            v.最新実績値,
+            v.最終目標年度,
+            v.最終目標値
+        FROM AllNodes AS n
+        LEFT JOIN NodeInfo AS i USING (予算事業ID, 種別, 番号)
+        LEFT JOIN NodeValues AS v USING (予算事業ID, 種別, 番号)
+        WHERE n.予算事業ID IS NOT NULL AND n.番号 IS NOT NULL
+        ORDER BY n.予算事業ID, n.種別, n.番号
+    """)
+
+def load_outcome_edges(con: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    """目標のつながりを、outcome_nodes の行番号 (ノードID) どうしの辺として読み込む"""
+    return con.execute("""
+        WITH Nodes AS (
+            SELECT 予算事業ID, 種別, 番号, ROW_NUMBER() OVER (ORDER BY 予算事業ID, 種別, 番号) - 1 AS node_id
+            FROM outcome_nodes
+        )
+        SELECT DISTINCT src.node_id AS 派生元, dst.node_id AS 派生先
+        FROM "効果発現経路_目標のつながり" AS l
+        JOIN Nodes AS src
+          ON l.予算事業ID = src.予算事業ID
+         AND l."派生元ー種別（アクティビティ・アウトプット・アウトカム）" IS NOT DISTINCT FROM src.種別
+         AND l."派生元ーアクティビティ・アウトプット・アウトカムの番号" = src.番号
+        JOIN Nodes AS dst
+          ON l.予算事業ID = dst.予算事業ID
+         AND l."派生先ー種別（アクティビティ・アウトプット・アウトカム）" IS NOT DISTINCT FROM dst.種別
+         AND l."派生先ーアクティビティ・アウトプット・アウトカムの番号" = dst.番号
+    """).fetchdf()
+
+def build_outcome_chains(con: duckdb.DuckDBPyConnection, max_depth: int = MAX_DEPTH):
+    """
+    効果発現経路の全チェーン (起点のアクティビティ → 最終アウトカム) を一括で列挙し、
+    outcome_nodes (ノードごとの目標・実績) と outcome_chains (チェーンごとの長さ・実績の有無) を作成する。
+    """
+    build_outcome_nodes(con)
+    nodes = con.execute(
+        "SELECT 予算事業ID, 種別, 番号, 実績値の件数, 目標値の件数 FROM outcome_nodes ORDER BY 予算事業ID, 種別, 番号"
+    ).fetchdf()
+    edges = load_outcome_edges(con)
+    if edges.empty:
+        print(" -> 目標のつながりのデータが無いため、チェーンの作成をスキップしました。")
+        return
+
+    indptr, indices = build_csr(edges['派生元'].to_numpy(), edges['派生先'].to_numpy(), len(nodes))
+    # 他のノードから派生していないノード (通常はアクティビティ) を起点とする
+    degree_in = in_degree(indices, len(nodes))
+    degree_out = np.diff(indptr)
+    roots = np.nonzero((degree_in == 0) & (degree_out > 0))[0]
+    paths = enumerate_paths(indptr, indices, roots, max_depth)
+
+    # チェーン上の各ノードの実績・目標の有無を、チェーン単位にまとめて数える
+    lengths = np.array([len(p) for p in paths['nodes']], dtype=np.int64)
+    flat_nodes = np.concatenate([np.asarray(p, dtype=np.int64) for p in paths['nodes']]) if paths['nodes'] else np.array([], dtype=np.int64)
+    chain_of_node = np.repeat(np.arange(len(lengths)), lengths)
+    has_actual = nodes['実績値の件数'].to_numpy() > 0
+    has_target = nodes['目標値の件数'].to_numpy() > 0
+    measured_nodes = np.bincount(chain_of_node, weights=has_actual[flat_nodes], minlength=len(lengths)).astype(np.int64)
+    targeted_nodes = np.bincount(chain_of_node, weights=has_target[flat_nodes], minlength=len(lengths)).astype(np.int64)
+
+    kinds = nodes['種別'].to_numpy()
+    numbers = nodes['番号'].to_numpy()
+    labels = np.array([f"{k}:{int(n) if float(n).is_integer() else n}" for k, n in zip(kinds, numbers)], dtype=object)
+    root_nodes = roots[paths['root']]
+    end_nodes = np.array([p[-1] for p in paths['nodes']], dtype=np.int64)
+
+    chains_df = pd.DataFrame({
+        '予算事業ID': nodes['予算事業ID'].to_numpy()[root_nodes],
+        '起点種別': kinds[root_nodes],
+        '起点番号': numbers[root_nodes],
+        '終点種別': kinds[end_nodes],
+        '終点番号': numbers[end_nodes],
+        '経路': [labels[p].tolist() for p in paths['nodes']],
+        '長さ': paths['depth'],
+        '打ち切り': paths['truncated'],
+        '目標のあるノード数': targeted_nodes,
+        '実績のあるノード数': measured_nodes,
+    })
+    chains_df = chains_df.sort_values(['予算事業ID', '起点種別', '起点番号'], kind='stable').reset_index(drop=True)
+    chains_df.insert(1, 'チェーン番号', chains_df.groupby('予算事業ID').cumcount() + 1)
+
+    con.register('outcome_chains_df', chains_df)
+    try:
+        con.execute("""
+            CREATE OR REPLACE TABLE outcome_chains AS
+            SELECT
+                c.*,
+                c.実績のあるノード数 = 0 AS 実績なし,
+                e.指標 AS 終点の指標,
+                e.実績値の件数 AS 終点の実績値の件数,
+                e.最新実績年度 AS 終点の最新実績年度,
+                e.最新実績値 AS 終点の最新実績値,
+                e.最終目標年度 AS 終点の最終目標年度,
+                e.最終目標値 AS 終点の最終目標値
+            FROM outcome_chains_df AS c
+            LEFT JOIN outcome_nodes AS e
+              ON c.予算事業ID = e.予算事業ID AND c.終点種別 IS NOT DISTINCT FROM e.種別 AND c.終点番号 = e.番号
+            ORDER BY c.予算事業ID, c.チェーン番号
+        """)
+    finally:
+        con.unregister('outcome_chains_df')
+
+    print(f" -> 'outcome_nodes' ({len(nodes):,}ノード) と 'outcome_chains' ({len(chains_df):,}チェーン) を作成しました。")
+
+def get_outcome_chains(con: duckdb.DuckDBPyConnection, business_id: int) -> pd.DataFrame:
+    """指定された事業の効果発現経路のチェーンを返す"""
+    return con.execute(
+        "SELECT * FROM outcome_chains WHERE 予算事業ID = ? ORDER BY チェーン番号", [business_id]
+    ).fetchdf()
+
+def find_unmeasured_chains(con: duckdb.DuckDBPyConnection, final_only: bool = False) -> pd.DataFrame:
+    """
+    実績値が測定されていないチェーンを持つ事業を、事業単位にまとめて返す。
+    final_only=True の場合は、最終アウトカム (チェーンの終点) に実績値が無いものを対象とする。
+    """
+    condition = "COALESCE(c.終点の実績値の件数, 0) = 0" if final_only else "c.実績なし"
+    return con.execute(f"""
+        WITH Organization AS (
+            SELECT 予算事業ID, FIRST(事業名) AS 事業名, FIRST(府省庁) AS 府省庁, FIRST("局・庁") AS "局・庁"
+            FROM "基本情報_組織情報"
+            GROUP BY 予算事業ID
+        )
+        SELECT
+            c.予算事業ID,
+            o.事業名,
+            o.府省庁,
+            o."局・庁",
+            COUNT(*) AS チェーン数,
+            COUNT(*) FILTER (WHERE {condition}) AS 実績のないチェーン数,
+            MAX(c.長さ) AS 最大の長さ,
+            list(DISTINCT c.終点の指標) FILTER (WHERE {condition}) AS 実績のない終点の指標
+        FROM outcome_chains AS c
+        LEFT JOIN Organization AS o ON c.予算事業ID = o.予算事業ID
+        GROUP BY c.予算事業ID, o.事業名, o.府省庁, o."局・庁"
+        HAVING COUNT(*) FILTER (WHERE {condition}) > 0
+        ORDER BY 実績のないチェーン数 DESC, c.予算事業ID
+    """).fetchdf()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="効果発現経路のつながりから、全事業のアクティビティ→アウトカムのチェーン表を作成します。\n通常は import_zips_to_duckdb.py の実行時に自動で作成されます。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--show', type=int, metavar='ID', help="作成済みのチェーン表から、指定した予算事業IDのチェーンを表示します (再作成は行いません)。")
+    parser.add_argument('--max-depth', type=int, default=MAX_DEPTH, help=f"チェーンを辿る最大の深さ (デフォルト: {MAX_DEPTH})")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    if args.show is not None:
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+        df = get_outcome_chains(con, args.show)
+        con.close()
+        if df.empty:
+            print(f"事業ID {args.show} のチェーンは見つかりませんでした。")
+        else:
+            pd.set_option('display.max_columns', None)
+            pd.set_option('display.width', 150)
+            print(df)
+    else:
+        # チェーン表を書き込むため、書き込み可能な接続で開く
+        print(f"--- データベース '{db_file_path}' に効果発現経路のチェーン表を作成します ---")
+        con = duckdb.connect(database=str(db_file_path), read_only=False)
+        build_outcome_chains(con, args.max_depth)
+        con.close()
+        print("[成功] 処理が完了しました。")
@@ -0,0 +1,263 @@
+import duckdb
+import pandas as pd
+import numpy as np
+import argparse
+import hashlib
+import unicodedata
+import re
+import sys
+import json
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.graph_index import UnionFind
+
+# 支出先IDを付与するテーブルと、その支出先名・法人番号の列
+RECIPIENT_COLUMNS = {
+    "tbl_5_1_details": ("支出先名", "法人番号"),
+    "tbl_5_3": ("支出先名", "法人番号"),
+    "tbl_5_4": ("契約先名（国庫債務負担行為等による契約）", "契約先の法人番号（国庫債務負担行為等による契約）"),
+}
+
+# 法人格の略記 (NFKC正規化後の表記) と正式名称
+LEGAL_FORM_ABBREVIATIONS = {
+    "(株)": "株式会社", "(有)": "有限会社", "(同)": "合同会社", "(資)": "合資会社", "(名)": "合名会社",
+    "(一社)": "一般社団法人", "(公社)": "公益社団法人", "(一財)": "一般財団法人", "(公財)": "公益財団法人",
+    "(独)": "独立行政法人", "(国研)": "国立研究開発法人", "(学)": "学校法人", "(福)": "社会福祉法人",
+    "(医)": "医療法人", "(特非)": "特定非営利活動法人",
+}
+# 法人格の正式名称 (長いものから順に照合する)
+LEGAL_FORMS = sorted({
+    "株式会社", "有限会社", "合同会社", "合資会社", "合名会社",
+    "一般社団法人", "公益社団法人", "一般財団法人", "公益財団法人",
+    "独立行政法人", "地方独立行政法人", "国立研究開発法人", "国立大学法人", "公立大学法人",
+    "学校法人", "社会福祉法人", "医療法人", "医療法人社団", "医療法人財団", "特定非営利活動法人",
+}, key=len, reverse=True)
+
+WHITESPACE_RE = re.compile(r"\s+")
+PUNCTUATION_RE = re.compile(r"[・,.\-‐－'\"「」『』()\[\]]")
+
+# 名寄せの条件
+SIMILARITY_THRESHOLD = 0.8   # 文字bigramのJaccard係数がこれ以上なら同一の支出先とみなす
+MAX_BLOCK_SIZE = 100          # これより多くの名前に現れるbigramは、候補の絞り込みに使わない (「株式」など)
+MIN_FUZZY_LENGTH = 4          # これより短い名前は、表記の類似度による名寄せの対象外
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def normalize_recipient_name(name: str):
+    """
+    支出先名を正規化し、(法人格を除いた名称, 正規化名) を返す。
+    NFKCで全角・半角を揃え、空白と記号を除き、法人格 (株式会社など) は位置によらず末尾にまとめる。
+    例: '株式会社 ＡＢＣ' と 'ABC㈱' は、どちらも ('abc', 'abc(株式会社)') になる。
+    """
+    text = WHITESPACE_RE.sub("", unicodedata.normalize("NFKC", str(name))).lower()
+    for abbreviation, legal_form in LEGAL_FORM_ABBREVIATIONS.items():
+        text = text.replace(abbreviation, legal_form)
+    legal_forms = []
+    for legal_form in LEGAL_FORMS:
+        if legal_form in text:
+            legal_forms.append(legal_form)
+            text = text.replace(legal_form, "")
+    core = PUNCTUATION_RE.sub("", text) or text
+    normalized = f"{core}({'・'.join(sorted(legal_forms))})" if legal_forms else core
+    return core, normalized
+
+def char_bigrams(text: str) -> set:
+    """文字bigramの集合 (1文字の場合はその文字のみ)"""
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+def load_recipient_variants(con: duckdb.DuckDBPyConnection, tables: list) -> pd.DataFrame:
+    """対象テーブルに現れる (支出先名, 法人番号) の組と、その出現件数を読み込む"""
+    branches = []
+    for table_name in tables:
+        name_col, corp_col = RECIPIENT_COLUMNS[table_name]
+        branches.append(f"""
+            SELECT
+                CAST("{name_col}" AS VARCHAR) AS 支出先名,
+                TRY_CAST("{corp_col}" AS BIGINT) AS 法人番号,
+                COUNT(*) AS 件数
+            FROM {table_name}
+            WHERE "{name_col}" IS NOT NULL
+            GROUP BY ALL
+        """)
+    rows = con.execute(f"""
+        SELECT 支出先名, CASE WHEN 法人番号 > 0 THEN 法人番号 END AS 法人番号, SUM(件数) AS 件数
+        FROM ({" UNION ALL ".join(branches)})
+        GROUP BY ALL
+        ORDER BY 支出先名, 法人番号
+    """).fetchall()
+    # 法人番号の NULL が NaN (float) に化けないよう、Pythonの値のまま受け取る
+    return pd.DataFrame(rows, columns=['支出先名', '法人番号', '件数'], dtype=object)
+
+def find_similar_pairs(cores: pd.Series) -> pd.DataFrame:
+    """
+    名称 (法人格を除いたもの) の一覧から、文字bigramのJaccard係数が閾値以上の組を求める。
+    共通のbigramを持つ名称どうしだけを比較する (bigramによるブロッキング)。
+    一方が他方を含む組 (「アルファ商事」と「アルファ商事東」など) は、支店・連合会などの別の支出先である
+    ことが多いため除く (同じ名称の表記ゆれは cluster_recipients で名称の一致としてまとめる)。
+    """
+    candidates = cores[cores.str.len() >= MIN_FUZZY_LENGTH].drop_duplicates()
+    grams = pd.DataFrame({'core': candidates.to_numpy(), 'gram': [sorted(char_bigrams(c)) for c in candidates]})
+    grams['size'] = grams['gram'].str.len()
+    grams = grams.explode('gram')
+    grams = grams[grams.groupby('gram')['core'].transform('size') <= MAX_BLOCK_SIZE]
+
+    pairs = grams.merge(grams, on='gram', suffixes=('_a', '_b'))
+    pairs = pairs[pairs['core_a'] < pairs['core_b']]
+    shared = pairs.groupby(['core_a', 'core_b', 'size_a', 'size_b']).size().rename('shared').reset_index()
+    shared['jaccard'] = shared['shared'] / (shared['size_a'] + shared['size_b'] - shared['shared'])
+    shared = shared[shared['jaccard'] >= SIMILARITY_THRESHOLD]
+    contained = [a in b or b in a for a, b in zip(shared['core_a'], shared['core_b'])]
+    return shared.loc[~np.array(contained, dtype=bool), ['core_a', 'core_b', 'jaccard']]
+
+def cluster_recipients(variants: pd.DataFrame) -> np.ndarray:
+    """
+    支出先の表記を名寄せし、各表記のクラスタのラベルを返す。
+      1. 法人番号が同じ表記は、同一の支出先とする (強いキー)
+      2. 正規化名が同じ表記をまとめる
+      3. 名称 (法人格を除いたもの) が同じ表記をまとめる (「株式会社ABC」と「ABC」など)
+      4. 名称が十分に似ている表記をまとめる
+    2〜4 では、異なる法人番号を持つクラスタどうしは併合しない。
+    """
+    union_find = UnionFind(len(variants))
+    corp_numbers = variants['法人番号'].tolist()
+    cluster_corp = list(corp_numbers)  # クラスタの代表ノードごとの法人番号
+
+    def union_if_compatible(a: int, b: int):
+        root_a, root_b = union_find.find(a), union_find.find(b)
+        if root_a == root_b:
+            return
+        corp_a, corp_b = cluster_corp[root_a], cluster_corp[root_b]
+        if corp_a is not None and corp_b is not None and corp_a != corp_b:
+            return
+        union_find.union(root_a, root_b)
+        cluster_corp[union_find.find(root_a)] = corp_a if corp_a is not None else corp_b
+
+    positions = pd.Series(np.arange(len(variants)), index=variants.index)
+    for key in ['法人番号', '正規化名', '名称']:
+        groups = positions.groupby(variants[key].astype(str).where(variants[key].notna())).agg(list)
+        for members in groups:
+            for other in members[1:]:
+                union_if_compatible(members[0], other)
+
+    first_of_core = positions.groupby(variants['名称']).first()
+    for core_a, core_b in find_similar_pairs(variants['名称'])[['core_a', 'core_b']].itertuples(index=False):
+        union_if_compatible(first_of_core[core_a], first_of_core[core_b])
+
+    return union_find.labels()
+
+def recipient_id(corp_number, normalized_name: str) -> int:
+    """
+    支出先IDを決める。法人番号があればそれを使い、無ければ正規化名のハッシュ (60bit) を使う。
+    normalized_name にはクラスタ内で辞書順が最小の正規化名を渡す (出現件数に依存しないため、
+    DBを作り直しても、クラスタの表記が増減しない限り変わらない)。
+    """
+    if pd.notna(corp_number):
+        return int(corp_number)
+    return int(hashlib.md5(normalized_name.encode('utf-8')).hexdigest()[:15], 16)
+
+def load_view_names(con: duckdb.DuckDBPyConnection) -> dict:
+    """table_index から、テーブル名 → VIEW名 の対応を読み込む"""
+    return dict(con.execute("SELECT table_name, view_name FROM table_index").fetchall())
+
+def build_recipient_index(con: duckdb.DuckDBPyConnection, view_names: dict = None):
+    """
+    支出先の名寄せを行い、dim_recipient (支出先ごとの代表名・法人番号・表記ゆれ) と
+    recipient_alias (表記 → 支出先ID) を作成して、対象テーブルに支出先ID列を追加する。
+    view_names (テーブル名 → VIEW名) が無い場合は table_index から読み込む。
+    """
+    view_names = view_names if view_names is not None else load_view_names(con)
+    tables = [table for table in RECIPIENT_COLUMNS if table in view_names]
+    if not tables:
+        print(" -> 支出先を持つテーブルが無いため、スキップしました。")
+        return
+
+    variants = load_recipient_variants(con, tables)
+    normalized = [normalize_recipient_name(name) for name in variants['支出先名']]
+    variants['名称'] = [core for core, _ in normalized]
+    variants['正規化名'] = [name for _, name in normalized]
+    variants['label'] = cluster_recipients(variants)
+
+    # クラスタごとに、最も多く使われている表記を代表名とする
+    variants = variants.sort_values(['label', '件数', '支出先名'], ascending=[True, False, True])
+    clusters = variants.groupby('label', sort=False).agg(
+        代表名=('支出先名', 'first'),
+        正規化名=('正規化名', 'first'),
+        最小正規化名=('正規化名', 'min'),
+        法人番号=('法人番号', lambda s: next((v for v in s if pd.notna(v)), None)),
+        表記ゆれ数=('支出先名', 'nunique'),
+        出現件数=('件数', 'sum'),
+        表記=('支出先名', lambda s: sorted(set(s))),
+    )
+    # 支出先IDは代表名 (出現件数で変わる) ではなく、辞書順で最小の正規化名から決める
+    clusters['支出先ID'] = [recipient_id(c, n) for c, n in zip(clusters['法人番号'], clusters['最小正規化名'])]
+    variants['支出先ID'] = variants['label'].map(clusters['支出先ID'])
+
+    dim_df = clusters.reset_index(drop=True)[['支出先ID', '代表名', '法人番号', '正規化名', '表記ゆれ数', '出現件数', '表記']]
+    dim_df['法人番号'] = dim_df['法人番号'].astype('Int64')
+    alias_df = variants[['支出先名', '法人番号', '正規化名', '支出先ID']].copy()
+    alias_df['法人番号'] = alias_df['法人番号'].astype('Int64')
+
+    con.register('dim_recipient_df', dim_df)
+    con.register('recipient_alias_df', alias_df)
+    try:
+        con.execute("CREATE OR REPLACE TABLE dim_recipient AS SELECT * FROM dim_recipient_df ORDER BY 出現件数 DESC")
+        con.execute("CREATE OR REPLACE TABLE recipient_alias AS SELECT * FROM recipient_alias_df")
+    finally:
+        con.unregister('dim_recipient_df')
+        con.unregister('recipient_alias_df')
+
+    for table_name in tables:
+        name_col, corp_col = RECIPIENT_COLUMNS[table_name]
+        columns = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
+        if '支出先ID' not in columns:
+            con.execute(f"ALTER TABLE {table_name} ADD COLUMN 支出先ID BIGINT")
+        con.execute(f"""
+            UPDATE {table_name} AS t
+            SET 支出先ID = a.支出先ID
+            FROM recipient_alias AS a
+            WHERE a.支出先名 = CAST(t."{name_col}" AS VARCHAR)
+              AND a.法人番号 IS NOT DISTINCT FROM (CASE WHEN TRY_CAST(t."{corp_col}" AS BIGINT) > 0 THEN TRY_CAST(t."{corp_col}" AS BIGINT) END)
+        """)
+        # 列を追加したため、VIEWを作り直して新しい列を反映する
+        con.execute(f'CREATE OR REPLACE VIEW "{view_names[table_name]}" AS SELECT * FROM {table_name};')
+        print(f" -> テーブル '{table_name}' に '支出先ID' 列を追加しました。")
+
+    print(f" -> 'dim_recipient' ({len(dim_df):,}支出先 / {len(alias_df):,}表記) を作成しました。")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="支出先名・法人番号の表記ゆれを名寄せし、支出先の次元表 dim_recipient を作成します。\n通常は import_zips_to_duckdb.py の実行時に自動で作成されます。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    args = parser.parse_args()
+
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    # 支出先IDを書き込むため、書き込み可能な接続で開く
+    print(f"--- データベース '{db_file_path}' の支出先を名寄せします ---")
+    con = duckdb.connect(database=str(db_file_path), read_only=False)
+    build_recipient_index(con)
+    con.close()
+    print("[成功] 処理が完了しました。")
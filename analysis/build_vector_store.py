@@ -1,33 +1,131 @@
 import duckdb
-import chromadb
-import google.generativeai as genai
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import threading
+import queue
 import sys
 import json
 from pathlib import Path
-import os
-from dotenv import load_dotenv
 from tqdm import tqdm
 import argparse
+import hashlib
 
-# --- (パス解決、設定読み込み、API設定は変更なし) ---
+# --- (パス解決、設定読み込みは変更なし) ---
 try:
     PROJECT_ROOT = Path(__file__).resolve().parent.parent
 except NameError: PROJECT_ROOT = Path().cwd()
 SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
 
+# 1回のAPI呼び出しで送る件数
+EMBEDDING_BATCH_SIZE = 100
+
+# ベクトルストアへの書き込みで、1回に読み込む (=挿入する) 行数
+STORE_BATCH_ROWS = 20000
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.embedding_cache import EmbeddingCache
+from analysis.async_embedder import AsyncEmbedder
+from analysis.llm_backends import LLMBackend, get_backend, BACKEND_NAMES
+from analysis.vector_store import VECTOR_TABLE, METADATA_COLUMNS, create_vector_table, insert_documents
+from analysis.quantized_embeddings import QUANTIZED_DTYPES, save_quantized
+
 def load_settings():
     try:
         with SETTINGS_FILE.open('r', encoding='utf-8') as f: return json.load(f)
     except Exception as e: sys.exit(f"[エラー] 設定ファイル '{SETTINGS_FILE}' 読込失敗: {e}")
 
-def configure_genai():
-    load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
-    api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key: sys.exit("[エラー] .envにGOOGLE_API_KEYがありません。")
-    genai.configure(api_key=api_key)
+def document_id(text: str) -> str:
+    """説明文の内容から文書IDを計算する (同じ説明文は同じID)"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def deduplicate_documents(df: pd.DataFrame):
+    """
+    説明文が完全に一致する行 (同じ事業・支出先・契約概要で、会計区分や支出ブロックだけが異なる明細など) を
+    1つの文書にまとめる。文書ごとのメタデータは、金額を合計し、まとめた明細の件数と予算事業IDの一覧を持つ。
+    返り値は (文書のDataFrame, 元の行 → 文書ID の対応表)。
+    """
+    df = df.copy()
+    df['doc_id'] = df['document_text'].map(document_id)
+    grouped = df.groupby('doc_id', sort=False)
+    docs_df = grouped.agg(
+        document_text=('document_text', 'first'),
+        予算事業ID=('予算事業ID', 'min'),
+        事業名=('事業名', 'first'),
+        事業の目的=('事業の目的', 'first'),
+        事業の概要=('事業の概要', 'first'),
+        契約概要=('契約概要', 'first'),
+        支出先名=('支出先名', 'first'),
+        金額=('金額', 'sum'),
+        明細件数=('document_text', 'size'),
+    )
+    docs_df['予算事業ID一覧'] = grouped['予算事業ID'].agg(
+        lambda ids: ','.join(str(int(i)) for i in sorted(ids.dropna().unique()))
+    )
+    rows_df = df.drop(columns=['document_text']).reset_index(names='行番号')
+    return docs_df.reset_index(), rows_df
+
+def embed_documents(documents: list, backend: LLMBackend, embedding_cache: EmbeddingCache, concurrency: int = 4, requests_per_minute: float = 1500) -> list:
+    """
+    文書のリストをEmbeddingする。キャッシュに同じテキストがあればそれを再利用し、
+    新規・変更された文書だけをAPIに送る。キャッシュのヒット率と節約できたAPI呼び出し数を表示する。
+    APIへはバッチを concurrency 件まで同時に送り、1分あたりのリクエスト数を requests_per_minute 以下に抑える。
+    """
+    hashes = embedding_cache.hashes(documents)
+    cached = embedding_cache.lookup(hashes)
+
+    # キャッシュに無いテキストだけを、重複を除いてAPIに送る
+    missing = {}
+    for text, key in zip(documents, hashes):
+        if key not in cached and key not in missing:
+            missing[key] = text
+    missing_keys = list(missing.keys())
+    missing_texts = list(missing.values())
+
+    num_hits = sum(1 for key in hashes if key in cached)
+    hit_ratio = num_hits / len(documents) if documents else 0.0
+    calls_needed = -(-len(missing_texts) // EMBEDDING_BATCH_SIZE)
+    calls_without_cache = -(-len(documents) // EMBEDDING_BATCH_SIZE)
+    print(f" -> キャッシュヒット: {num_hits:,}/{len(documents):,}件 ({hit_ratio:.1%})。新規にEmbeddingする文書: {len(missing_texts):,}件")
+    print(f" -> API呼び出し: {calls_needed:,}回 (キャッシュにより {calls_without_cache - calls_needed:,}回を節約)")
+
+    key_batches = [missing_keys[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(missing_keys), EMBEDDING_BATCH_SIZE)]
+    text_batches = [missing_texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(missing_texts), EMBEDDING_BATCH_SIZE)]
+    progress = tqdm(total=len(text_batches), desc="Embedding Progress")
+
+    def on_batch_done(index, texts, embeddings):
+        # 完了したバッチはすぐキャッシュへ書き込む (チェックポイント)。中断しても、再実行時は残りのバッチだけを送る
+        embedding_cache.put(key_batches[index], embeddings)
+        cached.update(zip(key_batches[index], embeddings))
+        progress.update(1)
+
+    embedder = AsyncEmbedder(backend.embed, concurrency=concurrency, requests_per_minute=requests_per_minute)
+    try:
+        embedder.run(text_batches, on_batch_done=on_batch_done)
+    finally:
+        progress.close()
+        if embedder.num_retries:
+            print(f" -> 一時的なエラーにより {embedder.num_retries:,}回 再試行しました。")
+
+    return [cached[key] for key in hashes]
+
+def write_embeddings_parquet(df: pd.DataFrame, cache_path: Path):
+    """
+    Embedding済みの文書をParquetに保存する。Embeddingは float32 の固定長リストとして書き込む
+    (pandasのオブジェクト列のまま保存すると float64 の可変長リストになり、ファイルも読み込み時のメモリも倍以上になる)。
+    """
+    matrix = np.asarray(df['embedding'].tolist(), dtype=np.float32)
+    table = pa.Table.from_pandas(df.drop(columns=['embedding']), preserve_index=False)
+    table = table.append_column('embedding', pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), matrix.shape[1]))
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, cache_path)
+    return matrix
 
-def fetch_and_embed_data(db_file_path: Path, cache_path: Path):
+def fetch_and_embed_data(db_file_path: Path, cache_path: Path, embedding_cache_path: Path, backend: LLMBackend, concurrency: int = 4, requests_per_minute: float = 1500, quantized_dtype: str = 'int8'):
     """【ステップ1】DBからデータを取得し、Embeddingを行い、結果をキャッシュする"""
     print(f"--- データベース '{db_file_path}' からテキストデータを読み込み、文脈を付与します ---")
     con = duckdb.connect(database=str(db_file_path), read_only=True)
@@ -55,86 +153,138 @@ def fetch_and_embed_data(db_file_path: Path, cache_path: Path):
     documents = df.apply(create_document, axis=1).tolist()
     df['document_text'] = documents # 後で使えるようにDFにも追加
 
-    print("--- テキストを意味ベクトルに変換中 (Embedding)... ---")
-    try:
-        def chunks(lst, n):
-            for i in range(0, len(lst), n): yield lst[i:i + n]
-        
-        embeddings_list = []
-        for batch in tqdm(list(chunks(documents, 100)), desc="Embedding Progress"):
-            result = genai.embed_content(model="models/text-embedding-004", content=batch, task_type="RETRIEVAL_DOCUMENT")
-            embeddings_list.extend(result['embedding'])
-        
-        # Embedding結果をDataFrameの新しい列として追加
-        df['embedding'] = embeddings_list
+    # 同じ説明文は1回だけEmbeddingし、ベクトルストアにも1件だけ登録する
+    print("--- 同一の説明文をまとめています (重複排除)... ---")
+    rows_count = len(df)
+    df, rows_df = deduplicate_documents(df)
+    print(f" -> {rows_count:,}行を {len(df):,}件の文書にまとめました (重複 {rows_count - len(df):,}行)。")
+    rows_path = cache_path.with_name("document_rows.parquet")
+    rows_path.parent.mkdir(parents=True, exist_ok=True)
+    rows_df.to_parquet(rows_path)
+    print(f" -> 元の行と文書IDの対応表を '{rows_path}' に保存しました。")
 
+    print(f"--- テキストを意味ベクトルに変換中 (Embedding: {backend.name}/{backend.embedding_model}, キャッシュ: '{embedding_cache_path}')... ---")
+    try:
+        # キャッシュのキーにはモデル名が含まれるため、バックエンドを切り替えてもベクトルが混ざらない
+        with EmbeddingCache(embedding_cache_path, backend.embedding_model) as embedding_cache:
+            # Embedding結果をDataFrameの新しい列として追加
+            df['embedding'] = embed_documents(df['document_text'].tolist(), backend, embedding_cache, concurrency, requests_per_minute)
     except Exception as e:
-        sys.exit(f"[エラー] Google AI Embedding APIの呼び出しに失敗しました: {e}")
+        sys.exit(f"[エラー] Embedding APIの呼び出しに失敗しました: {e}\n  -> 完了したバッチはキャッシュに保存済みです。再実行すると続きから処理します。")
     
     # --- 結果をParquetファイルにキャッシュとして保存 ---
     print(f"--- Embedding結果をキャッシュファイル '{cache_path}' に保存中... ---")
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_parquet(cache_path)
+    matrix = write_embeddings_parquet(df, cache_path)
+    if quantized_dtype != 'none':
+        # メモリの少ない環境 (Colabなど) 向けに、量子化した行列をメモリマップで読める形式でも保存する
+        matrix_path = save_quantized(matrix, df['doc_id'].tolist(), cache_path.parent / "quantized", quantized_dtype)
+        print(f" -> 量子化したEmbedding ({quantized_dtype}) を '{matrix_path}' に保存しました ({matrix_path.stat().st_size / 1024**2:,.1f}MB)。")
     print("[成功] キャッシュの作成が完了しました。")
     return df
 
-def store_to_chromadb(df_with_embeddings: pd.DataFrame, vector_store_path: str):
-    """【ステップ2】キャッシュからデータを読み込み、クリーニングしてChromaDBに保存する"""
-    print("--- ベクトルデータベースに保存中... ---")
-    
-    # --- データクリーニング ---
-    # ChromaDBはNone/NaNをメタデータとして受け付けないため、安全な値に置換
-    # to_dictの前にクリーニングを行う
-    metadatas_df = df_with_embeddings.drop(columns=['document_text', 'embedding'])
-    # 文字列のカラムは空文字に、数値のカラムは0に置換
-    for col in metadatas_df.select_dtypes(include=['object']).columns:
-        metadatas_df[col] = metadatas_df[col].fillna('')
-    for col in metadatas_df.select_dtypes(include=['number']).columns:
-        metadatas_df[col] = metadatas_df[col].fillna(0)
-        
-    metadatas = metadatas_df.to_dict('records')
-    documents = df_with_embeddings['document_text'].tolist()
-    embeddings = df_with_embeddings['embedding'].tolist()
-    ids = [f"doc_{i}" for i in range(len(documents))]
+def iter_cache_batches(cache_path: Path, batch_rows: int = STORE_BATCH_ROWS):
+    """
+    Parquetのキャッシュを、必要な列だけレコードバッチ単位で読み込む。
+    読み込みは別スレッドで行い、呼び出し側が1つ前のバッチを書き込んでいる間に次のバッチを先読みする。
+    """
+    dataset = ds.dataset(cache_path, format='parquet')
+    columns = [c for c in METADATA_COLUMNS + ['embedding'] if c in dataset.schema.names]
+    scanner = dataset.scanner(columns=columns, batch_size=batch_rows)
+    prefetched = queue.Queue(maxsize=2)
+    finished = object()
+
+    def read_batches():
+        try:
+            for batch in scanner.to_batches():
+                if batch.num_rows:
+                    prefetched.put(batch)
+        except Exception as e:
+            prefetched.put(e)
+        prefetched.put(finished)
+
+    threading.Thread(target=read_batches, daemon=True).start()
+    while True:
+        item = prefetched.get()
+        if item is finished:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+def clean_batch(batch: pa.RecordBatch) -> pa.Table:
+    """
+    1バッチ分の列をそろえ、浮動小数点のNaNをNULLに置き換える (列単位のベクトル演算)。
+    重複排除を行う前の古いキャッシュに無い列は、NULLの列として補う (insert_documents で既定値に置き換わる)。
+    """
+    table = pa.Table.from_batches([batch])
+    for name in METADATA_COLUMNS:
+        if name not in table.column_names:
+            table = table.append_column(name, pa.nulls(table.num_rows, pa.string() if name != '明細件数' else pa.int64()))
+        elif pa.types.is_floating(table.schema.field(name).type):
+            column = table[name]
+            table = table.set_column(table.column_names.index(name), name, pc.if_else(pc.is_nan(column), None, column))
+    return table.select(METADATA_COLUMNS + ['embedding'])
+
+def store_to_duckdb(cache_path: Path, db_file_path: Path, batch_rows: int = STORE_BATCH_ROWS):
+    """
+    【ステップ2】Embedding済みの文書 (Parquetのキャッシュ) を、メタデータと同じDBファイルの rag_documents テーブルに保存する。
+    キャッシュ全体をメモリに読み込まず、レコードバッチごとに読み込み・NaNの除去・挿入を行う。
+    """
+    print(f"--- ベクトルストア (テーブル '{VECTOR_TABLE}') に保存中... ---")
+    embedding_type = pq.read_schema(cache_path).field('embedding').type
+    if pa.types.is_fixed_size_list(embedding_type):
+        dimension = embedding_type.list_size
+    else:
+        # 可変長リストで保存された古いキャッシュは、先頭の1件から次元数を求める
+        first_row = pq.ParquetFile(cache_path).read_row_group(0, columns=['embedding']).slice(0, 1)
+        dimension = len(first_row['embedding'][0])
+    total_rows = pq.ParquetFile(cache_path).metadata.num_rows
 
     try:
-        client = chromadb.PersistentClient(path=vector_store_path)
-        if "rs_system_rag" in [c.name for c in client.list_collections()]:
-            client.delete_collection(name="rs_system_rag")
-        collection = client.create_collection(name="rs_system_rag")
-        
-        batch_size = 4000
-        for i in tqdm(range(0, len(documents), batch_size), desc="Storing to ChromaDB"):
-            collection.add(
-                ids=ids[i:i + batch_size],
-                embeddings=embeddings[i:i + batch_size],
-                documents=documents[i:i + batch_size],
-                metadatas=metadatas[i:i + batch_size]
-            )
-        print(f"[成功] ベクトルデータベースを '{vector_store_path}' に構築しました。")
+        # ベクトルを書き込むため、書き込み可能な接続で開く
+        con = duckdb.connect(database=str(db_file_path), read_only=False)
+        try:
+            create_vector_table(con, dimension)
+            with tqdm(total=total_rows, desc="Storing to DuckDB") as progress:
+                for batch in iter_cache_batches(cache_path, batch_rows):
+                    insert_documents(con, clean_batch(batch))
+                    progress.update(batch.num_rows)
+            num_documents = con.execute(f"SELECT COUNT(*) FROM {VECTOR_TABLE}").fetchone()[0]
+        finally:
+            con.close()
+        print(f"[成功] {num_documents:,}件の文書 ({dimension}次元) を '{db_file_path}' のテーブル '{VECTOR_TABLE}' に保存しました。")
     except Exception as e:
-        sys.exit(f"[エラー] ChromaDBへの保存に失敗しました: {e}")
+        sys.exit(f"[エラー] ベクトルストアへの保存に失敗しました: {e}")
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="テキストデータをベクトル化し、ChromaDBに保存します。")
-    parser.add_argument('--use_cache', action='store_true', help="API呼び出しをスキップし、既存のキャッシュファイルからChromaDBを構築します。")
+    parser = argparse.ArgumentParser(description="テキストデータをベクトル化し、DuckDBのベクトルストア (rag_documents テーブル) に保存します。")
+    parser.add_argument('--use_cache', action='store_true', help="DBの読み込みとEmbeddingをスキップし、既存のキャッシュファイル (embeddings.parquet) からベクトルストアを構築します。指定しない場合も、Embedding済みの文書はキャッシュDBから再利用され、新規・変更された文書だけがAPIに送られます。")
+    parser.add_argument('--backend', choices=BACKEND_NAMES, default=None, help="Embeddingのバックエンド (デフォルト: 環境変数 RS_LLM_BACKEND、または設定ファイルの llm.backend)。fake はAPIを使わないオフライン用です。")
+    parser.add_argument('--quantize', choices=QUANTIZED_DTYPES + ['none'], default=None, help="キャッシュと併せて保存する量子化Embeddingの型 (デフォルト: 設定ファイルの vector_store.quantized_dtype、未設定なら int8)")
+    parser.add_argument('--concurrency', type=int, default=None, help="Embedding APIへ同時に送るバッチ数 (デフォルト: 設定ファイルの vector_store.embedding_concurrency、未設定なら4)")
+    parser.add_argument('--rpm', type=float, default=None, help="Embedding APIへの1分あたりの最大リクエスト数 (デフォルト: 設定ファイルの vector_store.embedding_requests_per_minute、未設定なら1500)")
     args = parser.parse_args()
 
     settings = load_settings()
     db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
-    vector_store_path = str(PROJECT_ROOT / "vector_store")
     cache_path = PROJECT_ROOT / "cache" / "embeddings.parquet"
-
-    configure_genai()
+    vector_store_settings = settings.get('vector_store', {})
+    embedding_cache_path = PROJECT_ROOT / vector_store_settings.get('embedding_cache_file', 'cache/embedding_cache.duckdb')
+    concurrency = args.concurrency or vector_store_settings.get('embedding_concurrency', 4)
+    requests_per_minute = args.rpm or vector_store_settings.get('embedding_requests_per_minute', 1500)
+    quantized_dtype = args.quantize or vector_store_settings.get('quantized_dtype', 'int8')
 
     if args.use_cache:
         if not cache_path.is_file():
             sys.exit(f"[エラー] キャッシュファイル '{cache_path}' が見つかりません。まずキャッシュを構築してください。")
         print(f"--- 既存のキャッシュ '{cache_path}' を使用します ---")
-        df_cached = pd.read_parquet(cache_path)
-        store_to_chromadb(df_cached, vector_store_path)
+        store_to_duckdb(cache_path, db_file_path)
     else:
-        # Embeddingから実行
-        df_embedded = fetch_and_embed_data(db_file_path, cache_path)
-        # 続けてChromaDBへの保存を実行
-        store_to_chromadb(df_embedded, vector_store_path)
\ No newline at end of file
+        try:
+            backend = get_backend(args.backend)
+        except Exception as e:
+            sys.exit(f"[エラー] バックエンドの初期化に失敗しました: {e}")
+        # Embeddingから実行 (結果はキャッシュファイルに保存される)
+        fetch_and_embed_data(db_file_path, cache_path, embedding_cache_path, backend, concurrency, requests_per_minute, quantized_dtype)
+        # 続けて、キャッシュファイルからベクトルストアへの保存を実行
+        store_to_duckdb(cache_path, db_file_path)
\ No newline at end of file
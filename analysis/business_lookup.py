@@ -0,0 +1,171 @@
+import duckdb
+import json
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+# ---------------------------------------------
+
+def load_view_columns(con: duckdb.DuckDBPyConnection) -> dict:
+    """
+    table_index に登録された全VIEWの列名を1回のクエリで取得し、{VIEW名: [列名, ...]} を返す (VIEW名順)。
+    予算事業IDを持たないVIEWは含めない。
+    """
+    rows = con.execute("""
+        SELECT c.table_name, c.column_name
+        FROM information_schema.columns AS c
+        JOIN table_index AS t ON c.table_name = t.view_name
+        ORDER BY c.table_name, c.ordinal_position
+    """).fetchall()
+    view_columns = {}
+    for view_name, column_name in rows:
+        view_columns.setdefault(view_name, []).append(column_name)
+    return {view: cols for view, cols in sorted(view_columns.items()) if '予算事業ID' in cols}
+
+# 事業単位の検索用テーブル (DB生成時に build_lookup_documents で作成する)
+LOOKUP_DOCUMENTS_TABLE = "business_lookup_documents"
+
+def load_view_tables(con: duckdb.DuckDBPyConnection) -> dict:
+    """table_index から {VIEW名: 元テーブル名} を返す"""
+    return dict(con.execute("SELECT view_name, table_name FROM table_index").fetchall())
+
+def build_lookup_documents(con: duckdb.DuckDBPyConnection):
+    """
+    事業単位の検索用テーブル business_lookup_documents (予算事業ID, view_name, records) を作成する。
+    VIEWごとに、1事業分の行を get_business_details.py と同じJSON配列にまとめて保持し、予算事業IDにARTインデックスを張る。
+    BusinessLookup の1件検索を、全VIEWへの問い合わせではなく、このテーブルへの1回の索引検索で行えるようにする。
+    """
+    view_tables = load_view_tables(con)
+    con.execute(f"CREATE OR REPLACE TABLE {LOOKUP_DOCUMENTS_TABLE} (予算事業ID BIGINT, view_name VARCHAR, records JSON)")
+    for view_name, columns in load_view_columns(con).items():
+        row_struct = ", ".join(f"'{col}': \"{col}\"" for col in columns)
+        try:
+            con.execute(f"""
+                INSERT INTO {LOOKUP_DOCUMENTS_TABLE}
+                SELECT 予算事業ID, '{view_name}', to_json(list({{{row_struct}}}))
+                FROM {view_tables[view_name]}
+                WHERE 予算事業ID IS NOT NULL
+                GROUP BY 予算事業ID
+            """)
+        except Exception as e:
+            print(f" !! 警告: VIEW '{view_name}' の検索用テーブルへの登録中にエラー: {e}", file=sys.stderr)
+    con.execute(f"CREATE INDEX idx_{LOOKUP_DOCUMENTS_TABLE}_business_id ON {LOOKUP_DOCUMENTS_TABLE} (予算事業ID)")
+    row_count = con.execute(f"SELECT COUNT(*) FROM {LOOKUP_DOCUMENTS_TABLE}").fetchone()[0]
+    print(f" -> 検索用テーブル '{LOOKUP_DOCUMENTS_TABLE}' ({row_count:,}行) を作成しました。")
+
+class BusinessLookup:
+    """
+    予算事業IDから、その事業の全情報 (get_business_details.py と同じ階層型の辞書) を取得するAPI。
+
+    - DB生成時に作成された business_lookup_documents があれば、予算事業IDのARTインデックスで1回だけ検索する
+    - 無い場合 (古いDB) は、VIEWごとに元テーブルを予算事業IDで検索する (列情報は初期化時に1回だけ読み込む)
+    - 組み立て済みの結果はLRUキャッシュに保持する
+
+    使用例:
+        with BusinessLookup(db_file_path) as lookup:
+            record = lookup.get(7259)
+    """
+
+    def __init__(self, db_file_path, cache_size: int = 256, con: duckdb.DuckDBPyConnection = None):
+        self._owns_connection = con is None
+        self.con = con or duckdb.connect(database=str(db_file_path), read_only=True)
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        # Streamlitなど複数スレッドから呼ばれる場合に備え、接続とキャッシュの操作を直列化する
+        self._lock = threading.Lock()
+
+        self.view_columns = load_view_columns(self.con)
+        self.use_lookup_documents = self.con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [LOOKUP_DOCUMENTS_TABLE]
+        ).fetchone()[0] > 0
+        self._view_queries = {} if self.use_lookup_documents else self._build_view_queries()
+
+    def _build_view_queries(self) -> dict:
+        """VIEWごとに、元テーブルから指定IDの行をJSON配列として返すSQLを組み立てる"""
+        view_tables = load_view_tables(self.con)
+        queries = {}
+        for view_name, columns in self.view_columns.items():
+            row_struct = ", ".join(f"'{col}': \"{col}\"" for col in columns)
+            queries[view_name] = f"""
+                SELECT to_json(list({{{row_struct}}}))
+                FROM {view_tables.get(view_name, f'"{view_name}"')}
+                WHERE 予算事業ID = $1
+                HAVING COUNT(*) > 0
+            """
+        return queries
+
+    def _fetch_documents(self, business_id: int) -> dict:
+        """{VIEW名: 行のJSON配列} を取得する"""
+        if self.use_lookup_documents:
+            return dict(self.con.execute(
+                f"SELECT view_name, records FROM {LOOKUP_DOCUMENTS_TABLE} WHERE 予算事業ID = $1", [business_id]
+            ).fetchall())
+        documents = {}
+        for view_name, query in self._view_queries.items():
+            row = self.con.execute(query, [business_id]).fetchone()
+            if row is not None:
+                documents[view_name] = row[0]
+        return documents
+
+    def _fetch(self, business_id: int) -> dict:
+        """DBから事業の全情報を取得し、階層型の辞書に組み立てる"""
+        rows = self._fetch_documents(business_id)
+        if not rows:
+            return None
+
+        organization = json.loads(rows.get("基本情報_組織情報", "[]"))
+        record = {
+            "予算事業ID": business_id,
+            "事業名": organization[0].get("事業名") if organization else "不明な事業",
+        }
+        for view_name in self.view_columns:
+            if view_name not in rows:
+                continue
+            records = json.loads(rows[view_name])
+            record[view_name] = records[0] if len(records) == 1 else records
+        return record
+
+    def get(self, business_id: int) -> dict:
+        """
+        指定された予算事業IDの全情報を返す。該当する事業がない場合は None を返す。
+        返り値はキャッシュと共有されるため、呼び出し側で変更しないこと。
+        """
+        business_id = int(business_id)
+        with self._lock:
+            if business_id in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(business_id)
+                return self._cache[business_id]
+
+            self.misses += 1
+            record = self._fetch(business_id)
+            self._cache[business_id] = record
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return record
+
+    def clear_cache(self):
+        """キャッシュを空にする (DBを再構築した場合など)"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        """自身で開いたDB接続を閉じる"""
+        if self._owns_connection:
+            self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
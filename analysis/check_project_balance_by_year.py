@@ -33,42 +33,23 @@ def load_settings():
         print(f"[エラー] 設定ファイルの読み込み中に予期せぬ問題が発生しました: {e}", file=sys.stderr)
         sys.exit(1)
 
-def check_balance_by_year(target_year: int):
+def build_balance_query(year_condition: str) -> str:
     """
-    指定された「予算年度」に絞って、予算総額と支出総額を比較する。
+    予算年度ごとの予算総額と支出総額を比較するSQLを組み立てる。
+    予算額は「予算事業ID × 予算年度」単位で1回のGROUP BYで集計し、支出総額の集計は1回だけ行って全年度に結合する。
     """
-    settings = load_settings()
-    try:
-        db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
-        results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
-    except KeyError as e:
-        print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
-        sys.exit(1)
-    
-    if not db_file_path.is_file():
-        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
-        sys.exit(1)
-
-    print(f"--- 【{target_year}年度予算】を基準に、予算・支出バランスをチェックします ---")
-    
-    try:
-        con = duckdb.connect(database=str(db_file_path), read_only=True)
-    except Exception as e:
-        print(f"[エラー] DB接続に失敗しました: {e}", file=sys.stderr)
-        return
-
-    # 指定された年度の予算と、支出総額を比較するSQLクエリ
-    query = f"""
+    return f"""
     WITH
     BudgetForYear AS (
-        -- 指定された単一年度の予算額合計を取得
+        -- 対象年度の予算額合計を、年度ごとに取得
         SELECT
+            予算年度,
             予算事業ID,
             事業名,
             SUM("計（歳出予算現額合計）") AS "単年度の予算総額"
         FROM "予算・執行_サマリ"
-        WHERE 予算年度 = {target_year}
-        GROUP BY 予算事業ID, 事業名
+        WHERE {year_condition}
+        GROUP BY 予算年度, 予算事業ID, 事業名
     ),
     ExpenditureTotal AS (
         -- 支出総額を取得 (これは年度を区別できないが、最新年度の実績と仮定)
@@ -80,6 +61,7 @@ def check_balance_by_year(target_year: int):
         GROUP BY 予算事業ID
     )
     SELECT
+        b.予算年度,
         b.予算事業ID,
         b.事業名,
         b."単年度の予算総額",
@@ -93,12 +75,107 @@ def check_balance_by_year(target_year: int):
         -- 支出が単年度の予算を超えているものを抽出
         e.事業全体の支出総額 > b."単年度の予算総額"
     ORDER BY
-        超過額 DESC;
+        予算年度, 超過額 DESC;
+    """
+
+def save_result(df: pd.DataFrame, output_path: Path, output_format: str):
+    """結果をCSVまたはParquetで保存する"""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_format == 'parquet':
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, index=False, encoding='utf-8-sig')
+
+def check_balance_all_years(start_year: int = None, end_year: int = None, output_format: str = 'csv'):
+    """
+    複数の予算年度 (指定がなければ全年度) について、1回のクエリで予算総額と支出総額を比較する。
+    結果は年度ごとのファイルと、全年度をまとめたファイルに出力する。
+    """
+    settings = load_settings()
+    try:
+        db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+        results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
+    except KeyError as e:
+        print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
+        sys.exit(1)
+
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    conditions = ["予算年度 IS NOT NULL"]
+    if start_year is not None:
+        conditions.append(f"予算年度 >= {int(start_year)}")
+    if end_year is not None:
+        conditions.append(f"予算年度 <= {int(end_year)}")
+    range_label = f"{start_year or '最古'}〜{end_year or '最新'}"
+
+    print(f"--- 【{range_label}年度予算】を基準に、予算・支出バランスを一括でチェックします ---")
+
+    try:
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+    except Exception as e:
+        print(f"[エラー] DB接続に失敗しました: {e}", file=sys.stderr)
+        return
+
+    print("  - チェック中: 各年度の予算に対し、支出総額が超過している事業...")
+    try:
+        df = con.execute(build_balance_query(" AND ".join(conditions))).fetchdf()
+    except Exception as e:
+        print(f"    [エラー] クエリの実行に失敗しました: {e}")
+        con.close()
+        return
+    con.close()
+
+    if df.empty:
+        print("    -> 矛盾は見つかりませんでした。")
+        return
+
+    print("\n--- 年度別の予算超過件数 ---")
+    print(df.groupby('予算年度').size().rename('件数').to_string())
+    print("----------------------------")
+
+    extension = 'parquet' if output_format == 'parquet' else 'csv'
+    for year, year_df in df.groupby('予算年度'):
+        output_path = results_folder / f"project_balance_issue_list_{year}.{extension}"
+        save_result(year_df.drop(columns=['予算年度']), output_path, output_format)
+        print(f" -> {year}年度: {len(year_df)}件を '{output_path}' に保存しました。")
+
+    years = df['予算年度']
+    combined_path = results_folder / f"project_balance_issue_list_{years.min()}-{years.max()}.{extension}"
+    save_result(df, combined_path, output_format)
+    print(f"\n[成功] 全年度をまとめたリスト ({len(df)}件) を '{combined_path}' に保存しました。")
+
+def check_balance_by_year(target_year: int):
+    """
+    指定された「予算年度」に絞って、予算総額と支出総額を比較する。
     """
+    settings = load_settings()
+    try:
+        db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+        results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
+    except KeyError as e:
+        print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
+        sys.exit(1)
+    
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。`import_zips_to_duckdb.py` を実行してください。")
+        sys.exit(1)
+
+    print(f"--- 【{target_year}年度予算】を基準に、予算・支出バランスをチェックします ---")
+    
+    try:
+        con = duckdb.connect(database=str(db_file_path), read_only=True)
+    except Exception as e:
+        print(f"[エラー] DB接続に失敗しました: {e}", file=sys.stderr)
+        return
+
+    # 指定された年度の予算と、支出総額を比較するSQLクエリ
+    query = build_balance_query(f"予算年度 = {int(target_year)}")
     
     print(f"  - チェック中: {target_year}年度予算に対し、支出総額が超過している事業...")
     try:
-        df = con.execute(query).fetchdf()
+        df = con.execute(query).fetchdf().drop(columns=['予算年度'])
         if df.empty:
             print("    -> 矛盾は見つかりませんでした。")
             con.close()
@@ -127,7 +204,7 @@ def check_balance_by_year(target_year: int):
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description="指定された予算年度の予算と支出総額を比較し、矛盾を検出します。",
+        description="指定された予算年度 (または複数年度) の予算と支出総額を比較し、矛盾を検出します。",
         formatter_class=argparse.RawTextHelpFormatter
     )
     parser.add_argument(
@@ -137,5 +214,31 @@ if __name__ == '__main__':
         nargs='?',    # '?'は引数が0個か1個（省略可能）であることを示す
         help="比較対象とする予算年度 (例: 2023)。\n指定しない場合は、デフォルトで2024年度の予算と比較します。"
     )
+    parser.add_argument(
+        '--all-years',
+        action='store_true',
+        help="全ての予算年度を1回のクエリでまとめてチェックします。"
+    )
+    parser.add_argument(
+        '--years',
+        type=str,
+        help="チェックする予算年度の範囲を指定します (例: 2020-2024)。"
+    )
+    parser.add_argument(
+        '--format',
+        choices=['csv', 'parquet'],
+        default='csv',
+        help="複数年度モードでの出力形式 (デフォルト: csv)。"
+    )
     args = parser.parse_args()
-    check_balance_by_year(args.year)
\ No newline at end of file
+
+    if args.years:
+        try:
+            start, end = (int(y) for y in args.years.split('-'))
+        except ValueError:
+            parser.error("--years は '2020-2024' の形式で指定してください。")
+        check_balance_all_years(start, end, args.format)
+    elif args.all_years:
+        check_balance_all_years(output_format=args.format)
+    else:
+        check_balance_by_year(args.year)
@@ -0,0 +1,87 @@
+import duckdb
+import pandas as pd
+import hashlib
+import datetime
+from pathlib import Path
+
+# --- Embedding結果の永続キャッシュ ---
+# 「モデル名 + 文書テキスト」のハッシュをキーとしてEmbeddingを保存する (内容アドレス方式)。
+# 文書の並び順や件数が変わっても、テキストが同じであれば再計算せずに再利用できる。
+
+CACHE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        text_hash VARCHAR PRIMARY KEY,
+        model VARCHAR,
+        embedding FLOAT[],
+        created_at TIMESTAMP
+    )
+"""
+
+def text_hash(text: str, model: str) -> str:
+    """モデル名と文書テキストから、キャッシュのキー (SHA-256) を計算する"""
+    return hashlib.sha256(f"{model}\x1f{text}".encode('utf-8')).hexdigest()
+
+class EmbeddingCache:
+    """
+    Embedding結果をDuckDBファイルに保存し、テキストのハッシュで引くキャッシュ。
+    with文で使うと、終了時に接続を閉じる。
+    """
+
+    def __init__(self, cache_db_path: Path, model: str):
+        self.cache_db_path = Path(cache_db_path)
+        self.model = model
+        self.cache_db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = duckdb.connect(database=str(self.cache_db_path))
+        self.con.execute(CACHE_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.con.close()
+
+    def hashes(self, texts: list) -> list:
+        """テキストのリストを、キャッシュのキーのリストに変換する"""
+        return [text_hash(text, self.model) for text in texts]
+
+    def lookup(self, hashes: list) -> dict:
+        """キャッシュ済みのEmbeddingを {ハッシュ: ベクトル} で返す (見つからないものは含まない)"""
+        if not hashes:
+            return {}
+        keys_df = pd.DataFrame({'text_hash': list(dict.fromkeys(hashes))})
+        self.con.register('lookup_keys_df', keys_df)
+        try:
+            rows = self.con.execute("""
+                SELECT c.text_hash, c.embedding
+                FROM embedding_cache AS c
+                JOIN lookup_keys_df AS k ON c.text_hash = k.text_hash
+            """).fetchall()
+        finally:
+            self.con.unregister('lookup_keys_df')
+        return dict(rows)
+
+    def put(self, hashes: list, embeddings: list):
+        """新しく計算したEmbeddingをキャッシュに追加する (既存のキーは上書きしない)"""
+        if not hashes:
+            return
+        new_df = pd.DataFrame({
+            'text_hash': hashes,
+            'model': self.model,
+            'embedding': embeddings,
+            'created_at': datetime.datetime.now(),
+        }).drop_duplicates(subset='text_hash')
+        self.con.register('new_embeddings_df', new_df)
+        try:
+            self.con.execute("""
+                INSERT OR IGNORE INTO embedding_cache
+                SELECT text_hash, model, CAST(embedding AS FLOAT[]), created_at FROM new_embeddings_df
+            """)
+        finally:
+            self.con.unregister('new_embeddings_df')
+
+    def count(self) -> int:
+        """このモデルでキャッシュ済みの件数"""
+        return self.con.execute("SELECT COUNT(*) FROM embedding_cache WHERE model = ?", [self.model]).fetchone()[0]
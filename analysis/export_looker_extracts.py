@@ -0,0 +1,238 @@
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import json
+import sys
+import shutil
+import hashlib
+import argparse
+import datetime
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+DEFAULT_OUTPUT_FOLDER = PROJECT_ROOT / "results" / "looker_extracts"
+MANIFEST_FILENAME = "_manifest.json"
+
+# パーティションのキー (Hive形式: <抽出名>/府省庁=<値>/事業年度=<値>/part-0.parquet)
+PARTITION_COLUMNS = ['府省庁', '事業年度']
+NULL_PARTITION_VALUE = '__HIVE_DEFAULT_PARTITION__'
+
+# Looker Studio 向けの抽出テーブル (いずれも府省庁・事業年度の列を持つこと)
+EXTRACTS = {
+    # 事業ごとの予算・執行 (summary_for_looker.sql の集計元)
+    "budget_execution": 'SELECT * FROM "予算・執行_サマリ"',
+    # 支出先ごとの支出 (明細行のみ。flatten_json_for_looker.py の平坦化データに相当)
+    "expenditure": 'SELECT * FROM "支出先_支出情報_明細"',
+    # 事業の担当組織
+    "organization": 'SELECT * FROM "基本情報_組織情報"',
+}
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def load_manifest(output_folder: Path) -> dict:
+    """前回の抽出結果 (パーティションごとのフィンガープリント) を読み込む"""
+    manifest_path = output_folder / MANIFEST_FILENAME
+    if not manifest_path.is_file():
+        return {}
+    with manifest_path.open('r', encoding='utf-8') as f:
+        return json.load(f)
+
+def partition_value_to_str(value) -> str:
+    """パーティションの値をディレクトリ名に使う文字列に変換する"""
+    if value is None:
+        return NULL_PARTITION_VALUE
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).replace('/', '_').replace('\\', '_')
+
+def partition_path(ministry, fiscal_year) -> str:
+    """パーティションの相対パス (例: '府省庁=内閣府/事業年度=2024')"""
+    return f"府省庁={partition_value_to_str(ministry)}/事業年度={partition_value_to_str(fiscal_year)}"
+
+def compute_partition_fingerprints(con: duckdb.DuckDBPyConnection, query: str) -> pd.DataFrame:
+    """
+    抽出クエリの結果をパーティションごとに集約し、行数とフィンガープリント (各行のmd5を並べたもののmd5) を計算する。
+    行の並び順に依存しないよう、行ハッシュをソートしてから連結する。
+    """
+    fingerprint_query = f"""
+        SELECT
+            府省庁,
+            事業年度,
+            COUNT(*) AS 行数,
+            md5(string_agg(row_hash, '' ORDER BY row_hash)) AS fingerprint
+        FROM (
+            SELECT 府省庁, 事業年度, md5(CAST(t AS VARCHAR)) AS row_hash
+            FROM ({query}) AS t
+        )
+        GROUP BY 府省庁, 事業年度
+    """
+    # 年度の NULL が NaN (float) に化けないよう、Pythonの値のまま受け取る
+    df = pd.DataFrame(
+        con.execute(fingerprint_query).fetchall(),
+        columns=PARTITION_COLUMNS + ['行数', 'fingerprint'],
+        dtype=object
+    )
+    df['partition'] = [partition_path(m, y) for m, y in zip(df['府省庁'], df['事業年度'])]
+    return df
+
+def fetch_partitions(con: duckdb.DuckDBPyConnection, query: str, partitions: pd.DataFrame) -> pa.Table:
+    """指定されたパーティションに属する行だけを、1回のクエリでArrowテーブルとして取得する"""
+    con.register('target_partitions', partitions[PARTITION_COLUMNS])
+    try:
+        return con.execute(f"""
+            SELECT t.*
+            FROM ({query}) AS t
+            WHERE EXISTS (
+                SELECT 1 FROM target_partitions AS p
+                WHERE p.府省庁 IS NOT DISTINCT FROM t.府省庁
+                  AND p.事業年度 IS NOT DISTINCT FROM t.事業年度
+            )
+        """).to_arrow_table()
+    finally:
+        con.unregister('target_partitions')
+
+def filter_partition(table: pa.Table, ministry, fiscal_year) -> pa.Table:
+    """Arrowテーブルから1パーティション分の行を取り出し、パーティション列を除いて返す (Hive形式ではパスが値を持つ)"""
+    masks = []
+    for column, value in zip(PARTITION_COLUMNS, (ministry, fiscal_year)):
+        if value is None:
+            masks.append(pc.is_null(table[column]))
+        else:
+            masks.append(pc.equal(table[column], pa.scalar(value, type=table.schema.field(column).type)))
+    return table.filter(pc.and_(*masks)).drop_columns(PARTITION_COLUMNS)
+
+def remove_partition(extract_folder: Path, partition: str):
+    """消えたパーティションのディレクトリを削除し、空になった親ディレクトリも片付ける"""
+    partition_folder = extract_folder / partition
+    if partition_folder.exists():
+        shutil.rmtree(partition_folder)
+    parent = partition_folder.parent
+    if parent.exists() and parent != extract_folder and not any(parent.iterdir()):
+        parent.rmdir()
+
+def export_extract(con: duckdb.DuckDBPyConnection, name: str, query: str, output_folder: Path,
+                   previous: dict, force: bool = False) -> dict:
+    """
+    1つの抽出テーブルをパーティション単位で出力する。
+    前回とフィンガープリントが同じパーティションは書き直さない。
+    返り値はマニフェストに保存する、この抽出テーブルの状態。
+    """
+    extract_folder = output_folder / name
+    query_sha256 = hashlib.sha256(query.encode('utf-8')).hexdigest()
+    previous_partitions = previous.get('partitions', {})
+    # 抽出クエリ自体が変わった場合は、全パーティションを書き直す
+    if force or previous.get('query_sha256') != query_sha256:
+        previous_partitions = {}
+
+    fingerprints = compute_partition_fingerprints(con, query)
+    changed = fingerprints[[
+        previous_partitions.get(p, {}).get('fingerprint') != fp or not (extract_folder / p).exists()
+        for p, fp in zip(fingerprints['partition'], fingerprints['fingerprint'])
+    ]]
+    removed = sorted(set(previous.get('partitions', {})) - set(fingerprints['partition']))
+
+    print(f"\n--- 抽出 '{name}': 全{len(fingerprints)}パーティション / 変更 {len(changed)}件 / 削除 {len(removed)}件 ---")
+
+    partitions_state = {
+        p: previous_partitions[p]
+        for p in fingerprints['partition']
+        if p in previous_partitions and p not in set(changed['partition'])
+    }
+
+    if not changed.empty:
+        table = fetch_partitions(con, query, changed)
+        for row in changed.itertuples(index=False):
+            partition_folder = extract_folder / row.partition
+            partition_folder.mkdir(parents=True, exist_ok=True)
+            file_path = partition_folder / "part-0.parquet"
+            pq.write_table(filter_partition(table, row.府省庁, row.事業年度), file_path)
+            bytes_written = file_path.stat().st_size
+            partitions_state[row.partition] = {
+                'fingerprint': row.fingerprint,
+                'rows': int(row.行数),
+                'bytes': bytes_written,
+            }
+            print(f" -> 書き込み: {row.partition} ({int(row.行数):,}行, {bytes_written:,} bytes)")
+
+    for partition in removed:
+        remove_partition(extract_folder, partition)
+        print(f" -> 削除: {partition}")
+
+    bytes_written = sum(partitions_state[p]['bytes'] for p in changed['partition'])
+    total_bytes = sum(state['bytes'] for state in partitions_state.values())
+    print(f" -> 書き込み合計: {bytes_written:,} bytes (抽出全体 {total_bytes:,} bytes)")
+
+    return {'query_sha256': query_sha256, 'partitions': dict(sorted(partitions_state.items()))}
+
+def export_looker_extracts(extract_names: list = None, output_folder: Path = DEFAULT_OUTPUT_FOLDER, force: bool = False):
+    """
+    Looker Studio 向けの抽出テーブルを、府省庁・事業年度でパーティション分割したParquetとして出力する。
+    前回の出力から内容が変わったパーティションだけを書き直す。
+    """
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。")
+        sys.exit(1)
+
+    extract_names = extract_names or list(EXTRACTS)
+    unknown = [name for name in extract_names if name not in EXTRACTS]
+    if unknown:
+        print(f"[エラー] 未定義の抽出名です: {', '.join(unknown)} (定義済み: {', '.join(EXTRACTS)})")
+        sys.exit(1)
+
+    output_folder.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(output_folder)
+    extracts_state = manifest.get('extracts', {})
+
+    print(f"--- Looker Studio 向け抽出を開始します (出力先: '{output_folder}') ---")
+    con = duckdb.connect(database=str(db_file_path), read_only=True)
+    try:
+        for name in extract_names:
+            extracts_state[name] = export_extract(con, name, EXTRACTS[name], output_folder, extracts_state.get(name, {}), force)
+    finally:
+        con.close()
+
+    manifest = {
+        'updated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'extracts': extracts_state,
+    }
+    with (output_folder / MANIFEST_FILENAME).open('w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"\n[成功] 抽出が完了しました。マニフェスト: '{output_folder / MANIFEST_FILENAME}'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Looker Studio 向けの抽出テーブルを、府省庁・事業年度で分割したParquet (Hive形式) として出力します。\n前回から内容が変わったパーティションだけを書き直します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        'extracts',
+        type=str,
+        nargs='*',
+        help=f"出力する抽出名 (省略時はすべて)。\n定義済み: {', '.join(EXTRACTS)}"
+    )
+    parser.add_argument('--output-dir', type=str, default=None, help="出力先フォルダ (デフォルト: results/looker_extracts)")
+    parser.add_argument('--force', action='store_true', help="前回の結果を無視して、全パーティションを書き直します。")
+    args = parser.parse_args()
+
+    output_folder = PROJECT_ROOT / args.output_dir if args.output_dir else DEFAULT_OUTPUT_FOLDER
+    export_looker_extracts(args.extracts, output_folder, args.force)
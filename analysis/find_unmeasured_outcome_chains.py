@@ -0,0 +1,81 @@
+import duckdb
+import pandas as pd
+import argparse
+import sys
+import json
+from pathlib import Path
+
+# --- プロジェクトルートを基準にパスを解決 ---
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+# ---------------------------------------------
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.build_outcome_chains import find_unmeasured_chains
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def find_unmeasured_outcome_chains(final_only: bool = False):
+    """
+    効果発現経路のチェーン表 (outcome_chains) を使い、実績値が測定されていないチェーンを持つ事業を抽出する。
+    """
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
+
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。")
+        sys.exit(1)
+
+    target = "最終アウトカムに実績値が無い" if final_only else "どのノードにも実績値が無い"
+    print(f"--- {target}チェーンを持つ事業を検索します ---")
+    con = duckdb.connect(database=str(db_file_path), read_only=True)
+    try:
+        df = find_unmeasured_chains(con, final_only)
+    except duckdb.CatalogException:
+        print("[エラー] チェーン表 'outcome_chains' が見つかりません。最新の `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+        con.close()
+        sys.exit(1)
+    total_businesses = con.execute("SELECT COUNT(DISTINCT 予算事業ID) FROM outcome_chains").fetchone()[0]
+    con.close()
+
+    if df.empty:
+        print(" -> 該当する事業はありませんでした。")
+        return
+
+    print(f" -> チェーンを持つ{total_businesses:,}事業のうち、{len(df):,}事業が該当しました。")
+    pd.set_option('display.max_columns', None)
+    pd.set_option('display.width', 150)
+    print(df.head(20))
+
+    output_filename = "unmeasured_outcome_chains_final.csv" if final_only else "unmeasured_outcome_chains.csv"
+    output_path = results_folder / output_filename
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(output_path, index=False, encoding='utf-8-sig')
+    print(f"\n[成功] 事業の一覧を '{output_path}' に保存しました。")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="効果発現経路のチェーンのうち、実績値が測定されていないものを持つ事業を抽出します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '--final-only',
+        action='store_true',
+        help="チェーン全体ではなく、最終アウトカム (チェーンの終点) に実績値が無いものを対象とします。"
+    )
+    args = parser.parse_args()
+
+    find_unmeasured_outcome_chains(args.final_only)
@@ -1,5 +1,10 @@
+import duckdb
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import json
+import re
+import yaml
 from pathlib import Path
 import argparse
 import sys
@@ -11,53 +16,297 @@ except NameError:
     # 対話モードなどで __file__ が未定義の場合
     PROJECT_ROOT = Path().cwd()
 
-def flatten_json_to_csv(json_file_path: Path, output_csv_path: Path):
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+SCHEMA_FILE = PROJECT_ROOT / 'schema.yaml'
+
+# 平坦化の対象 (1行 = 1支出先レコード) と、各行に付与する事業単位の項目
+RECORD_VIEW = '支出先_支出情報'
+META_VIEW = '基本情報_組織情報'
+
+# schema.yaml の型 → Parquetの列の型
+ARROW_TYPES = {
+    'BIGINT': pa.int64(),
+    'INTEGER': pa.int32(),
+    'DOUBLE': pa.float64(),
+    'BOOLEAN': pa.bool_(),
+    'VARCHAR': pa.string(),
+}
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
+        sys.exit(1)
+
+def iter_json_documents(json_file_path: Path, chunk_size: int = 1 << 20):
     """
-    階層化された事業詳細JSONを読み込み、平坦化してCSVに出力する
+    JSONファイルから事業ドキュメントを1件ずつ読み出す (ファイル全体をメモリに載せない)。
+    次の形式に対応する:
+      - 単一のJSONオブジェクト (get_business_details.py の単一ID出力)
+      - JSON Lines (get_business_details.py の一括モード出力)
+      - 事業ドキュメントのJSON配列
+    バッファ内の読み取り位置 (pos) を進めながら解析し、読み終えた部分は追加読み込みの時にまとめて捨てる。
     """
-    print(f"--- JSONファイル '{json_file_path}' を読み込んでいます... ---")
+    decoder = json.JSONDecoder()
     with json_file_path.open('r', encoding='utf-8') as f:
-        data = json.load(f)
+        buffer = f.read(chunk_size).lstrip()
+        pos = 0
+        in_array = buffer.startswith('[')
+        if in_array:
+            pos = 1
+        eof = False
+        while True:
+            # 要素間の区切り (空白・改行・配列のカンマ) を読み飛ばす
+            pos = WHITESPACE.match(buffer, pos).end()
+            if in_array and buffer.startswith(',', pos):
+                pos = WHITESPACE.match(buffer, pos + 1).end()
+            if in_array and buffer.startswith(']', pos):
+                return
+            if pos < len(buffer):
+                try:
+                    document, pos = decoder.raw_decode(buffer, pos)
+                    yield document
+                    continue
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                return
+            # ドキュメントが途中で切れている場合は、続きを読み込んで再試行する。
+            # 未解析の部分が大きいほど多く読み込み、1件の巨大なドキュメントでも再解析の回数を抑える
+            buffer = buffer[pos:]
+            pos = 0
+            chunk = f.read(max(chunk_size, len(buffer)))
+            if not chunk:
+                eof = True
+            buffer += chunk
+
+def load_record_column_types() -> dict:
+    """
+    schema.yaml から、平坦化する行の列の型を {列名: pyarrowの型} で返す。
+    schema.yaml が読めない場合は空の辞書を返す (列の型は最初のバッチから推定する)。
+    """
+    try:
+        with SCHEMA_FILE.open('r', encoding='utf-8') as f:
+            schema = yaml.safe_load(f)
+    except Exception as e:
+        print(f" !! 警告: '{SCHEMA_FILE}' を読み込めないため、列の型は最初のバッチから推定します: {e}", file=sys.stderr)
+        return {}
+    column_types = {'担当府省庁': pa.string()}
+    for table in schema.values():
+        if table['view_name'] == RECORD_VIEW:
+            column_types.update({
+                column['name']: ARROW_TYPES.get(column['type'], pa.string()) for column in table['columns']
+            })
+    return column_types
+
+def flatten_document(document: dict) -> list:
+    """事業ドキュメント1件を、支出先レコード単位の平坦な行リストに変換する"""
+    records = document.get(RECORD_VIEW)
+    if records is None:
+        return []
+    if isinstance(records, dict):
+        records = [records]
+
+    meta = document.get(META_VIEW) or {}
+    if isinstance(meta, list):
+        meta = meta[0] if meta else {}
+    ministry = meta.get('府省庁')
+
+    return [{**record, '担当府省庁': ministry} for record in records]
+
+class BatchWriter:
+    """
+    平坦化した行をバッチ単位でCSVまたはParquetに追記する (列構成は最初のバッチに合わせる)。
+    Parquetの列の型は column_types (schema.yaml の型) で固定し、各バッチをその型に変換して書き込む。
+    column_types に無い列だけ最初のバッチから型を推定する (全て空の列は文字列型とする)。
+    """
+
+    def __init__(self, output_path: Path, column_types: dict = None):
+        self.output_path = output_path
+        self.output_format = 'parquet' if output_path.suffix == '.parquet' else 'csv'
+        self.column_types = column_types or {}
+        self.columns = None
+        self.schema = None
+        self.parquet_writer = None
+        self.rows_written = 0
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _from_pandas(df: pd.DataFrame) -> pa.Table:
+        """DataFrameを列ごとにpyarrowに変換する (数値と文字列が混在する列は、値を文字列にする)"""
+        arrays = []
+        for column in df.columns:
+            try:
+                arrays.append(pa.array(df[column], from_pandas=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrays.append(pa.array(df[column].map(lambda v: None if pd.isna(v) else str(v)), type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=[str(column) for column in df.columns])
+
+    def _to_table(self, table: pa.Table) -> pa.Table:
+        """バッチを、書き込み先のスキーマの列順・型に揃えたpyarrowのテーブルにする (バッチに無い列は空)"""
+        arrays = []
+        for field in self.schema:
+            if field.name not in table.column_names:
+                arrays.append(pa.nulls(table.num_rows, field.type))
+                continue
+            array = table.column(field.name)
+            try:
+                array = array.cast(field.type, safe=False)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+                if not pa.types.is_string(field.type):
+                    raise
+                # 文字列型の列に数値などが混在する場合は、値を文字列にしてから変換する
+                array = pa.array([None if v is None else str(v) for v in array.to_pylist()], type=pa.string())
+            arrays.append(array)
+        return pa.Table.from_arrays(arrays, schema=self.schema)
 
-    # --- json_normalizeの引数を修正 ---
+    def write(self, batch):
+        """
+        バッチ (pandasのDataFrame、またはpyarrowの RecordBatch / Table) を追記する。
+        Parquetへの出力では、pyarrowのバッチをpandasに変換せずにそのまま書き込む。
+        """
+        if isinstance(batch, pa.RecordBatch):
+            batch = pa.Table.from_batches([batch])
+        if len(batch) == 0:
+            return
+        if self.columns is None:
+            self.columns = list(batch.column_names if isinstance(batch, pa.Table) else batch.columns)
+
+        if self.output_format == 'parquet':
+            table = batch if isinstance(batch, pa.Table) else self._from_pandas(batch)
+            if self.parquet_writer is None:
+                fields = []
+                for field in table.schema:
+                    if field.name in self.column_types:
+                        field = field.with_type(self.column_types[field.name])
+                    elif pa.types.is_null(field.type):
+                        field = field.with_type(pa.string())
+                    fields.append(field)
+                self.schema = pa.schema(fields)
+                self.parquet_writer = pq.ParquetWriter(self.output_path, self.schema)
+            self.parquet_writer.write_table(self._to_table(table))
+        else:
+            df = batch.to_pandas() if isinstance(batch, pa.Table) else batch
+            df.reindex(columns=self.columns).to_csv(
+                self.output_path,
+                mode='w' if self.rows_written == 0 else 'a',
+                header=self.rows_written == 0,
+                index=False,
+                encoding='utf-8-sig' if self.rows_written == 0 else 'utf-8'
+            )
+        self.rows_written += len(batch)
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+def flatten_json_to_csv(json_file_path: Path, output_csv_path: Path, batch_size: int = 50000):
+    """
+    階層化された事業詳細JSON (単一オブジェクト / JSON Lines / 配列) を逐次読み込み、
+    平坦化した行をバッチ単位でCSV (拡張子が .parquet の場合はParquet) に出力する
+    """
+    print(f"--- JSONファイル '{json_file_path}' を逐次読み込んでいます... ---")
+    writer = BatchWriter(output_csv_path, load_record_column_types())
+    rows = []
+    documents = 0
     try:
-        # ▼▼▼【変更点】meta引数から衝突の原因となる '予算事業ID' と '事業名' を削除 ▼▼▼
-        # これらの情報は、record_pathで指定した '支出先_支出情報' の中にも
-        # 同じものが含まれているため、metaで指定する必要はありません。
-        df_flat = pd.json_normalize(
-            data,
-            record_path=['支出先_支出情報'],
-            meta=[
-                # ネストしたオブジェクトから値を取り出す場合はリストで階層を指定
-                ['基本情報_組織情報', '府省庁']
-            ]
-        )
-    except KeyError as e:
-        print(f"\n[エラー] JSONファイルに必要なキー {e} が見つかりませんでした。")
-        print("  - '支出先_支出情報' や '基本情報_組織情報' がJSONに含まれているか確認してください。")
+        for document in iter_json_documents(json_file_path):
+            documents += 1
+            rows.extend(flatten_document(document))
+            if len(rows) >= batch_size:
+                writer.write(pd.DataFrame(rows))
+                rows = []
+        writer.write(pd.DataFrame(rows))
+    except json.JSONDecodeError as e:
+        print(f"\n[エラー] JSONの解析に失敗しました: {e}")
+        sys.exit(1)
+    finally:
+        writer.close()
+
+    if writer.rows_written == 0:
+        print(f"\n[エラー] JSONファイルに '{RECORD_VIEW}' のレコードが見つかりませんでした。")
+        print(f"  - '{RECORD_VIEW}' や '{META_VIEW}' がJSONに含まれているか確認してください。")
+        sys.exit(1)
+
+    print(f"--- {documents}件の事業から {writer.rows_written}行 の平坦化データを '{output_csv_path}' に保存しました ---")
+    print("[成功] 処理が完了しました。")
+
+def flatten_from_db(business_ids: list, db_file_path: Path, output_path: Path, batch_size: int = 50000):
+    """
+    JSONを経由せず、DuckDBから直接Looker Studio用の平坦なテーブルを作成する。
+    business_ids に 'all' を含む場合は全事業を対象とする。
+    """
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。")
         sys.exit(1)
-    
-    # カラム名を分かりやすく変更
-    df_flat = df_flat.rename(columns={
-        '基本情報_組織情報.府省庁': '担当府省庁'
-    })
-
-    print(f"--- 平坦化されたデータを '{output_csv_path}' に保存します... ---")
-    output_csv_path.parent.mkdir(parents=True, exist_ok=True)
-    df_flat.to_csv(output_csv_path, index=False, encoding='utf-8-sig')
+
+    id_filter = ""
+    params = []
+    if 'all' not in business_ids:
+        id_filter = "WHERE s.予算事業ID IN (SELECT UNNEST(?::BIGINT[]))"
+        params = [[int(i) for i in business_ids]]
+
+    query = f"""
+        SELECT s.*, o.府省庁 AS 担当府省庁
+        FROM "{RECORD_VIEW}" AS s
+        LEFT JOIN (
+            SELECT 予算事業ID, FIRST(府省庁) AS 府省庁 FROM "{META_VIEW}" GROUP BY 予算事業ID
+        ) AS o ON s.予算事業ID = o.予算事業ID
+        {id_filter}
+    """
+
+    print(f"--- データベース '{db_file_path}' から平坦化データを直接作成しています... ---")
+    con = duckdb.connect(database=str(db_file_path), read_only=True)
+    writer = BatchWriter(output_path, load_record_column_types())
+    try:
+        reader = con.execute(query, params).to_arrow_reader(batch_size)
+        for batch in reader:
+            writer.write(batch)
+    finally:
+        writer.close()
+        con.close()
+
+    print(f"--- {writer.rows_written}行 の平坦化データを '{output_path}' に保存しました ---")
     print("[成功] 処理が完了しました。")
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description="事業詳細JSONをLooker Studio用のCSVに変換します。")
-    parser.add_argument('json_file', type=str, help="入力元のJSONファイルパス。 (例: results/business_details_7259.json)")
-    parser.add_argument('output_csv', type=str, help="出力先のCSVファイル名。 (例: looker_ready_7259.csv)")
+    parser = argparse.ArgumentParser(
+        description="事業詳細JSONをLooker Studio用のCSV (またはParquet) に変換します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('json_file', type=str, nargs='?', help="入力元のJSONファイルパス。JSON Lines や JSON配列も可。 (例: results/business_details_7259.json)")
+    parser.add_argument('output_csv', type=str, nargs='?', help="出力先のファイル名。拡張子が .parquet の場合はParquetで出力。 (例: looker_ready_7259.csv)")
+    parser.add_argument(
+        '--from-db',
+        type=str,
+        nargs='+',
+        metavar='ID',
+        help="JSONを経由せず、DBから直接平坦化データを作成します。\n予算事業IDを複数指定するか、'all' で全事業を対象とします。"
+    )
+    parser.add_argument('-o', '--output', type=str, default="looker_ready_all.csv", help="--from-db モードでの出力ファイル名 (デフォルト: looker_ready_all.csv)")
+    parser.add_argument('--batch-size', type=int, default=50000, help="1回に書き出す行数 (デフォルト: 50000)")
     args = parser.parse_args()
 
-    input_path = PROJECT_ROOT / args.json_file
     # 出力先は `results` フォルダに固定
-    output_path = PROJECT_ROOT / "results" / args.output_csv
+    results_folder = PROJECT_ROOT / "results"
 
-    if not input_path.is_file():
-        print(f"[エラー] 入力ファイル '{input_path}' が見つかりません。")
+    if args.from_db:
+        settings = load_settings()
+        db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+        flatten_from_db(args.from_db, db_file_path, results_folder / args.output, args.batch_size)
     else:
-        flatten_json_to_csv(input_path, output_path)
\ No newline at end of file
+        if not args.json_file or not args.output_csv:
+            parser.error("入力JSONファイルと出力ファイル名を指定するか、--from-db を指定してください。")
+        input_path = PROJECT_ROOT / args.json_file
+        output_path = results_folder / args.output_csv
+
+        if not input_path.is_file():
+            print(f"[エラー] 入力ファイル '{input_path}' が見つかりません。")
+        else:
+            flatten_json_to_csv(input_path, output_path, args.batch_size)
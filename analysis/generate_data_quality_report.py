@@ -2,6 +2,9 @@ import duckdb
 import pandas as pd
 import sys
 import json
+import hashlib
+import argparse
+import datetime
 from pathlib import Path
 
 # --- (パス解決コードは変更なし) ---
@@ -12,38 +15,48 @@ except NameError:
 
 SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
 
+# チェック項目の定義
+# - 'id' はルールを識別する一意なID
+# - 同じ 'view_name' を持つ行単位のチェックは、まとめて1回のスキャンで評価される
+#   (ルールを追加してもVIEWの全件スキャン回数は増えない)
 CHECKS_TO_PERFORM = [
     {
+        'id': "DQ01",
         'description': "【要注意】明細行なのに支出先名が空欄",
         'view_name': "支出先_支出情報",
         'condition': """ ("金額" IS NOT NULL AND "金額" != 0) AND ("支出先名" IS NULL OR "支出先名" = '') """,
         'columns_to_show': ['予算事業ID', '事業名', '支出先ブロック名', '金額', '契約概要']
     },
     {
+        'id': "DQ02",
         'description': "【要注意】明細行なのに契約情報が両方空欄",
         'view_name': "支出先_支出情報",
         'condition': """ ("金額" IS NOT NULL AND "金額" != 0) AND ("契約方式等" IS NULL OR "契約方式等" = '') AND ("契約概要" IS NULL OR "契約概要" = '') """,
         'columns_to_show': ['予算事業ID', '事業名', '支出先名', '金額']
     },
     {
+        'id': "DQ03",
         'description': "【要注意】事業の目的が空欄",
         'view_name': "基本情報_事業概要等",
         'condition': """ "事業の目的" IS NULL OR "事業の目的" = '' """,
         'columns_to_show': ['予算事業ID', '事業名', '府省庁']
     },
     {
+        'id': "DQ04",
         'description': "【参考】支出金額がマイナス",
         'view_name': "支出先_支出情報",
         'condition': """ "金額" < 0 """,
         'columns_to_show': ['予算事業ID', '事業名', '支出先名', '金額', '契約概要']
     },
     {
+        'id': "DQ05",
         'description': "【参考】支出に関する金額情報が一切ない",
         'view_name': "支出先_支出情報",
         'condition': """ ("金額" IS NULL OR "金額" = 0) AND ("ブロックの合計支出額" IS NULL OR "ブロックの合計支出額" = 0) AND ("支出先の合計支出額" IS NULL OR "支出先の合計支出額" = 0) """,
         'columns_to_show': ['予算事業ID', '事業名', '支出先ブロック名', '支出先名']
     },
     {
+        'id': "DQ06",
         'description': "【参考】事業全体の予算額が0以下",
         'view_name': "予算・執行_サマリ",
         'is_aggregated_query': True,
@@ -56,6 +69,7 @@ CHECKS_TO_PERFORM = [
     },
     {
         # ▼▼▼【変更点】このチェック項目の condition を更新▼▼▼
+        'id': "DQ07",
         'description': "【参考】役割が空欄だが金額のあるサマリー行",
         'view_name': "支出先_支出情報",
         # 「金額」が空で、「役割」も空だが、「ブロック合計額」には値がある、という条件
@@ -64,6 +78,22 @@ CHECKS_TO_PERFORM = [
     }
 ]
 
+# 差分モードで使用する履歴DBのテーブル定義
+HISTORY_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS dq_builds (
+        build_id VARCHAR, previous_build_id VARCHAR, evaluated_at TIMESTAMP
+    )""",
+    # ルールごとに、評価時点の元ZIPハッシュとルール定義のハッシュを記録する
+    """CREATE TABLE IF NOT EXISTS dq_rule_state (
+        build_id VARCHAR, rule_id VARCHAR, view_name VARCHAR,
+        source_sha256 VARCHAR, rule_sha256 VARCHAR, evaluated BOOLEAN
+    )""",
+    # 検出された問題行 (row_key は行の内容と、同じ内容の行の中での通し番号から計算するため、ビルドをまたいで安定)
+    """CREATE TABLE IF NOT EXISTS dq_issues (
+        build_id VARCHAR, rule_id VARCHAR, row_key VARCHAR, 予算事業ID BIGINT, row_json VARCHAR
+    )""",
+]
+
 def load_settings():
     # ... (変更なし)
     try:
@@ -73,6 +103,77 @@ def load_settings():
         print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗: {e}", file=sys.stderr)
         sys.exit(1)
 
+def group_checks_by_view(checks: list) -> dict:
+    """
+    行単位のチェック項目をVIEWごとにまとめる。集計クエリ型のチェック項目は対象外。
+    """
+    grouped = {}
+    for check in checks:
+        if check.get('is_aggregated_query'):
+            continue
+        grouped.setdefault(check['view_name'], []).append(check)
+    return grouped
+
+def build_fused_query(view_name: str, checks: list, key_columns: list = None) -> str:
+    """
+    同じVIEWに対する複数のチェック項目を、1回のスキャンで評価するSQLを組み立てる。
+    各行について該当したルールIDをCASE式のリストで求め、UNNESTでルールごとの行に展開する。
+    key_columns を指定した場合は、その列から計算した行キー(row_key)と表示列のJSON(row_json)も出力する。
+    行キーは「列の内容のハッシュ + 同じ内容の行の中での通し番号」とし、内容が完全に同じ重複行も別々の問題として数える。
+    """
+    rule_flags = ",\n".join(
+        f"CASE WHEN ({check['condition']}) THEN '{check['id']}' END" for check in checks
+    )
+    any_condition = "\n OR ".join(f"({check['condition']})" for check in checks)
+
+    # 全ルールで表示する列の和集合 (順序は最初に現れた順)
+    columns = list(dict.fromkeys(col for check in checks for col in check['columns_to_show']))
+    column_list = ", ".join(f'"{col}"' for col in columns)
+
+    row_key_columns = ""
+    if key_columns:
+        key_struct = ", ".join(f"'{col}': \"{col}\"" for col in key_columns)
+        shown_struct = ", ".join(f"'{col}': \"{col}\"" for col in columns)
+        row_key_columns = f""",
+            md5(to_json({{{key_struct}}})) AS content_key,
+            to_json({{{shown_struct}}}) AS row_json"""
+
+    query = f"""
+        SELECT
+            UNNEST(list_filter([{rule_flags}], x -> x IS NOT NULL)) AS rule_id,
+            {column_list}{row_key_columns}
+        FROM
+            "{view_name}"
+        WHERE
+            {any_condition}
+    """
+    if not key_columns:
+        return query
+    return f"""
+        SELECT
+            * EXCLUDE (content_key),
+            content_key || '-' || ROW_NUMBER() OVER (PARTITION BY rule_id, content_key) AS row_key
+        FROM ({query})
+    """
+
+def run_fused_checks(con: duckdb.DuckDBPyConnection, view_name: str, checks: list, with_row_key: bool = False) -> dict:
+    """
+    VIEWを1回だけスキャンして全チェック項目を評価し、ルールIDごとの問題リスト(DataFrame)を返す。
+    with_row_key=True の場合、行全体の内容から求めた安定な行キー(row_key)と row_json 列も付与する。
+    """
+    key_columns = None
+    if with_row_key:
+        key_columns = [c[0] for c in con.execute(f'DESCRIBE "{view_name}"').fetchall()]
+    fused_df = con.execute(build_fused_query(view_name, checks, key_columns)).fetchdf()
+
+    results = {}
+    for check in checks:
+        output_columns = check['columns_to_show'] + (['row_key', 'row_json'] if with_row_key else [])
+        df = fused_df.loc[fused_df['rule_id'] == check['id'], output_columns].reset_index(drop=True)
+        df.insert(0, '問題の理由', check['description'])
+        results[check['id']] = df
+    return results
+
 def generate_report():
     # ... (変更なし)
     settings = load_settings()
@@ -85,35 +186,39 @@ def generate_report():
 
     con = duckdb.connect(database=str(db_file_path), read_only=True)
     
-    all_issues_dfs = []
+    issues_by_rule = {}
     print("--- データ品質チェックを開始します ---")
 
+    # --- 行単位のチェック: VIEWごとに1回のスキャンで全ルールを評価 ---
+    for view_name, checks in group_checks_by_view(CHECKS_TO_PERFORM).items():
+        print(f"  - スキャン中: VIEW '{view_name}' ({len(checks)}ルール)...")
+        try:
+            issues_by_rule.update(run_fused_checks(con, view_name, checks))
+        except Exception as e:
+            print(f"    [エラー] チェック中にエラーが発生しました: {e}")
+
+    # --- 集計クエリ型のチェック: 個別に実行 ---
     for check in CHECKS_TO_PERFORM:
-        print(f"  - チェック中: {check['description']}...")
+        if not check.get('is_aggregated_query'):
+            continue
+        print(f"  - 集計チェック中: {check['description']}...")
         try:
-            if check.get('is_aggregated_query'):
-                df = con.execute(check['query']).fetchdf()
-            else:
-                columns = '", "'.join(check['columns_to_show'])
-                query = f"""
-                    SELECT
-                        '{check['description']}' AS "問題の理由",
-                        "{columns}"
-                    FROM
-                        "{check['view_name']}"
-                    WHERE
-                        {check['condition']}
-                """
-                df = con.execute(query).fetchdf()
-            
-            if not df.empty:
-                print(f"    -> {len(df)}件の問題を検出しました。")
-                all_issues_dfs.append(df)
-            else:
-                print("    -> 問題は見つかりませんでした。")
+            issues_by_rule[check['id']] = con.execute(check['query']).fetchdf()
         except Exception as e:
             print(f"    [エラー] チェック中にエラーが発生しました: {e}")
 
+    # --- ルールごとの結果を、定義順に長いリストへ展開 ---
+    all_issues_dfs = []
+    for check in CHECKS_TO_PERFORM:
+        df = issues_by_rule.get(check['id'])
+        if df is None:
+            continue
+        if not df.empty:
+            print(f"  - {check['description']}: {len(df)}件の問題を検出しました。")
+            all_issues_dfs.append(df)
+        else:
+            print(f"  - {check['description']}: 問題は見つかりませんでした。")
+
     con.close()
 
     if not all_issues_dfs:
@@ -136,5 +241,209 @@ def generate_report():
     print(f"\n[成功] 詳細な問題リストを '{output_path}' に保存しました。")
 
 
+def rule_sha256(check: dict) -> str:
+    """ルール定義 (条件式・表示列・集計クエリ) のハッシュを計算する。ルールが変更されたら再評価するために使う"""
+    definition = check.get('query') or f"{check['condition']}|{','.join(check['columns_to_show'])}"
+    return hashlib.sha256(f"{check['view_name']}|{definition}".encode('utf-8')).hexdigest()
+
+def run_aggregated_check_with_row_key(con: duckdb.DuckDBPyConnection, check: dict) -> pd.DataFrame:
+    """集計クエリ型のチェックを実行し、結果行の内容から row_key と row_json を付与する (結果は小さいためPython側で計算)"""
+    df = con.execute(check['query']).fetchdf()
+    records = json.loads(df.drop(columns=['問題の理由']).to_json(orient='records', force_ascii=False))
+    df['row_json'] = [json.dumps(record, ensure_ascii=False) for record in records]
+    content_keys = pd.Series([hashlib.md5(row_json.encode('utf-8')).hexdigest() for row_json in df['row_json']], index=df.index)
+    # 内容が同じ行は、通し番号を付けて別々の行キーにする (build_fused_query と同じ形式)
+    df['row_key'] = content_keys + '-' + (content_keys.groupby(content_keys).cumcount() + 1).astype(str)
+    return df
+
+def expand_issue_rows(issue_rows: pd.DataFrame) -> pd.DataFrame:
+    """履歴DBの問題行 (row_json) を、通常モードと同じ形式の長いリストに展開する"""
+    expanded_dfs = []
+    for check in CHECKS_TO_PERFORM:
+        rows = issue_rows.loc[issue_rows['rule_id'] == check['id'], 'row_json']
+        if rows.empty:
+            continue
+        df = pd.DataFrame([json.loads(row_json) for row_json in rows])
+        if 'columns_to_show' in check:
+            df = df[check['columns_to_show']]
+        df.insert(0, '問題の理由', check['description'])
+        expanded_dfs.append(df)
+    return pd.concat(expanded_dfs, ignore_index=True) if expanded_dfs else pd.DataFrame()
+
+def generate_incremental_report():
+    """
+    データ品質チェックを差分モードで実行する。
+    前回ビルドから元ZIPが変わっていないVIEWのルールは再評価せずに結果を引き継ぎ、
+    ルールごとに「新規」「解消」「継続」の問題件数を報告する。
+    """
+    settings = load_settings()
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+    results_folder = PROJECT_ROOT / settings['query_runner']['results_folder']
+    history_db_path = PROJECT_ROOT / settings.get('data_quality', {}).get('history_db_file', 'results/data_quality_history.duckdb')
+
+    if not db_file_path.is_file():
+        print(f"[エラー] DBファイル '{db_file_path}' が見つかりません。")
+        sys.exit(1)
+
+    con = duckdb.connect(database=str(db_file_path), read_only=True)
+    try:
+        manifest_df = con.execute("SELECT build_id, view_name, source_sha256 FROM import_manifest").fetchdf()
+    except Exception as e:
+        print(f"[エラー] 'import_manifest' の読み込みに失敗しました: {e}", file=sys.stderr)
+        print("  -> 最新の `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+        con.close()
+        sys.exit(1)
+
+    build_id = manifest_df['build_id'].iloc[0]
+    source_hash_by_view = dict(zip(manifest_df['view_name'], manifest_df['source_sha256']))
+
+    history_db_path.parent.mkdir(parents=True, exist_ok=True)
+    hist = duckdb.connect(database=str(history_db_path))
+    for ddl in HISTORY_SCHEMA:
+        hist.execute(ddl)
+
+    previous_build_id = hist.execute("SELECT MAX(build_id) FROM dq_builds WHERE build_id < ?", [build_id]).fetchone()[0]
+    # 同じビルドに対する再実行の場合は、そのビルドの記録を作り直す
+    for table_name in ('dq_builds', 'dq_rule_state', 'dq_issues'):
+        hist.execute(f"DELETE FROM {table_name} WHERE build_id = ?", [build_id])
+
+    print(f"--- データ品質チェック (差分モード) を開始します: ビルド {build_id} (前回: {previous_build_id or 'なし'}) ---")
+
+    previous_state = {}
+    if previous_build_id:
+        rows = hist.execute(
+            "SELECT rule_id, source_sha256, rule_sha256 FROM dq_rule_state WHERE build_id = ?", [previous_build_id]
+        ).fetchall()
+        previous_state = {rule_id: (source_hash, rule_hash) for rule_id, source_hash, rule_hash in rows}
+
+    # --- ルールごとに、前回結果を引き継げるか (元ZIPもルール定義も変わっていないか) を判定 ---
+    rule_states = []
+    carried_rule_ids = []
+    checks_to_evaluate = []
+    for check in CHECKS_TO_PERFORM:
+        source_hash = source_hash_by_view.get(check['view_name'])
+        rule_hash = rule_sha256(check)
+        reusable = source_hash is not None and previous_state.get(check['id']) == (source_hash, rule_hash)
+        rule_states.append({
+            'build_id': build_id, 'rule_id': check['id'], 'view_name': check['view_name'],
+            'source_sha256': source_hash, 'rule_sha256': rule_hash, 'evaluated': not reusable
+        })
+        if reusable:
+            carried_rule_ids.append(check['id'])
+        else:
+            checks_to_evaluate.append(check)
+
+    if carried_rule_ids:
+        print(f"  - 元データに変更がないため、前回の結果を引き継ぎます: {', '.join(carried_rule_ids)}")
+        hist.execute("""
+            INSERT INTO dq_issues
+            SELECT ?, rule_id, row_key, 予算事業ID, row_json
+            FROM dq_issues
+            WHERE build_id = ? AND list_contains(?, rule_id)
+        """, [build_id, previous_build_id, carried_rule_ids])
+
+    # --- 変更のあったVIEWのルールのみ再評価 (VIEWごとに1回のスキャン) ---
+    new_issue_dfs = []
+    for view_name, checks in group_checks_by_view(checks_to_evaluate).items():
+        print(f"  - 再評価中: VIEW '{view_name}' ({len(checks)}ルール)...")
+        try:
+            for rule_id, df in run_fused_checks(con, view_name, checks, with_row_key=True).items():
+                new_issue_dfs.append(df.assign(rule_id=rule_id))
+        except Exception as e:
+            print(f"    [エラー] チェック中にエラーが発生しました: {e}")
+    for check in checks_to_evaluate:
+        if not check.get('is_aggregated_query'):
+            continue
+        print(f"  - 再評価中: {check['description']}...")
+        try:
+            new_issue_dfs.append(run_aggregated_check_with_row_key(con, check).assign(rule_id=check['id']))
+        except Exception as e:
+            print(f"    [エラー] チェック中にエラーが発生しました: {e}")
+    con.close()
+
+    if new_issue_dfs:
+        new_issues_df = pd.concat(
+            [df[['rule_id', 'row_key', '予算事業ID', 'row_json']] for df in new_issue_dfs], ignore_index=True
+        )
+        hist.register('new_issues_df', new_issues_df)
+        hist.execute("""
+            INSERT INTO dq_issues
+            SELECT ?, rule_id, row_key, CAST(予算事業ID AS BIGINT), row_json FROM new_issues_df
+        """, [build_id])
+        hist.unregister('new_issues_df')
+
+    hist.register('rule_states_df', pd.DataFrame(rule_states))
+    hist.execute("INSERT INTO dq_rule_state SELECT * FROM rule_states_df")
+    hist.unregister('rule_states_df')
+    hist.execute("INSERT INTO dq_builds VALUES (?, ?, ?)", [build_id, previous_build_id, datetime.datetime.now()])
+
+    # --- 前回ビルドとの比較: 新規・解消・継続 ---
+    changes_df = hist.execute("""
+        WITH
+        Current AS (SELECT DISTINCT rule_id, row_key FROM dq_issues WHERE build_id = ?),
+        Previous AS (SELECT DISTINCT rule_id, row_key FROM dq_issues WHERE build_id = ?)
+        SELECT
+            COALESCE(c.rule_id, p.rule_id) AS rule_id,
+            COUNT(*) FILTER (WHERE p.row_key IS NULL) AS 新規,
+            COUNT(*) FILTER (WHERE c.row_key IS NULL) AS 解消,
+            COUNT(*) FILTER (WHERE c.row_key IS NOT NULL AND p.row_key IS NOT NULL) AS 継続
+        FROM Current AS c
+        FULL OUTER JOIN Previous AS p ON c.rule_id = p.rule_id AND c.row_key = p.row_key
+        GROUP BY 1
+        ORDER BY 1
+    """, [build_id, previous_build_id]).fetchdf()
+    descriptions = {check['id']: check['description'] for check in CHECKS_TO_PERFORM}
+    changes_df.insert(1, '問題の理由', changes_df['rule_id'].map(descriptions))
+
+    # --- ビルドごとの推移 ---
+    trend_df = hist.execute("""
+        SELECT build_id, rule_id, COUNT(DISTINCT row_key) AS 件数
+        FROM dq_issues GROUP BY build_id, rule_id ORDER BY build_id, rule_id
+    """).fetchdf().pivot(index='build_id', columns='rule_id', values='件数').fillna(0).astype(int)
+
+    new_issue_rows = hist.execute("""
+        SELECT c.rule_id, c.row_json
+        FROM dq_issues AS c
+        WHERE c.build_id = ? AND NOT EXISTS (
+            SELECT 1 FROM dq_issues AS p
+            WHERE p.build_id = ? AND p.rule_id = c.rule_id AND p.row_key = c.row_key
+        )
+    """, [build_id, previous_build_id]).fetchdf()
+    current_rows = hist.execute("SELECT rule_id, row_json FROM dq_issues WHERE build_id = ?", [build_id]).fetchdf()
+    hist.close()
+
+    print("\n--- 前回ビルドからの変化 (ルール別) ---")
+    pd.set_option('display.width', 200)
+    print(changes_df.to_string(index=False))
+    print("---------------------------------")
+
+    results_folder.mkdir(parents=True, exist_ok=True)
+    outputs = {
+        "data_quality_long_list.csv": expand_issue_rows(current_rows),
+        "data_quality_new_issues.csv": expand_issue_rows(new_issue_rows),
+        "data_quality_changes.csv": changes_df,
+    }
+    for output_filename, df in outputs.items():
+        df.to_csv(results_folder / output_filename, index=False, encoding='utf-8-sig')
+    trend_df.to_csv(results_folder / "data_quality_trend.csv", encoding='utf-8-sig')
+
+    print(f"\n[成功] 差分レポートを '{results_folder}' に保存しました。")
+    print(f"  -> 履歴DB: '{history_db_path}'")
+
+
 if __name__ == '__main__':
-    generate_report()
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="データベース全体をスキャンし、品質が低い可能性のあるレコードをリストアップします。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help="差分モードで実行します。結果を履歴DBに蓄積し、元ZIPが変更されたVIEWのみを再評価して、\n前回ビルドからの新規・解消・継続の件数を報告します。"
+    )
+    args = parser.parse_args()
+
+    if args.incremental:
+        generate_incremental_report()
+    else:
+        generate_report()
\ No newline at end of file
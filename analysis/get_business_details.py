@@ -16,6 +16,10 @@ except NameError:
 SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
 # ---------------------------------------------
 
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.business_lookup import BusinessLookup, load_view_columns
+
 def load_settings():
     """
     プロジェクトルートにある設定ファイルを読み込み、設定内容の辞書を返す
@@ -37,67 +41,129 @@ def get_details_by_id(business_id: int, db_file_path: str):
     """
     指定された予算事業IDに紐づく全情報を取得し、階層型の辞書として返す
     """
-    # ... (この関数の中身は変更ありません) ...
     db_path = Path(db_file_path)
     if not db_path.is_file():
         print(f"[エラー] データベースファイル '{db_file_path}' が見つかりません。", file=sys.stderr)
         return None
 
     try:
-        con = duckdb.connect(database=str(db_path), read_only=True)
+        lookup = BusinessLookup(db_path, cache_size=1)
     except Exception as e:
         print(f"[エラー] DB接続に失敗: {e}", file=sys.stderr)
         return None
 
     print(f"--- 予算事業ID: {business_id} の情報を収集中... ---")
-    
+    with lookup:
+        result_json = lookup.get(business_id)
+
+    if result_json is None:
+        return {"予算事業ID": business_id, "事業名": "不明な事業"}
+    return result_json
+
+def resolve_business_ids(con: duckdb.DuckDBPyConnection, id_args: list, ids_file: str = None) -> list:
+    """コマンドライン引数・IDファイル・'all' の指定から、対象の予算事業IDリストを作成する"""
+    if 'all' in id_args:
+        rows = con.execute('SELECT DISTINCT 予算事業ID FROM "基本情報_組織情報" WHERE 予算事業ID IS NOT NULL ORDER BY 1').fetchall()
+        return [row[0] for row in rows]
+
+    business_ids = [int(i) for i in id_args]
+    if ids_file:
+        # 1行に1つのID (空行と '#' から始まる行は無視)
+        for line in Path(ids_file).read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                business_ids.append(int(line))
+    return list(dict.fromkeys(business_ids))
+
+def export_details_bulk(id_args: list, db_file_path: str, output_path: Path, ids_file: str = None, chunk_size: int = 1000):
+    """
+    複数の予算事業IDについて、事業ごとの階層型ドキュメントをJSON Lines形式で書き出す。
+    各VIEWにつき (IDのチャンクごとに) 1回のクエリで、事業単位の行リストをDuckDB内で集約 (list/struct) する。
+    """
+    db_path = Path(db_file_path)
+    if not db_path.is_file():
+        print(f"[エラー] データベースファイル '{db_file_path}' が見つかりません。", file=sys.stderr)
+        return
+
+    con = duckdb.connect(database=str(db_path), read_only=True)
     try:
-        main_info = con.execute(f'SELECT 事業名 FROM "基本情報_組織情報" WHERE 予算事業ID = {business_id} LIMIT 1').fetchdf()
-        business_name = main_info['事業名'][0] if not main_info.empty else "不明な事業"
-    except Exception:
-        business_name = "不明な事業"
+        business_ids = resolve_business_ids(con, id_args, ids_file)
+    except (ValueError, OSError) as e:
+        print(f"[エラー] 予算事業IDの指定が正しくありません: {e}", file=sys.stderr)
+        con.close()
+        return
 
-    result_json = {
-        "予算事業ID": business_id,
-        "事業名": business_name,
-    }
+    view_columns = load_view_columns(con)
+    chunk_size = chunk_size or len(business_ids) or 1
+    print(f"--- {len(business_ids)}件の事業を {len(view_columns)}個のVIEWから一括抽出します (チャンクサイズ: {chunk_size}) ---")
 
-    views_df = con.execute("SELECT view_name FROM table_index ORDER BY view_name").fetchdf()
-    views = views_df['view_name'].tolist()
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with output_path.open('w', encoding='utf-8') as out:
+        for start in range(0, len(business_ids), chunk_size):
+            chunk = business_ids[start:start + chunk_size]
 
-    for view_name in views:
-        print(f"  - VIEW '{view_name}' からデータを取得中...")
-        try:
-            if '予算事業ID' in [c[0] for c in con.execute(f'DESCRIBE "{view_name}"').fetchall()]:
-                df = con.execute(f'SELECT * FROM "{view_name}" WHERE 予算事業ID = {business_id}').fetchdf()
-                
-                if not df.empty:
-                    records = df.to_dict('records')
-                    if len(records) == 1:
-                        result_json[view_name] = records[0]
-                    else:
-                        result_json[view_name] = records
-            else:
-                 print(f"    [情報] VIEW '{view_name}' には予算事業IDがないためスキップします。")
+            names = dict(con.execute("""
+                SELECT 予算事業ID, FIRST(事業名)
+                FROM "基本情報_組織情報"
+                WHERE 予算事業ID IN (SELECT UNNEST(?::BIGINT[]))
+                GROUP BY 予算事業ID
+            """, [chunk]).fetchall())
+            documents = {
+                business_id: {"予算事業ID": business_id, "事業名": names.get(business_id, "不明な事業")}
+                for business_id in chunk
+            }
+
+            for view_name, columns in view_columns.items():
+                row_struct = ", ".join(f"'{col}': \"{col}\"" for col in columns)
+                try:
+                    rows = con.execute(f"""
+                        SELECT 予算事業ID, list({{{row_struct}}}) AS records
+                        FROM "{view_name}"
+                        WHERE 予算事業ID IN (SELECT UNNEST(?::BIGINT[]))
+                        GROUP BY 予算事業ID
+                    """, [chunk]).fetchall()
+                except Exception as e:
+                    print(f"    [警告] VIEW '{view_name}' の処理中にエラー: {e}")
+                    continue
+                for business_id, records in rows:
+                    # 単一レコードはオブジェクト、複数レコードは配列 (単一ID出力と同じ形式)
+                    documents[business_id][view_name] = records[0] if len(records) == 1 else records
+
+            for document in documents.values():
+                out.write(json.dumps(document, ensure_ascii=False, default=str) + "\n")
+            written += len(documents)
+            print(f"  - {written}/{len(business_ids)}件 書き出し完了")
 
-        except Exception as e:
-            print(f"    [警告] VIEW '{view_name}' の処理中にエラー: {e}")
-    
     con.close()
-    return result_json
+    print(f"\n[成功] {written}件の事業の全情報を '{output_path}' (JSON Lines) に保存しました。")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description="指定された予算事業IDに紐づく全情報をJSON形式で出力します。",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument('business_id', type=int, help="情報を取得したい予算事業ID (例: 7259)")
+    parser.add_argument(
+        'business_ids',
+        type=str,
+        nargs='*',
+        help="情報を取得したい予算事業ID (例: 7259)。\n複数指定、または 'all' (全事業) を指定すると一括モード (JSON Lines出力) になります。"
+    )
     parser.add_argument(
         '-o', '--output', 
         type=str, 
-        help="結果を保存するJSONの「ファイル名」(例: details.json)。\n指定しない場合はコンソールに直接出力します。"
+        help="結果を保存するJSONの「ファイル名」(例: details.json)。\n指定しない場合はコンソールに直接出力します。\n一括モードでは JSON Lines のファイル名 (デフォルト: business_details.jsonl)。"
+    )
+    parser.add_argument('--ids-file', type=str, help="一括モードで対象とする予算事業IDを1行に1つ記載したファイル。")
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=1000,
+        help="一括モードで1回のクエリにまとめる事業数 (デフォルト: 1000)。\n0を指定すると全事業を各VIEW1回のクエリで処理します。"
     )
     args = parser.parse_args()
+    if not args.business_ids and not args.ids_file:
+        parser.error("予算事業ID、'all'、または --ids-file のいずれかを指定してください。")
 
     settings = load_settings()
     try:
@@ -108,21 +174,31 @@ if __name__ == '__main__':
         print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
         sys.exit(1)
     
-    final_data = get_details_by_id(args.business_id, str(db_file))
+    # --- 一括モード: 複数ID / 'all' / IDファイル ---
+    if args.ids_file or len(args.business_ids) > 1 or 'all' in args.business_ids:
+        output_path = results_folder / (args.output or "business_details.jsonl")
+        export_details_bulk(args.business_ids, str(db_file), output_path, args.ids_file, args.chunk_size)
+    else:
+        try:
+            business_id = int(args.business_ids[0])
+        except ValueError:
+            parser.error(f"予算事業IDは整数で指定してください: {args.business_ids[0]}")
+
+        final_data = get_details_by_id(business_id, str(db_file))
 
-    if final_data:
-        json_output = json.dumps(final_data, indent=4, ensure_ascii=False)
+        if final_data:
+            json_output = json.dumps(final_data, indent=4, ensure_ascii=False)
         
-        if args.output:
-            # ▼▼▼【変更点2】出力パスを「結果フォルダ」と「指定ファイル名」で構築▼▼▼
-            output_path = results_folder / args.output
+            if args.output:
+                # ▼▼▼【変更点2】出力パスを「結果フォルダ」と「指定ファイル名」で構築▼▼▼
+                output_path = results_folder / args.output
             
-            # 結果フォルダが存在しない場合は作成
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+                # 結果フォルダが存在しない場合は作成
+                output_path.parent.mkdir(parents=True, exist_ok=True)
             
-            output_path.write_text(json_output, encoding='utf-8')
-            print(f"\n[成功] 全情報を '{output_path}' に保存しました。")
-        else:
-            print("\n--- 取得結果 (JSON) ---")
-            print(json_output)
-            print("------------------------")
\ No newline at end of file
+                output_path.write_text(json_output, encoding='utf-8')
+                print(f"\n[成功] 全情報を '{output_path}' に保存しました。")
+            else:
+                print("\n--- 取得結果 (JSON) ---")
+                print(json_output)
+                print("------------------------")
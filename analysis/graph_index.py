@@ -0,0 +1,157 @@
+import numpy as np
+
+# --- グラフ索引の共通処理 ---
+# ノードは 0 から始まる連番の整数IDで表し、隣接関係はCSR形式 (indptr, indices) の配列で保持する。
+# 経路の列挙は、深さごとに全経路をまとめて1段ずつ伸ばす (Pythonのループは深さの回数だけ)。
+
+def build_csr(sources: np.ndarray, targets: np.ndarray, num_nodes: int):
+    """
+    辺の配列 (sources[i] -> targets[i]) から、CSR形式の隣接配列を作成する。
+    ノード v の隣接先は indices[indptr[v]:indptr[v + 1]] となる。
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+    indices = targets[order]
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    return indptr, indices
+
+def out_degree(indptr: np.ndarray) -> np.ndarray:
+    """各ノードの出次数 (ファンアウト)"""
+    return np.diff(indptr)
+
+def in_degree(indices: np.ndarray, num_nodes: int) -> np.ndarray:
+    """各ノードの入次数"""
+    return np.bincount(indices, minlength=num_nodes)
+
+def enumerate_paths(indptr: np.ndarray, indices: np.ndarray, roots: np.ndarray, max_depth: int = 20) -> dict:
+    """
+    各起点ノードから辿れる、すべての極大経路 (末端ノードまたは打ち切り地点まで) を列挙する。
+
+    経路は深さごとに「ノード」「1段前の経路の位置」「起点の位置」の配列で保持し、
+    出次数に応じて np.repeat で一斉に展開する。すでに経路上にあるノードへ戻る辺 (循環) は辿らない。
+
+    返り値 (dict):
+        root      : 各経路の起点 (roots 内の位置)
+        depth     : 各経路の辺の数
+        truncated : 循環または max_depth により打ち切られた経路か
+        nodes     : 各経路のノードIDのリスト
+        root_has_cycle : 起点ごとの、循環の有無
+    """
+    roots = np.asarray(roots, dtype=np.int64)
+    level_nodes = [roots]
+    level_parents = [np.full(len(roots), -1, dtype=np.int64)]
+    level_roots = [np.arange(len(roots), dtype=np.int64)]
+    root_has_cycle = np.zeros(len(roots), dtype=bool)
+    terminals = []  # (深さ, その深さでの位置, 打ち切りフラグ)
+
+    for depth in range(max_depth + 1):
+        nodes = level_nodes[-1]
+        degree = indptr[nodes + 1] - indptr[nodes]
+        if depth == max_depth:
+            terminals.append((depth, np.arange(len(nodes)), degree > 0))
+            break
+
+        # 1段展開する: 経路ごとに、出次数の数だけ子経路を作る
+        parent_pos = np.repeat(np.arange(len(nodes)), degree)
+        offsets = np.arange(len(parent_pos)) - np.repeat(np.cumsum(degree) - degree, degree)
+        children = indices[np.repeat(indptr[nodes], degree) + offsets]
+
+        # 経路上の祖先と同じノードに戻る子は、循環として除外する
+        cyclic = np.zeros(len(children), dtype=bool)
+        pos = parent_pos
+        for level in range(depth, -1, -1):
+            cyclic |= level_nodes[level][pos] == children
+            if level > 0:
+                pos = level_parents[level][pos]
+        root_has_cycle[level_roots[depth][parent_pos[cyclic]]] = True
+
+        # 子が1つも残らない経路は、ここで終わる
+        alive = np.bincount(parent_pos[~cyclic], minlength=len(nodes))
+        has_cycle = np.bincount(parent_pos[cyclic], minlength=len(nodes)) > 0
+        ended = np.nonzero(alive == 0)[0]
+        terminals.append((depth, ended, has_cycle[ended]))
+
+        keep = ~cyclic
+        if not keep.any():
+            break
+        level_nodes.append(children[keep])
+        level_parents.append(parent_pos[keep])
+        level_roots.append(level_roots[depth][parent_pos[keep]])
+
+    # 末端から親をたどり、経路ごとのノード列を復元する (深さごとにまとめて処理)
+    result_roots, result_depths, result_truncated, result_nodes = [], [], [], []
+    for depth, positions, truncated in terminals:
+        if len(positions) == 0:
+            continue
+        matrix = np.empty((len(positions), depth + 1), dtype=np.int64)
+        pos = positions
+        for level in range(depth, -1, -1):
+            matrix[:, level] = level_nodes[level][pos]
+            if level > 0:
+                pos = level_parents[level][pos]
+        result_roots.append(level_roots[depth][positions])
+        result_depths.append(np.full(len(positions), depth, dtype=np.int64))
+        result_truncated.append(truncated)
+        result_nodes.extend(matrix.tolist())
+
+    if not result_roots:
+        empty = np.array([], dtype=np.int64)
+        return {'root': empty, 'depth': empty, 'truncated': np.array([], dtype=bool), 'nodes': [], 'root_has_cycle': root_has_cycle}
+
+    return {
+        'root': np.concatenate(result_roots),
+        'depth': np.concatenate(result_depths),
+        'truncated': np.concatenate(result_truncated),
+        'nodes': result_nodes,
+        'root_has_cycle': root_has_cycle,
+    }
+
+class UnionFind:
+    """
+    素集合データ構造 (Union-Find)。ノード 0..n-1 を連結成分ごとにまとめる。
+    経路圧縮 (path halving) と、サイズによる併合を行う。
+    """
+
+    def __init__(self, num_nodes: int):
+        self.parent = np.arange(num_nodes, dtype=np.int64)
+        self.size = np.ones(num_nodes, dtype=np.int64)
+
+    def find(self, node: int) -> int:
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+
+    def union_edges(self, sources: np.ndarray, targets: np.ndarray):
+        """辺の配列をまとめて併合する"""
+        for a, b in zip(np.asarray(sources).tolist(), np.asarray(targets).tolist()):
+            self.union(a, b)
+
+    def labels(self) -> np.ndarray:
+        """各ノードの代表ノード (連結成分のラベル) の配列を返す"""
+        # 全ノードの親を根まで一斉にたどる (各反復で木の高さが半分以下になる)
+        parent = self.parent
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return parent.copy()
+            parent = grandparent
+            self.parent = parent
+
+def connected_components(num_nodes: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """無向グラフとみなした場合の連結成分のラベル (代表ノード) を返す"""
+    union_find = UnionFind(num_nodes)
+    union_find.union_edges(sources, targets)
+    return union_find.labels()
@@ -0,0 +1,163 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import numpy as np
+from pathlib import Path
+
+# --- Embedding・テキスト生成のバックエンド ---
+# RAG (build_vector_store.py / ask_with_rag.py) とAI監査 (audit_text_consistency.py) は、
+# このモジュールのバックエンドを通してのみEmbedding・LLMを呼び出す。
+#   - gemini : Google AI (google-generativeai)。.env の GOOGLE_API_KEY が必要
+#   - fake   : オフライン用の代替。ハッシュによる決定的なEmbeddingと、定型の応答を返す (API枠を消費しない)
+# 使うバックエンドは、引数 → 環境変数 RS_LLM_BACKEND → project_settings.json の llm.backend の順に決まる。
+
+try:
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+except NameError:
+    PROJECT_ROOT = Path().cwd()
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+
+DEFAULT_EMBEDDING_MODEL = "models/text-embedding-004"
+DEFAULT_GENERATION_MODEL = "gemini-1.5-flash-latest"
+EMBEDDING_DIMENSION = 768
+BACKEND_NAMES = ['gemini', 'fake']
+
+class LLMBackend:
+    """Embeddingとテキスト生成のインターフェース"""
+
+    name = "base"
+    embedding_model = None
+
+    def embed(self, texts: list, task_type: str = "RETRIEVAL_DOCUMENT") -> list:
+        """テキストのリストを、ベクトルのリストに変換する"""
+        raise NotImplementedError
+
+    def embed_query(self, text: str) -> list:
+        """検索用の質問文を1件ベクトルに変換する"""
+        return self.embed([text], task_type="RETRIEVAL_QUERY")[0]
+
+    def generate(self, prompt: str) -> str:
+        """プロンプトに対する応答テキストを返す"""
+        raise NotImplementedError
+
+class GeminiBackend(LLMBackend):
+    """Google AI (Gemini) のバックエンド"""
+
+    name = "gemini"
+
+    def __init__(self, embedding_model: str = DEFAULT_EMBEDDING_MODEL, generation_model: str = DEFAULT_GENERATION_MODEL):
+        # オフライン環境でもモジュールを読み込めるよう、google-generativeai は使うときに読み込む
+        import google.generativeai as genai
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=PROJECT_ROOT / '.env')
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError(".envファイルに GOOGLE_API_KEY が設定されていません。")
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.embedding_model = embedding_model
+        self.generation_model = generation_model
+        self._model = None
+
+    def embed(self, texts: list, task_type: str = "RETRIEVAL_DOCUMENT") -> list:
+        result = self.genai.embed_content(model=self.embedding_model, content=texts, task_type=task_type)
+        return result['embedding']
+
+    def generate(self, prompt: str) -> str:
+        if self._model is None:
+            self._model = self.genai.GenerativeModel(self.generation_model)
+        return self._model.generate_content(prompt).text
+
+class FakeAPIError(Exception):
+    """FakeBackend が模擬するAPIエラー (code 属性にHTTPステータスを持つ)"""
+
+    def __init__(self, code: int):
+        super().__init__(f"{code} simulated API error")
+        self.code = code
+
+class FakeBackend(LLMBackend):
+    """
+    オフライン用の代替バックエンド。ネットワークにもAPIキーにも依存しない。
+      - embed    : 文字bigramをハッシュで次元に割り当てた、正規化済みのベクトル (同じテキストは常に同じベクトル、
+                   文字の重なりが多いテキストほど類似度が高い)
+      - generate : SQL生成のプロンプトにはスキーマの先頭のVIEWを関連事業IDで絞り込む定型SQL、監査のプロンプトには定型のJSONを返す
+    latency_ms (1回の呼び出しの待ち時間) と error_rate (429/503 を返す確率) で、APIの挙動を模擬できる。
+    """
+
+    name = "fake"
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.dimension = dimension
+        self.embedding_model = f"fake-hash-{dimension}"
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.num_calls = 0
+
+    def _simulate_call(self):
+        self.num_calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise FakeAPIError(self.random.choice([429, 503]))
+
+    def _embed_one(self, text: str) -> list:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        grams = [text[i:i + 2] for i in range(max(1, len(text) - 1))]
+        for gram in grams:
+            digest = hashlib.md5(gram.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed(self, texts: list, task_type: str = "RETRIEVAL_DOCUMENT") -> list:
+        self._simulate_call()
+        return [self._embed_one(text) for text in texts]
+
+    def generate(self, prompt: str) -> str:
+        self._simulate_call()
+        if '"score"' in prompt:
+            # 監査のプロンプト: 内容のハッシュから決まるスコアを返す
+            score = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16) % 5 + 1
+            return json.dumps({"score": score, "reason": "(fake) 定型の応答です。"}, ensure_ascii=False)
+        if 'SQL' in prompt:
+            # SQL生成のプロンプト: スキーマの先頭のVIEWを、関連事業IDのリストで絞り込む定型SQLを返す
+            match = re.search(r'事業IDのリスト:\s*\[([0-9,\s]*)\]', prompt)
+            ids = [i.strip() for i in match.group(1).split(',') if i.strip()] if match else []
+            where_clause = f"WHERE 予算事業ID IN ({', '.join(ids)})" if ids else ""
+            # schema.yaml の全体なら「view_name: VIEW名」、絞り込んだスキーマなら「views:」の次の行
+            view_match = re.search(r'view_name:\s*(\S+)', prompt) or re.search(r'^views:\n\s+(\S+):', prompt, re.MULTILINE)
+            view_name = view_match.group(1) if view_match else "基本情報_組織情報"
+            return f'SELECT 予算事業ID, 事業名, 府省庁 FROM "{view_name}" {where_clause} LIMIT 100'.replace('  ', ' ')
+        return "(fake) 定型の応答です。"
+
+def load_llm_settings() -> dict:
+    """project_settings.json の llm セクションを読み込む (無ければ空の辞書)"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f).get('llm', {})
+    except (OSError, ValueError):
+        return {}
+
+def get_backend(name: str = None) -> LLMBackend:
+    """設定に従ってバックエンドを作成する"""
+    llm_settings = load_llm_settings()
+    name = name or os.environ.get("RS_LLM_BACKEND") or llm_settings.get('backend', 'gemini')
+    if name == 'gemini':
+        return GeminiBackend(
+            embedding_model=llm_settings.get('embedding_model', DEFAULT_EMBEDDING_MODEL),
+            generation_model=llm_settings.get('generation_model', DEFAULT_GENERATION_MODEL),
+        )
+    if name == 'fake':
+        fake_settings = llm_settings.get('fake', {})
+        return FakeBackend(
+            latency_ms=fake_settings.get('latency_ms', 0.0),
+            error_rate=fake_settings.get('error_rate', 0.0),
+            seed=fake_settings.get('seed', 0),
+        )
+    raise ValueError(f"不明なバックエンドです: {name} (gemini, fake のいずれかを指定してください)")
@@ -0,0 +1,92 @@
+import json
+import numpy as np
+from pathlib import Path
+
+# --- 量子化したEmbeddingの保存と検索 ---
+# Embeddingを、連続した float16 または int8 (ベクトルごとのスケール付き) の行列として .npy に保存する。
+# 読み込みは numpy.memmap (np.load の mmap_mode='r') で行うため、ファイル全体をメモリに展開せずに検索できる。
+#   <出力先>/embeddings.<dtype>.npy : (文書数, 次元数) の行列 (L2正規化してから量子化)
+#   <出力先>/embeddings.scales.npy : int8 の場合の、ベクトルごとのスケール (float32)
+#   <出力先>/embeddings.ids.npy    : 各行の文書ID
+#   <出力先>/embeddings.meta.json  : 型・件数・次元数
+
+QUANTIZED_DTYPES = ['int8', 'float16']
+
+# 検索時に一度に float32 へ戻す行数 (メモリ使用量の上限を決める)
+SEARCH_CHUNK_ROWS = 65536
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """各行をL2正規化する (内積がそのままコサイン類似度になる)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def quantize(matrix: np.ndarray, dtype: str):
+    """正規化済みの行列を量子化し、(量子化した行列, ベクトルごとのスケール or None) を返す"""
+    if dtype == 'float16':
+        return matrix.astype(np.float16), None
+    if dtype == 'int8':
+        # 対称なスカラー量子化: 行ごとの最大絶対値を 127 に対応させる
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"未対応の型です: {dtype} ({', '.join(QUANTIZED_DTYPES)} のいずれかを指定してください)")
+
+def save_quantized(embeddings: np.ndarray, doc_ids: list, output_dir: Path, dtype: str = 'int8') -> Path:
+    """Embeddingの行列を正規化・量子化して output_dir に保存し、行列ファイルのパスを返す"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    quantized, scales = quantize(normalize_rows(embeddings), dtype)
+
+    matrix_path = output_dir / f"embeddings.{dtype}.npy"
+    np.save(matrix_path, quantized)
+    if scales is not None:
+        np.save(output_dir / "embeddings.scales.npy", scales)
+    np.save(output_dir / "embeddings.ids.npy", np.asarray(doc_ids, dtype=str))
+    meta = {"dtype": dtype, "count": int(quantized.shape[0]), "dimension": int(quantized.shape[1])}
+    (output_dir / "embeddings.meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+    return matrix_path
+
+class QuantizedIndex:
+    """
+    save_quantized で保存した行列をメモリマップで開き、コサイン類似度の上位k件を求める。
+    行列はページ単位でOSが読み込むため、文書数が多くてもプロセスのメモリ使用量は SEARCH_CHUNK_ROWS 行分で済む。
+    """
+
+    def __init__(self, index_dir: Path):
+        index_dir = Path(index_dir)
+        self.meta = json.loads((index_dir / "embeddings.meta.json").read_text(encoding='utf-8'))
+        self.dtype = self.meta['dtype']
+        self.matrix = np.load(index_dir / f"embeddings.{self.dtype}.npy", mmap_mode='r')
+        self.scales = np.load(index_dir / "embeddings.scales.npy", mmap_mode='r') if self.dtype == 'int8' else None
+        self.doc_ids = np.load(index_dir / "embeddings.ids.npy", mmap_mode='r')
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """ディスク上 (メモリマップ) の行列・スケールのバイト数"""
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """(質問数, 文書数) のコサイン類似度の行列を返す"""
+        queries = normalize_rows(np.atleast_2d(query_embeddings))
+        result = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_CHUNK_ROWS):
+            chunk = np.asarray(self.matrix[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+            chunk_scores = queries @ chunk.T
+            if self.scales is not None:
+                chunk_scores *= self.scales[start:start + SEARCH_CHUNK_ROWS]
+            result[:, start:start + len(chunk)] = chunk_scores
+        return result
+
+    def search(self, query_embedding, k: int = 10):
+        """1件の質問ベクトルについて、(文書IDのリスト, 類似度の配列) を類似度の高い順に返す"""
+        scores = self.scores(query_embedding)[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [str(self.doc_ids[i]) for i in top], scores[top]
@@ -59,7 +59,10 @@ def run_scenario_from_yaml(scenario_file: str, output_base_folder: str):
                 # スクリプト名と同じ名前の関数を呼び出すと仮定
                 # (例: audit_text_consistency.py -> audit_consistency() )
                 # この規約により、呼び出す関数が明確になる
-                target_function = getattr(module, script_name)
+                target_function = getattr(module, script_name, None)
+                if target_function is None:
+                    print(f"[エラー] モジュール '{script_name}' 内に関数 '{script_name}' が見つかりません。関数名を確認してください。")
+                    continue
                 
                 # パラメータを渡して関数を実行
                 print("  -> 実行中...")
@@ -68,8 +71,6 @@ def run_scenario_from_yaml(scenario_file: str, output_base_folder: str):
                 
             except ImportError:
                 print(f"[エラー] モジュール 'analysis.{script_name}' が見つかりません。ファイル名を確認してください。")
-            except AttributeError:
-                 print(f"[エラー] モジュール '{script_name}' 内に関数 '{script_name}' が見つかりません。関数名を確認してください。")
             except Exception as e:
                 print(f"[エラー] ステップの実行中に予期せぬエラーが発生しました: {e}")
                 print("\n以降のシナリオの実行を中止します。")
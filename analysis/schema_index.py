@@ -0,0 +1,135 @@
+import sys
+import yaml
+import numpy as np
+from pathlib import Path
+
+from analysis.embedding_cache import EmbeddingCache
+from analysis.quantized_embeddings import normalize_rows
+
+# --- SQL生成プロンプト用のスキーマ検索 ---
+# schema.yaml の全VIEW・全列 (約500列) をそのままプロンプトに入れる代わりに、VIEWと列の説明文をEmbeddingしておき、
+# 質問文との類似度が高いVIEW (上位 top_tables 件) と、その中の列 (各VIEWで上位 top_columns 件) だけを渡す。
+#   - 全VIEWに共通する列 (予算事業ID・事業年度・府省庁など) は、VIEWごとではなく1回だけ記載する
+#   - 選ばれたVIEW同士を結合するための列 (JOIN_KEY_COLUMNS) を、結合キーのヒントとして添える
+# 説明文のEmbeddingは、build_vector_store.py と同じEmbeddingのキャッシュDBに保存される (2回目以降はAPIを呼ばない)。
+
+DEFAULT_TOP_TABLES = 3
+DEFAULT_TOP_COLUMNS = 12
+
+# VIEW同士の結合に使う列 (予算事業ID は全VIEWに共通。事業年度と組み合わせて使う)
+JOIN_KEY_COLUMNS = ['予算事業ID', '支出先ブロック番号', '法人番号']
+
+EMBEDDING_BATCH_SIZE = 100
+
+def load_schema(schema_path: Path) -> list:
+    """schema.yaml を読み込み、[{'view_name': ..., 'columns': [(列名, 型), ...]}, ...] を返す"""
+    with Path(schema_path).open('r', encoding='utf-8') as f:
+        schema = yaml.safe_load(f)
+    return [
+        {'view_name': table['view_name'], 'columns': [(column['name'], column['type']) for column in table['columns']]}
+        for table in schema.values()
+    ]
+
+class SchemaIndex:
+    """
+    VIEWと列の説明文のEmbeddingを持ち、質問文のEmbeddingに関連するスキーマの部分だけを返す。
+    embedding_cache_path を渡すと、説明文のEmbeddingをキャッシュDBから再利用する。
+    """
+
+    def __init__(self, schema_path: Path, backend, embedding_cache_path: Path = None):
+        self.tables = load_schema(schema_path)
+        column_sets = [{name for name, _ in table['columns']} for table in self.tables]
+        common = set.intersection(*column_sets) if column_sets else set()
+        # 共通の列は schema.yaml の先頭のVIEWの列順で並べる
+        self.common_columns = [(name, dtype) for name, dtype in self.tables[0]['columns'] if name in common] if self.tables else []
+
+        # 説明文: VIEWは「VIEW名: 固有の列名の一覧」、列は「VIEW名の列「列名」」
+        self.column_owners = []
+        documents = []
+        for table in self.tables:
+            table['specific_columns'] = [(name, dtype) for name, dtype in table['columns'] if name not in common]
+            documents.append(f"{table['view_name']}: {', '.join(name for name, _ in table['specific_columns'])}")
+        for table_no, table in enumerate(self.tables):
+            for column_no, (name, _) in enumerate(table['specific_columns']):
+                self.column_owners.append((table_no, column_no))
+                documents.append(f"{table['view_name']}の列「{name}」")
+
+        embeddings = normalize_rows(self._embed(documents, backend, embedding_cache_path))
+        self.table_embeddings = embeddings[:len(self.tables)]
+        self.column_embeddings = embeddings[len(self.tables):]
+
+    @staticmethod
+    def _embed(documents: list, backend, embedding_cache_path: Path = None) -> np.ndarray:
+        """説明文をEmbeddingする。キャッシュDBが使える場合は、未計算のものだけをAPIに送る"""
+        def embed_all(texts):
+            vectors = []
+            for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+                vectors.extend(backend.embed(texts[i:i + EMBEDDING_BATCH_SIZE]))
+            return vectors
+
+        if embedding_cache_path is None:
+            return np.asarray(embed_all(documents), dtype=np.float32)
+        try:
+            embedding_cache = EmbeddingCache(embedding_cache_path, backend.embedding_model)
+        except Exception as e:
+            print(f" !! 警告: Embeddingのキャッシュ '{embedding_cache_path}' を開けません。キャッシュを使わずにEmbeddingします: {e}", file=sys.stderr)
+            return np.asarray(embed_all(documents), dtype=np.float32)
+        with embedding_cache:
+            hashes = embedding_cache.hashes(documents)
+            cached = embedding_cache.lookup(hashes)
+            missing = [i for i, key in enumerate(hashes) if key not in cached]
+            if missing:
+                new_embeddings = embed_all([documents[i] for i in missing])
+                embedding_cache.put([hashes[i] for i in missing], new_embeddings)
+                cached.update(zip((hashes[i] for i in missing), new_embeddings))
+            return np.asarray([cached[key] for key in hashes], dtype=np.float32)
+
+    def select(self, question_embedding: list, top_tables: int = DEFAULT_TOP_TABLES, top_columns: int = DEFAULT_TOP_COLUMNS) -> list:
+        """
+        質問文に関連するVIEWと列を、[(VIEW番号, [固有の列番号, ...]), ...] の形で関連度の高い順に返す。
+        VIEWの関連度は、VIEWの説明文と、そのVIEWで最も関連する列のうち高い方の類似度。
+        """
+        query = normalize_rows(np.atleast_2d(question_embedding))[0]
+        table_scores = self.table_embeddings @ query
+        column_scores = self.column_embeddings @ query
+
+        best_column_scores = np.full(len(self.tables), -1.0, dtype=np.float32)
+        columns_by_table = [[] for _ in self.tables]
+        for score, (table_no, column_no) in zip(column_scores, self.column_owners):
+            columns_by_table[table_no].append((score, column_no))
+            best_column_scores[table_no] = max(best_column_scores[table_no], score)
+
+        scores = np.maximum(table_scores, best_column_scores)
+        selection = []
+        for table_no in np.argsort(-scores)[:top_tables]:
+            ranked = sorted(columns_by_table[table_no], reverse=True)[:top_columns]
+            selection.append((int(table_no), sorted(column_no for _, column_no in ranked)))
+        return selection
+
+    def render(self, selection: list) -> str:
+        """select の結果を、プロンプトに埋め込むスキーマの文字列 (YAML形式) にする"""
+        lines = ["# 全VIEWに共通の列 (各VIEWの列に加えて、どのVIEWでも使えます)"]
+        lines.append("common_columns: " + ", ".join(f"{name} {dtype}" for name, dtype in self.common_columns))
+        lines.append("# 質問に関連するVIEWと、その主な列")
+        lines.append("views:")
+        selected_views = []
+        for table_no, column_nos in selection:
+            table = self.tables[table_no]
+            selected_views.append(table)
+            lines.append(f"  {table['view_name']}:")
+            for column_no in column_nos:
+                name, dtype = table['specific_columns'][column_no]
+                lines.append(f"  - {name} {dtype}")
+
+        lines.append("# 結合キーのヒント")
+        lines.append("join_keys:")
+        lines.append("- 予算事業ID (と 事業年度): 全VIEWに共通。事業単位でVIEW同士を結合する")
+        for key in JOIN_KEY_COLUMNS[1:]:
+            views = [table['view_name'] for table in selected_views if any(name == key for name, _ in table['columns'])]
+            if len(views) >= 2:
+                lines.append(f"- {key} (と 予算事業ID): {', '.join(views)} を結合する")
+        return "\n".join(lines)
+
+    def schema_info(self, question_embedding: list, top_tables: int = DEFAULT_TOP_TABLES, top_columns: int = DEFAULT_TOP_COLUMNS) -> str:
+        """質問文に関連する部分だけのスキーマの文字列を返す"""
+        return self.render(self.select(question_embedding, top_tables, top_columns))
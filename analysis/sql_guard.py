@@ -0,0 +1,108 @@
+import json
+import math
+import duckdb
+import threading
+
+# --- LLMが生成したSQLの実行ガード ---
+# ask_with_rag.py で生成されたSQLを、そのまま con.execute() せずに次の順で検査してから実行する。
+#   1. 検証   : 1つの文だけで、SELECT (WITH ... SELECT を含む) であること
+#   2. 見積り : EXPLAIN の実行計画から、各演算子の推定行数の最大値 (直積は子の推定行数の積) を求め、上限を超えるものは実行しない
+#   3. 実行   : 結果を LIMIT で包み、タイムアウト (con.interrupt()) とメモリ上限 (SET memory_limit) を設けて実行する
+# 1・2で失敗した場合のエラー (SQLGuardError) は、LLMにSQLを1回だけ修正させるためにそのまま渡せる文面にしてある。
+
+DEFAULT_ROW_LIMIT = 1000
+DEFAULT_TIMEOUT_SECONDS = 30
+DEFAULT_MEMORY_LIMIT = "2GB"
+DEFAULT_MAX_ESTIMATED_ROWS = 100_000_000
+
+class SQLGuardError(Exception):
+    """ガードでSQLを実行しなかった、または実行に失敗したことを表す (stage に 'validate' / 'estimate' / 'execute' / 'timeout')"""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+    @property
+    def repairable(self) -> bool:
+        """LLMにエラーを渡して修正させる意味があるか (タイムアウトは同じ時間を再び待つことになるため対象外)"""
+        return self.stage != 'timeout'
+
+def validate_read_only(con: duckdb.DuckDBPyConnection, sql: str) -> str:
+    """SQLが1つの SELECT 文であることを確かめ、末尾のセミコロンを除いた文を返す"""
+    try:
+        statements = con.extract_statements(sql)
+    except duckdb.Error as e:
+        raise SQLGuardError('validate', f"SQLの構文エラー: {e}") from e
+    if len(statements) != 1:
+        raise SQLGuardError('validate', f"SQLは1つの文にしてください (検出された文: {len(statements)}件)")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise SQLGuardError('validate', f"読み取り専用の SELECT 文のみ実行できます (検出された文の種類: {statements[0].type.name})")
+    return statements[0].query.strip().rstrip(';')
+
+def estimate_cardinality(con: duckdb.DuckDBPyConnection, sql: str) -> int:
+    """
+    EXPLAIN の実行計画から、各演算子の推定行数 (Estimated Cardinality) の最大値を返す。
+    推定行数が付かない演算子 (CROSS_PRODUCT や、その上の UNGROUPED_AGGREGATE など) は、子の推定行数から補う:
+    直積は子の推定行数の積、それ以外は子の推定行数の最大値 (その演算子が処理する行数) とする。
+    """
+    try:
+        plan_json = con.execute(f"EXPLAIN (FORMAT JSON) {sql}").fetchall()[0][1]
+    except duckdb.Error as e:
+        raise SQLGuardError('estimate', f"SQLの実行計画を作成できません: {e}") from e
+
+    estimates = []
+
+    def walk(node) -> int:
+        """node の推定行数を返し、部分木の全演算子の推定行数を estimates に集める"""
+        child_estimates = [walk(child) for child in node.get('children', [])]
+        estimate = node.get('extra_info', {}).get('Estimated Cardinality')
+        if estimate is not None:
+            estimate = int(estimate)
+        elif 'CROSS_PRODUCT' in node.get('name', '') and child_estimates:
+            estimate = math.prod(child_estimates)
+        else:
+            estimate = max(child_estimates, default=0)
+        estimates.append(estimate)
+        return estimate
+
+    for node in json.loads(plan_json):
+        walk(node)
+    return max(estimates, default=0)
+
+def with_limit(sql: str, row_limit: int) -> str:
+    """SQLを副問い合わせとして包み、最大 row_limit 行に制限する (元のSQLに LIMIT があってもよい)"""
+    return f"SELECT * FROM (\n{sql}\n) AS guarded_query LIMIT {int(row_limit)}"
+
+def apply_limits(con: duckdb.DuckDBPyConnection, memory_limit: str = DEFAULT_MEMORY_LIMIT):
+    """接続にメモリ上限を設定し、DBファイル以外 (ローカルファイル・URL) の読み込みを禁止する"""
+    con.execute("SET memory_limit = ?", [memory_limit])
+    con.execute("SET enable_external_access = false")
+
+def execute_guarded(con: duckdb.DuckDBPyConnection, sql: str, row_limit: int = DEFAULT_ROW_LIMIT,
+                    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS, max_estimated_rows: int = DEFAULT_MAX_ESTIMATED_ROWS):
+    """
+    検証・見積りを行ってからSQLを実行し、(結果のDataFrame, 推定行数, 行数の上限で打ち切ったか) を返す。
+    実行しなかった・失敗した場合は SQLGuardError を送出する。
+    """
+    sql = validate_read_only(con, sql)
+    estimated_rows = estimate_cardinality(con, sql)
+    if max_estimated_rows and estimated_rows > max_estimated_rows:
+        raise SQLGuardError('estimate', f"実行計画の推定行数が {estimated_rows:,}行で、上限 ({max_estimated_rows:,}行) を超えています。"
+                                        "結合条件の漏れ (直積) が無いか確認し、絞り込みや集計を加えてください。")
+
+    # 上限より1行多く取得し、打ち切りが起きたかどうかを判定する
+    timer = threading.Timer(timeout_seconds, con.interrupt) if timeout_seconds else None
+    if timer is not None:
+        timer.start()
+    try:
+        result_df = con.execute(with_limit(sql, row_limit + 1)).fetchdf()
+    except duckdb.InterruptException as e:
+        raise SQLGuardError('timeout', f"実行時間が上限 ({timeout_seconds}秒) を超えたため中断しました。") from e
+    except duckdb.Error as e:
+        raise SQLGuardError('execute', f"SQLの実行に失敗しました: {e}") from e
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    truncated = len(result_df) > row_limit
+    return result_df.head(row_limit), estimated_rows, truncated
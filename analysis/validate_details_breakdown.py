@@ -35,26 +35,36 @@ def validate_breakdown():
     print(f"--- データベース '{db_file_path}' を使って、明細と内訳の整合性を検証します ---")
     con = duckdb.connect(database=str(db_file_path), read_only=True)
 
+    # 契約キー (import_zips_to_duckdb.py で作成) が無い古いDBでは検証できない
+    key_tables = con.execute("""
+        SELECT COUNT(DISTINCT table_name) FROM information_schema.columns
+        WHERE table_name IN ('支出先_支出情報_明細', '支出先_費目・使途') AND column_name = '契約キー'
+    """).fetchone()[0]
+    if key_tables < 2:
+        print("[エラー] '契約キー' 列が見つかりません。最新の `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+        con.close()
+        sys.exit(1)
+
     # 契約ごとの金額と、その内訳である費目・使途の合計金額を比較するSQLクエリ
     query = """
     WITH
     DetailsAmount AS (
         -- 契約ごとに、明細行に記載された金額を取得
-        -- 契約を特定するために、複数のキーを組み合わせる
+        -- 契約は、インポート時に作成した契約キー (予算事業ID・支出先ブロック番号・支出先名・法人番号・契約概要のハッシュ) で特定する
         SELECT
-            予算事業ID, 支出先ブロック番号, 支出先名, 法人番号, 契約概要,
+            契約キー, 予算事業ID, 支出先名, 契約概要,
             "金額" AS contract_amount
         FROM "支出先_支出情報_明細"
         WHERE "金額" IS NOT NULL
     ),
     BreakdownSum AS (
-        -- 同じキーの組み合わせで、費目・使途の金額を合計
+        -- 同じ契約キーで、費目・使途の金額を合計
         SELECT
-            予算事業ID, 支出先ブロック番号, 支出先名, 法人番号, 契約概要,
+            契約キー,
             SUM("金額") AS breakdown_sum
         FROM "支出先_費目・使途"
         WHERE "金額" IS NOT NULL
-        GROUP BY 予算事業ID, 支出先ブロック番号, 支出先名, 法人番号, 契約概要
+        GROUP BY 契約キー
     )
     -- 両者を結合し、金額に差がある契約のみを抽出
     SELECT
@@ -68,13 +78,8 @@ def validate_breakdown():
     FROM
         DetailsAmount d
     JOIN
-        BreakdownSum b 
-        ON  d.予算事業ID = b.予算事業ID 
-        AND d.支出先ブロック番号 = b.支出先ブロック番号
-        AND d.支出先名 = b.支出先名
-        -- 法人番号と契約概要はNULLの場合があるので、安全な比較を行う
-        AND (d.法人番号 = b.法人番号 OR (d.法人番号 IS NULL AND b.法人番号 IS NULL))
-        AND (d.契約概要 = b.契約概要 OR (d.契約概要 IS NULL AND b.契約概要 IS NULL))
+        -- 契約キーはNULL安全に計算済みのため、1列の等値結合で突き合わせられる
+        BreakdownSum b ON d.契約キー = b.契約キー
     LEFT JOIN
         "基本情報_組織情報" org ON d.予算事業ID = org.予算事業ID
     WHERE
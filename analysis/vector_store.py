@@ -0,0 +1,122 @@
+import duckdb
+import numpy as np
+import pandas as pd
+
+# --- DuckDB上のベクトルストア ---
+# RAG用の文書とEmbeddingを、メタデータと同じDBファイル (rs_database.duckdb) の rag_documents テーブルに保存する。
+# Embeddingは固定長の FLOAT[次元数] 配列として持ち、検索は array_cosine_similarity による全件比較 (ベクトル化された
+# DuckDBの集計) で行う。府省庁や金額の範囲などの条件は、同じSQLの WHERE 句で同時に指定できる。
+
+VECTOR_TABLE = "rag_documents"
+
+# rag_documents に保存するメタデータの列 (Embedding以外)
+METADATA_COLUMNS = ["doc_id", "document_text", "予算事業ID", "予算事業ID一覧", "事業名", "契約概要", "支出先名", "金額", "明細件数"]
+
+def create_vector_table(con: duckdb.DuckDBPyConnection, dimension: int):
+    """空の rag_documents テーブルを作成する (既存のテーブルは作り直す)"""
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {VECTOR_TABLE} (
+            doc_id VARCHAR PRIMARY KEY,
+            document_text VARCHAR,
+            予算事業ID BIGINT,
+            予算事業ID一覧 VARCHAR,
+            府省庁 VARCHAR,
+            事業名 VARCHAR,
+            契約概要 VARCHAR,
+            支出先名 VARCHAR,
+            金額 DOUBLE,
+            明細件数 BIGINT,
+            embedding FLOAT[{int(dimension)}]
+        )
+    """)
+
+def insert_documents(con: duckdb.DuckDBPyConnection, documents):
+    """
+    文書 (METADATA_COLUMNS と embedding 列を持つ DataFrame または Arrowのテーブル) を rag_documents に追加する。
+    府省庁は、検索時の絞り込みに使えるよう「基本情報_組織情報」から付与する。
+    文書IDの無い古いキャッシュは、build_vector_store.document_id と同じ計算 (SHA-256の先頭16桁) で補う。
+    """
+    dimension = vector_dimension(con)
+    con.register('rag_documents_batch', documents)
+    try:
+        con.execute(f"""
+            INSERT OR IGNORE INTO {VECTOR_TABLE}
+            SELECT
+                COALESCE(d.doc_id, substr(sha256(d.document_text), 1, 16)),
+                d.document_text,
+                CAST(d.予算事業ID AS BIGINT),
+                COALESCE(d.予算事業ID一覧, CAST(CAST(d.予算事業ID AS BIGINT) AS VARCHAR)),
+                o.府省庁,
+                d.事業名,
+                d.契約概要,
+                d.支出先名,
+                CAST(d.金額 AS DOUBLE),
+                CAST(COALESCE(d.明細件数, 1) AS BIGINT),
+                CAST(d.embedding AS FLOAT[{dimension}])
+            FROM rag_documents_batch AS d
+            LEFT JOIN (
+                SELECT 予算事業ID, FIRST(府省庁) AS 府省庁
+                FROM "基本情報_組織情報"
+                GROUP BY 予算事業ID
+            ) AS o ON CAST(d.予算事業ID AS BIGINT) = o.予算事業ID
+        """)
+    finally:
+        con.unregister('rag_documents_batch')
+
+def vector_dimension(con: duckdb.DuckDBPyConnection) -> int:
+    """rag_documents の Embedding の次元数を返す"""
+    column_type = con.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = ? AND column_name = 'embedding'",
+        [VECTOR_TABLE]
+    ).fetchone()
+    if column_type is None:
+        raise duckdb.CatalogException(f"テーブル '{VECTOR_TABLE}' がありません。`analysis/build_vector_store.py` を実行してください。")
+    # 型は 'FLOAT[768]' の形式
+    return int(column_type[0].split('[')[1].rstrip(']'))
+
+def search(con: duckdb.DuckDBPyConnection, query_embedding: list, k: int = 10, where: str = None, params: list = None) -> pd.DataFrame:
+    """
+    質問のベクトルとのコサイン類似度が高い順に、上位 k 件の文書を返す。
+    where にSQLの条件式 (例: "府省庁 = ? AND 金額 >= ?") を渡すと、その条件を満たす文書だけを検索する。
+    """
+    dimension = vector_dimension(con)
+    where_clause = f"WHERE {where}" if where else ""
+    return con.execute(f"""
+        SELECT
+            doc_id, document_text, 予算事業ID, 予算事業ID一覧, 府省庁, 事業名, 契約概要, 支出先名, 金額, 明細件数,
+            array_cosine_similarity(embedding, CAST(? AS FLOAT[{dimension}])) AS similarity
+        FROM {VECTOR_TABLE}
+        {where_clause}
+        ORDER BY similarity DESC
+        LIMIT ?
+    """, [list(query_embedding), *(params or []), k]).fetchdf()
+
+def search_quantized(con: duckdb.DuckDBPyConnection, index, query_embedding: list, k: int = 10, where: str = None, params: list = None) -> pd.DataFrame:
+    """
+    search と同じ結果の列を、量子化Embeddingの索引 (quantized_embeddings.QuantizedIndex) による類似度で返す。
+    類似度の計算はメモリマップした行列で行い、rag_documents からは上位 k 件のメタデータだけを doc_id で取得する。
+    where を渡した場合は、条件を満たす文書IDを先に求め、その文書だけから上位 k 件を選ぶ。
+    """
+    scores = index.scores(query_embedding)[0]
+    if where:
+        allowed_ids = [row[0] for row in con.execute(f"SELECT doc_id FROM {VECTOR_TABLE} WHERE {where}", params or []).fetchall()]
+        scores = np.where(np.isin(index.doc_ids, allowed_ids), scores, -np.inf)
+    k = min(k, int(np.isfinite(scores).sum()))
+    if k == 0:
+        return search(con, query_embedding, k=0)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    ranked = pd.DataFrame({'doc_id': [str(index.doc_ids[i]) for i in top], 'similarity': scores[top]})
+
+    con.register('quantized_search_ranked', ranked)
+    try:
+        return con.execute(f"""
+            SELECT
+                d.doc_id, d.document_text, d.予算事業ID, d.予算事業ID一覧, d.府省庁, d.事業名, d.契約概要, d.支出先名, d.金額, d.明細件数,
+                r.similarity
+            FROM quantized_search_ranked AS r
+            JOIN {VECTOR_TABLE} AS d ON d.doc_id = r.doc_id
+            ORDER BY r.similarity DESC
+        """).fetchdf()
+    finally:
+        con.unregister('quantized_search_ranked')
@@ -3,8 +3,18 @@ import pandas as pd
 import zipfile
 import json
 import sys
+import hashlib
+import datetime
 from pathlib import Path
 
+# 派生テーブル (グラフ索引など) の作成処理は analysis フォルダの共通モジュールを利用する
+from analysis.build_fund_flow_graph import build_fund_flow_graph
+from analysis.build_outcome_chains import build_outcome_chains
+from analysis.build_business_clusters import build_business_clusters
+from analysis.build_recipient_index import build_recipient_index
+from analysis.build_fulltext_index import build_fulltext_index
+from analysis.business_lookup import build_lookup_documents
+
 SETTINGS_FILE = 'project_settings.json'
 
 def load_settings():
@@ -16,6 +26,161 @@ def load_settings():
         print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' の読み込みに失敗しました: {e}", file=sys.stderr)
         sys.exit(1)
 
+def file_sha256(path: Path) -> str:
+    """ファイル内容のSHA-256ハッシュを計算する (大きなZIPでもメモリを消費しないよう分割して読む)"""
+    digest = hashlib.sha256()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def build_business_id_indexes(con: duckdb.DuckDBPyConnection, table_names: list):
+    """
+    予算事業IDを持つ各テーブルにARTインデックスを作成し、事業単位の検索 (WHERE 予算事業ID = ?) を高速化する。
+    """
+    for table_name in table_names:
+        columns = [c[0] for c in con.execute(f"DESCRIBE {table_name}").fetchall()]
+        if '予算事業ID' not in columns:
+            continue
+        try:
+            con.execute(f"CREATE INDEX idx_{table_name}_business_id ON {table_name} (予算事業ID)")
+            print(f" -> インデックス 'idx_{table_name}_business_id' を作成しました。")
+        except Exception as e:
+            print(f" !! 警告: テーブル '{table_name}' のインデックス作成中にエラー: {e}", file=sys.stderr)
+
+# 契約を一意に識別する代理キー (契約キー) の計算式。
+# 予算事業ID・支出先ブロック番号・支出先名 (空白を除去して正規化)・法人番号・契約概要 を連結してハッシュ化する。
+# NULL は専用の記号に置き換えるため、NULL同士も同じキーになる (NULL安全)。
+CONTRACT_KEY_EXPRESSION = """
+    md5(concat_ws(chr(31),
+        COALESCE(CAST(TRY_CAST(予算事業ID AS BIGINT) AS VARCHAR), '<NULL>'),
+        COALESCE(CAST(支出先ブロック番号 AS VARCHAR), '<NULL>'),
+        COALESCE(regexp_replace(CAST(支出先名 AS VARCHAR), '[\\s　]+', '', 'g'), '<NULL>'),
+        COALESCE(CAST(TRY_CAST(法人番号 AS BIGINT) AS VARCHAR), '<NULL>'),
+        COALESCE(CAST(契約概要 AS VARCHAR), '<NULL>')
+    ))
+"""
+
+# 契約キーを付与するテーブル (支出明細と、その内訳である費目・使途)
+CONTRACT_KEY_TABLES = ["tbl_5_1_details", "tbl_5_3"]
+
+def build_contract_keys(con: duckdb.DuckDBPyConnection, index_records: list):
+    """
+    支出明細と費目・使途の各テーブルに契約キー列を追加する。
+    両者の突き合わせを、複数列のNULL安全比較ではなく1列の等値結合で行えるようにする。
+    """
+    view_names = {record['table_name']: record['view_name'] for record in index_records}
+    for table_name in CONTRACT_KEY_TABLES:
+        if table_name not in view_names:
+            continue
+        try:
+            con.execute(f"ALTER TABLE {table_name} ADD COLUMN 契約キー VARCHAR")
+            con.execute(f"UPDATE {table_name} SET 契約キー = {CONTRACT_KEY_EXPRESSION}")
+            # 列を追加したため、VIEWを作り直して新しい列を反映する
+            con.execute(f'CREATE OR REPLACE VIEW "{view_names[table_name]}" AS SELECT * FROM {table_name};')
+            print(f" -> テーブル '{table_name}' に '契約キー' 列を追加しました。")
+        except Exception as e:
+            print(f" !! 警告: テーブル '{table_name}' の契約キー作成中にエラー: {e}", file=sys.stderr)
+
+def build_summary_tables(con: duckdb.DuckDBPyConnection):
+    """
+    ダッシュボード用の事前集計テーブルを作成する。
+    府省庁・局・庁・年度単位のロールアップを保持し、画面表示のたびに元テーブルを走査しないようにする。
+    """
+    summary_queries = {
+        # 局・庁 × 予算年度ごとの予算額・執行額 (府省庁単位は画面側でこの表を合算する)
+        "summary_budget_by_bureau": """
+            SELECT
+                府省庁,
+                COALESCE("局・庁", '(未設定)') AS "局・庁",
+                予算年度,
+                COUNT(DISTINCT 予算事業ID) AS 事業数,
+                SUM("計（歳出予算現額合計）") AS 予算額合計,
+                SUM("執行額（合計）") AS 執行額合計,
+                CASE
+                    WHEN SUM("計（歳出予算現額合計）") = 0 THEN NULL
+                    ELSE CAST(SUM("執行額（合計）") AS DOUBLE) / SUM("計（歳出予算現額合計）") * 100
+                END AS 執行率
+            FROM "予算・執行_サマリ"
+            GROUP BY 府省庁, COALESCE("局・庁", '(未設定)'), 予算年度
+        """,
+        # 局・庁 × 事業年度ごとの支出額 (明細行のみを集計)
+        "summary_expenditure_by_bureau": """
+            SELECT
+                府省庁,
+                COALESCE("局・庁", '(未設定)') AS "局・庁",
+                事業年度,
+                COUNT(DISTINCT 予算事業ID) AS 事業数,
+                COUNT(*) AS 支出件数,
+                SUM("金額") AS 支出額合計
+            FROM "支出先_支出情報_明細"
+            GROUP BY 府省庁, COALESCE("局・庁", '(未設定)'), 事業年度
+        """,
+        # 事業年度ごとの、全体・府省庁・局・庁の各レベルでの支出先上位50件
+        # 支出先は名寄せ済みの支出先ID (build_recipient_index で作成) で集計し、表記ゆれを1つにまとめる
+        "summary_top_recipients": """
+            WITH RecipientTotal AS (
+                SELECT
+                    CASE
+                        WHEN GROUPING(府省庁) = 1 THEN '全体'
+                        WHEN GROUPING("局・庁") = 1 THEN '府省庁'
+                        ELSE '局・庁'
+                    END AS 集計レベル,
+                    事業年度,
+                    府省庁,
+                    "局・庁",
+                    支出先ID,
+                    COUNT(*) AS 契約件数,
+                    SUM("金額") AS 支出額合計
+                FROM (
+                    SELECT
+                        事業年度,
+                        COALESCE(府省庁, '(未設定)') AS 府省庁,
+                        COALESCE("局・庁", '(未設定)') AS "局・庁",
+                        支出先ID, "金額"
+                    FROM "支出先_支出情報_明細"
+                    WHERE 支出先ID IS NOT NULL
+                )
+                GROUP BY GROUPING SETS (
+                    (事業年度, 支出先ID),
+                    (事業年度, 府省庁, 支出先ID),
+                    (事業年度, 府省庁, "局・庁", 支出先ID)
+                )
+            )
+            SELECT
+                r.集計レベル,
+                r.事業年度,
+                r.府省庁,
+                r."局・庁",
+                r.支出先ID,
+                d.代表名 AS 支出先名,
+                d.法人番号,
+                d.表記ゆれ数,
+                r.契約件数,
+                r.支出額合計,
+                ROW_NUMBER() OVER (PARTITION BY r.集計レベル, r.事業年度, r.府省庁, r."局・庁" ORDER BY r.支出額合計 DESC) AS 順位
+            FROM RecipientTotal AS r
+            JOIN dim_recipient AS d ON r.支出先ID = d.支出先ID
+            QUALIFY 順位 <= 50
+        """,
+    }
+
+    # 支出先の集計は名寄せの結果 (dim_recipient) を使うため、名寄せを行わなかった場合は作成しない
+    has_recipient_index = con.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'dim_recipient'"
+    ).fetchone()[0] > 0
+    if not has_recipient_index:
+        del summary_queries["summary_top_recipients"]
+        print(" -> 'dim_recipient' が無いため、集計テーブル 'summary_top_recipients' の作成をスキップしました。")
+
+    for table_name, query in summary_queries.items():
+        try:
+            con.execute(f"CREATE OR REPLACE TABLE {table_name} AS {query}")
+            row_count = con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            print(f" -> 集計テーブル '{table_name}' ({row_count:,}行) を作成しました。")
+        except Exception as e:
+            print(f" !! 警告: 集計テーブル '{table_name}' の作成中にエラー: {e}", file=sys.stderr)
+
 def import_zips_to_single_db():
     settings = load_settings()
     try:
@@ -25,7 +190,9 @@ def import_zips_to_single_db():
         print(f"[エラー] 設定ファイルに必要なキー {e} がありません。", file=sys.stderr)
         sys.exit(1)
     
-    print(f"処理を開始します。出力DBファイル: '{output_db_file}'")
+    # このDB生成を識別するビルドID (差分処理で前回のビルドと比較するために使用)
+    build_id = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    print(f"処理を開始します。出力DBファイル: '{output_db_file}' (ビルドID: {build_id})")
 
     if output_db_file.exists():
         output_db_file.unlink()
@@ -64,6 +231,7 @@ def import_zips_to_single_db():
             created_views.add(view_name)
             
             print(f"\n処理中: '{base_name_zip}' -> テーブル: '{table_name}', VIEW: '{view_name}'")
+            source_sha256 = file_sha256(zip_path)
             
             # --- CSVの読み込み ---
             with zipfile.ZipFile(zip_path, 'r') as zf:
@@ -85,7 +253,8 @@ def import_zips_to_single_db():
             index_records.append({
                 'table_name': table_name,
                 'view_name': view_name,
-                'original_filename': base_name_zip
+                'original_filename': base_name_zip,
+                'source_sha256': source_sha256
             })
 
             # ▼▼▼【変更点】'5-1'のファイルの場合のみ、追加の分割処理を実行▼▼▼
@@ -104,7 +273,7 @@ def import_zips_to_single_db():
                 con.from_df(df_summary).create(summary_table_name)
                 con.execute(f'CREATE OR REPLACE VIEW "{summary_view_name}" AS SELECT * FROM {summary_table_name};')
                 print(f"    -> 分割テーブル '{summary_table_name}' ({len(df_summary)}行) と VIEW '{summary_view_name}' を作成。")
-                index_records.append({'table_name': summary_table_name, 'view_name': summary_view_name, 'original_filename': base_name_zip})
+                index_records.append({'table_name': summary_table_name, 'view_name': summary_view_name, 'original_filename': base_name_zip, 'source_sha256': source_sha256})
 
                 # --- 明細テーブルの作成 ---
                 details_table_name = "tbl_5_1_details"
@@ -112,18 +281,81 @@ def import_zips_to_single_db():
                 con.from_df(df_details).create(details_table_name)
                 con.execute(f'CREATE OR REPLACE VIEW "{details_view_name}" AS SELECT * FROM {details_table_name};')
                 print(f"    -> 分割テーブル '{details_table_name}' ({len(df_details)}行) と VIEW '{details_view_name}' を作成。")
-                index_records.append({'table_name': details_table_name, 'view_name': details_view_name, 'original_filename': base_name_zip})
+                index_records.append({'table_name': details_table_name, 'view_name': details_view_name, 'original_filename': base_name_zip, 'source_sha256': source_sha256})
 
         except Exception as e:
             print(f" !! エラー: ファイル '{zip_path.name}' の処理中にエラー: {e}", file=sys.stderr)
 
+    # --- 契約キーの作成 ---
+    if index_records:
+        print("\n支出明細と費目・使途に契約キーを追加します...")
+        build_contract_keys(con, index_records)
+
+    # --- 支出先の名寄せ (支出先IDの付与) ---
+    if index_records:
+        print("\n支出先名・法人番号の表記ゆれを名寄せし、支出先IDを付与します...")
+        try:
+            build_recipient_index(con, {record['table_name']: record['view_name'] for record in index_records})
+        except Exception as e:
+            print(f" !! 警告: 支出先の名寄せ中にエラー: {e}", file=sys.stderr)
+
     # --- インデックス用テーブルの作成 ---
     if index_records:
         print("\nインデックス用テーブル 'table_index' を作成します...")
         index_df = pd.DataFrame(index_records)
-        con.from_df(index_df).create("table_index")
+        con.from_df(index_df[['table_name', 'view_name', 'original_filename']]).create("table_index")
         print(" -> 'table_index' を作成しました。")
 
+        # --- ビルド情報 (元ZIPのハッシュ) の記録 ---
+        # 差分処理を行うスクリプトが、どのテーブルの元データが変わったかを判定するために使用する
+        manifest_df = index_df.assign(build_id=build_id, imported_at=datetime.datetime.now())
+        con.from_df(manifest_df).create("import_manifest")
+        print(" -> 'import_manifest' を作成しました。")
+
+    # --- 事業単位の検索用インデックスの作成 ---
+    if index_records:
+        print("\n予算事業IDのインデックスを作成します...")
+        build_business_id_indexes(con, [record['table_name'] for record in index_records])
+
+        # --- 事業単位の検索用テーブルの作成 (BusinessLookup で使用) ---
+        print("\n事業単位の検索用テーブルを作成します...")
+        try:
+            build_lookup_documents(con)
+        except Exception as e:
+            print(f" !! 警告: 事業単位の検索用テーブルの作成中にエラー: {e}", file=sys.stderr)
+
+    # --- ダッシュボード用の事前集計テーブルの作成 ---
+    print("\nダッシュボード用の集計テーブルを作成します...")
+    build_summary_tables(con)
+
+    # --- 資金の流れの経路表の作成 ---
+    print("\n支出ブロックのつながりから、資金の流れの経路表を作成します...")
+    try:
+        build_fund_flow_graph(con)
+    except Exception as e:
+        print(f" !! 警告: 資金の流れの経路表の作成中にエラー: {e}", file=sys.stderr)
+
+    # --- 効果発現経路のチェーン表の作成 ---
+    print("\n効果発現経路のつながりから、アクティビティ→アウトカムのチェーン表を作成します...")
+    try:
+        build_outcome_chains(con)
+    except Exception as e:
+        print(f" !! 警告: 効果発現経路のチェーン表の作成中にエラー: {e}", file=sys.stderr)
+
+    # --- 関連事業のクラスタ表の作成 ---
+    print("\n関連事業の登録から、事業のクラスタ表を作成します...")
+    try:
+        build_business_clusters(con)
+    except Exception as e:
+        print(f" !! 警告: 関連事業のクラスタ表の作成中にエラー: {e}", file=sys.stderr)
+
+    # --- 全文検索用の索引の作成 ---
+    print("\n事業名・事業概要・契約概要から、全文検索用の索引を作成します...")
+    try:
+        build_fulltext_index(con)
+    except Exception as e:
+        print(f" !! 警告: 全文検索用の索引の作成中にエラー: {e}", file=sys.stderr)
+
     con.close()
     print(f"\nすべての処理が完了しました。データは '{output_db_file}' に保存されています。")
 
@@ -0,0 +1,245 @@
+import streamlit as st
+import pandas as pd
+import duckdb
+from pathlib import Path
+import json
+import sys
+
+# --- 基本設定とパス解決 ---
+# このページは 'pages' フォルダ内にあるので、親の親がプロジェクトルート
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+
+# analysisフォルダ内の共通モジュールをインポート可能にするため、パスを追加
+sys.path.append(str(PROJECT_ROOT))
+from analysis.business_lookup import BusinessLookup
+
+# 事前集計テーブル (import_zips_to_duckdb.py の build_summary_tables で作成)
+SUMMARY_TABLES = ["summary_budget_by_bureau", "summary_expenditure_by_bureau", "summary_top_recipients"]
+
+# --- キャッシュ設定 ---
+@st.cache_data
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        st.error(f"設定ファイル '{SETTINGS_FILE}' の読み込みに失敗しました: {e}")
+        return None
+
+@st.cache_resource
+def get_db_connection(db_path):
+    """DuckDBへの接続を確立する"""
+    try:
+        con = duckdb.connect(database=str(db_path), read_only=True)
+        return con
+    except Exception as e:
+        st.error(f"データベース '{db_path}' への接続に失敗しました: {e}")
+        return None
+
+# 事業詳細の検索APIもリソースとしてキャッシュし、列カタログとLRUキャッシュを再利用する
+@st.cache_resource
+def get_business_lookup(db_path):
+    """事業詳細の検索APIを初期化する"""
+    return BusinessLookup(db_path)
+
+# 集計テーブルは小さいため、丸ごと読み込んでキャッシュする (以降の画面操作はメモリ上で完結)
+@st.cache_data
+def load_summary_table(_con, table_name: str):
+    """事前集計テーブルを読み込む"""
+    return _con.execute(f"SELECT * FROM {table_name}").fetchdf()
+
+# 末端 (事業) レベルのみ元テーブルを参照する
+@st.cache_data
+def load_business_list(_con, ministry: str, bureau: str, budget_year: int):
+    """指定された府省庁・局・庁・予算年度の事業一覧を元テーブルから取得する"""
+    query = """
+    WITH BudgetSummary AS (
+        SELECT
+            予算事業ID,
+            事業名,
+            SUM("計（歳出予算現額合計）") AS 予算額,
+            SUM("執行額（合計）") AS 執行額
+        FROM "予算・執行_サマリ"
+        WHERE 府省庁 = ? AND COALESCE("局・庁", '(未設定)') = ? AND 予算年度 = ?
+        GROUP BY 予算事業ID, 事業名
+    ),
+    ExpenditureTotal AS (
+        SELECT 予算事業ID, SUM("金額") AS 支出額
+        FROM "支出先_支出情報_明細"
+        WHERE 予算事業ID IN (SELECT 予算事業ID FROM BudgetSummary)
+        GROUP BY 予算事業ID
+    )
+    SELECT
+        b.予算事業ID,
+        b.事業名,
+        b.予算額,
+        b.執行額,
+        CASE WHEN b.予算額 = 0 THEN NULL ELSE CAST(b.執行額 AS DOUBLE) / b.予算額 * 100 END AS 執行率,
+        e.支出額
+    FROM BudgetSummary AS b
+    LEFT JOIN ExpenditureTotal AS e ON b.予算事業ID = e.予算事業ID
+    ORDER BY b.予算額 DESC NULLS LAST
+    """
+    return _con.execute(query, [ministry, bureau, budget_year]).fetchdf()
+
+def add_execution_rate(df: pd.DataFrame) -> pd.DataFrame:
+    """予算額合計・執行額合計の列から執行率(%)を計算して追加する"""
+    df = df.copy()
+    df['執行率'] = (df['執行額合計'] / df['予算額合計'].where(df['予算額合計'] != 0)) * 100
+    return df
+
+# --- Streamlit アプリケーション本体 ---
+st.set_page_config(page_title="RS System Dashboard", layout="wide")
+
+st.title("📈 RS System - 予算・支出ダッシュボード")
+st.markdown("""
+府省庁 → 局・庁 → 事業 の順に、予算額・執行率・支出額・主な支出先をドリルダウンで確認できます。
+府省庁・局・庁の集計はDB構築時に作成された集計テーブルから表示し、事業一覧のみ元データを参照します。
+""")
+
+# --- 設定とDB接続の準備 ---
+settings = load_settings()
+if settings:
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+else:
+    st.stop()
+
+if not db_file_path.is_file():
+    st.error(f"データベースファイル '{db_file_path}' が見つかりません。")
+    st.info("まず、プロジェクトのルートで `python import_zips_to_duckdb.py` を実行して、データベースを構築してください。")
+    st.stop()
+
+con = get_db_connection(db_file_path)
+if con is None:
+    st.stop()
+
+try:
+    budget_df = load_summary_table(con, "summary_budget_by_bureau")
+    expenditure_df = load_summary_table(con, "summary_expenditure_by_bureau")
+except Exception as e:
+    st.error(f"集計テーブル ({', '.join(SUMMARY_TABLES[:2])}) の読み込みに失敗しました: {e}")
+    st.info("最新の `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+    st.stop()
+
+# 支出先の集計は名寄せ (dim_recipient) を行ったDBにのみあるため、無い場合はその欄だけを省略する
+# (年度の列が無い古いDBの集計テーブルも、再構築するまでは省略する)
+try:
+    recipients_df = load_summary_table(con, "summary_top_recipients")
+    if '事業年度' not in recipients_df.columns:
+        recipients_df = None
+except Exception:
+    recipients_df = None
+
+# --- サイドバー：絞り込み条件 ---
+st.sidebar.header("表示条件")
+budget_years = sorted(budget_df['予算年度'].dropna().unique().tolist(), reverse=True)
+selected_year = st.sidebar.selectbox("予算年度:", budget_years)
+
+ministries = ["<すべての府省庁>"] + sorted(budget_df['府省庁'].dropna().unique().tolist())
+selected_ministry = st.sidebar.selectbox("府省庁:", ministries)
+
+selected_bureau = None
+if selected_ministry != "<すべての府省庁>":
+    bureaus = sorted(budget_df.loc[budget_df['府省庁'] == selected_ministry, '局・庁'].unique().tolist())
+    selected_bureau = st.sidebar.selectbox("局・庁:", ["<すべての局・庁>"] + bureaus)
+    if selected_bureau == "<すべての局・庁>":
+        selected_bureau = None
+
+# --- 表示レベルに応じた集計 ---
+year_budget_df = budget_df[budget_df['予算年度'] == selected_year]
+# 支出額は明細の事業年度で集計されているため、予算と同じ年度の行だけを対象にする
+year_expenditure_df = expenditure_df[expenditure_df['事業年度'] == selected_year]
+
+if selected_ministry == "<すべての府省庁>":
+    level_label = "府省庁"
+    group_key = '府省庁'
+    scoped_budget_df = year_budget_df
+    scoped_expenditure_df = year_expenditure_df
+else:
+    level_label = f"{selected_ministry} の局・庁"
+    group_key = '局・庁'
+    scoped_budget_df = year_budget_df[year_budget_df['府省庁'] == selected_ministry]
+    scoped_expenditure_df = year_expenditure_df[year_expenditure_df['府省庁'] == selected_ministry]
+    if selected_bureau:
+        scoped_budget_df = scoped_budget_df[scoped_budget_df['局・庁'] == selected_bureau]
+        scoped_expenditure_df = scoped_expenditure_df[scoped_expenditure_df['局・庁'] == selected_bureau]
+
+scoped_recipients_df = None
+if recipients_df is not None:
+    # 支出先も支出額と同じく、明細の事業年度が予算年度と同じ行だけを対象にする
+    year_recipients_df = recipients_df[recipients_df['事業年度'] == selected_year]
+    if selected_ministry == "<すべての府省庁>":
+        scoped_recipients_df = year_recipients_df[year_recipients_df['集計レベル'] == '全体']
+    elif selected_bureau:
+        scoped_recipients_df = year_recipients_df[
+            (year_recipients_df['集計レベル'] == '局・庁')
+            & (year_recipients_df['府省庁'] == selected_ministry)
+            & (year_recipients_df['局・庁'] == selected_bureau)
+        ]
+    else:
+        scoped_recipients_df = year_recipients_df[
+            (year_recipients_df['集計レベル'] == '府省庁') & (year_recipients_df['府省庁'] == selected_ministry)
+        ]
+
+# --- 1. 主要指標 ---
+total_budget = scoped_budget_df['予算額合計'].sum()
+total_execution = scoped_budget_df['執行額合計'].sum()
+total_expenditure = scoped_expenditure_df['支出額合計'].sum()
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("事業数", f"{int(scoped_budget_df['事業数'].sum()):,}")
+col2.metric("予算額合計", f"{total_budget:,.0f} 円")
+col3.metric("執行率", f"{total_execution / total_budget * 100:.1f} %" if total_budget else "-")
+col4.metric(f"支出額合計 (明細, {selected_year}年度)", f"{total_expenditure:,.0f} 円")
+
+# --- 2. ロールアップ表 ---
+if not selected_bureau:
+    st.subheader(f"{selected_year}年度 {level_label}別の予算・執行")
+    rollup_df = (
+        scoped_budget_df.groupby(group_key, as_index=False)[['事業数', '予算額合計', '執行額合計']].sum()
+        .pipe(add_execution_rate)
+        .merge(
+            scoped_expenditure_df.groupby(group_key, as_index=False)[['支出額合計']].sum(),
+            on=group_key, how='left'
+        )
+        .sort_values('予算額合計', ascending=False)
+    )
+    st.bar_chart(rollup_df.set_index(group_key)['予算額合計'].head(30))
+    st.dataframe(rollup_df, use_container_width=True, hide_index=True)
+
+# --- 3. 主な支出先 ---
+st.subheader(f"{selected_year}年度 支出額の大きい支出先 (上位)")
+if scoped_recipients_df is None:
+    st.info("支出先の集計テーブル (summary_top_recipients) がありません。支出先の名寄せを含めて `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+else:
+    st.dataframe(
+        scoped_recipients_df[['順位', '支出先名', '法人番号', '表記ゆれ数', '契約件数', '支出額合計']].sort_values('順位'),
+        use_container_width=True, hide_index=True
+    )
+
+# --- 4. 事業一覧 (末端レベルのみ元テーブルを参照) ---
+if selected_bureau:
+    st.subheader(f"{selected_ministry} / {selected_bureau} の事業一覧 ({selected_year}年度)")
+    with st.spinner("事業一覧を取得中..."):
+        try:
+            business_df = load_business_list(con, selected_ministry, selected_bureau, int(selected_year))
+            st.dataframe(business_df, use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.error("事業一覧の取得中にエラーが発生しました。")
+            st.code(f"{e}", language="bash")
+            st.stop()
+
+    # --- 5. 事業詳細 (予算事業IDによる1件検索) ---
+    if not business_df.empty:
+        business_options = dict(zip(business_df['予算事業ID'], business_df['事業名']))
+        selected_business_id = st.selectbox(
+            "詳細を表示する事業:",
+            list(business_options.keys()),
+            format_func=lambda business_id: f"{business_id}: {business_options[business_id]}"
+        )
+        with st.expander(f"事業 {selected_business_id} の全情報", expanded=False):
+            st.json(get_business_lookup(db_file_path).get(selected_business_id))
+elif selected_ministry != "<すべての府省庁>":
+    st.info("サイドバーで局・庁を選択すると、所属する事業の一覧を表示します。")
@@ -0,0 +1,98 @@
+import streamlit as st
+import pandas as pd
+import duckdb
+from pathlib import Path
+import json
+import time
+
+# --- 基本設定とパス解決 ---
+# このページは 'pages' フォルダ内にあるので、親の親がプロジェクトルート
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SETTINGS_FILE = PROJECT_ROOT / 'project_settings.json'
+
+# --- キャッシュ設定 ---
+@st.cache_data
+def load_settings():
+    """設定ファイルを読み込む"""
+    try:
+        with SETTINGS_FILE.open('r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        st.error(f"設定ファイル '{SETTINGS_FILE}' の読み込みに失敗しました: {e}")
+        return None
+
+@st.cache_resource
+def get_db_connection(db_path):
+    """DuckDBへの接続を確立する"""
+    try:
+        con = duckdb.connect(database=str(db_path), read_only=True)
+        return con
+    except Exception as e:
+        st.error(f"データベース '{db_path}' への接続に失敗しました: {e}")
+        return None
+
+# 同じ検索語の再検索はキャッシュから返す
+@st.cache_data
+def search_documents(_con, query_text: str, k: int, kind: str):
+    """全文検索索引 (import_zips_to_duckdb.py の実行時に作成) で検索する"""
+    start = time.perf_counter()
+    df = _con.execute("SELECT * FROM fts_search(?, k := ?)", [query_text, k]).fetchdf()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if kind != "すべて":
+        df = df[df['種別'] == kind]
+    return df, elapsed_ms
+
+# --- Streamlit アプリケーション本体 ---
+st.set_page_config(page_title="RS System Full-text Search", layout="wide")
+
+st.title("🔎 RS System - 全文検索")
+st.markdown("""
+事業名・事業の目的・事業の概要・契約概要を、キーワードで検索します（空白区切りで複数指定可）。
+DB構築時に作成された全文検索索引を使うため、全件走査を行わずに関連度の高い順で表示します。
+""")
+
+# --- 設定とDB接続の準備 ---
+settings = load_settings()
+if settings:
+    db_file_path = PROJECT_ROOT / settings['database']['output_db_file']
+else:
+    st.stop()
+
+if not db_file_path.is_file():
+    st.error(f"データベースファイル '{db_file_path}' が見つかりません。")
+    st.info("まず、プロジェクトのルートで `python import_zips_to_duckdb.py` を実行して、データベースを構築してください。")
+    st.stop()
+
+con = get_db_connection(db_file_path)
+if con is None:
+    st.stop()
+
+# --- 検索条件 ---
+col1, col2, col3 = st.columns([4, 1, 1])
+query_text = col1.text_input("検索語:", placeholder="例: 道路 橋梁 補修")
+k = col2.number_input("表示件数:", min_value=1, max_value=1000, value=50, step=10)
+kind = col3.selectbox("種別:", ["すべて", "事業", "契約"])
+
+if query_text.strip():
+    if len(query_text.strip()) < 2:
+        st.warning("検索語は2文字以上で入力してください。")
+        st.stop()
+    try:
+        results_df, elapsed_ms = search_documents(con, query_text, int(k), kind)
+    except Exception as e:
+        st.error(f"検索に失敗しました: {e}")
+        st.info("最新の `import_zips_to_duckdb.py` でデータベースを再構築してください。")
+        st.stop()
+
+    st.caption(f"{len(results_df):,}件 ({elapsed_ms:.1f}ms)")
+    st.dataframe(
+        results_df[['種別', '予算事業ID', '見出し', '本文', 'score', '一致率']],
+        use_container_width=True, hide_index=True
+    )
+    if not results_df.empty:
+        st.download_button(
+            label="結果をCSVでダウンロード",
+            data=results_df.to_csv(index=False).encode('utf-8-sig'),
+            file_name="fulltext_search_results.csv",
+            mime="text/csv",
+        )
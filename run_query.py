@@ -62,6 +62,8 @@ if __name__ == '__main__':
     parser.add_argument('-q', '--query', type=str, help="実行したいSQLクエリが書かれた.sqlファイルのパス。")
     parser.add_argument('-o', '--output', type=str, help="結果を保存するCSVの「ファイル名」。")
     parser.add_argument('--no-output', action='store_true', help="結果をファイルに出力しません。")
+    parser.add_argument('-s', '--search', type=str, help="SQLファイルの代わりに、全文検索索引 (fts_search) でキーワード検索します。")
+    parser.add_argument('-k', '--top', type=int, default=20, help="--search で取得する件数 (デフォルト: 20)")
     args = parser.parse_args()
 
     settings = load_settings()
@@ -76,6 +78,18 @@ if __name__ == '__main__':
         print(f"[エラー] 設定ファイル '{SETTINGS_FILE}' に必要なキー {e} がありません。", file=sys.stderr)
         sys.exit(1)
 
+    output_full_path = None
+    if not args.no_output:
+        output_filename = args.output or default_output_filename
+        output_full_path = Path(results_folder) / output_filename
+
+    # 全文検索モード: DB生成時に作成される fts_search マクロを呼び出す
+    if args.search:
+        search_text = args.search.replace("'", "''")
+        sql_to_run = f"SELECT * FROM fts_search('{search_text}', k := {int(args.top)});"
+        run_sql_query(sql_to_run, "全文検索", db_file, output_full_path)
+        sys.exit(0)
+
     # ▼▼▼【変更点2】クエリファイルのパス解決ロジックを強化▼▼▼
     query_file_path_str = args.query or default_query_file
     query_path = Path(query_file_path_str)
@@ -93,9 +107,4 @@ if __name__ == '__main__':
         print(f"[エラー] 指定されたクエリファイル '{query_path}' が見つかりません。", file=sys.stderr)
         sys.exit(1)
         
-    output_full_path = None
-    if not args.no_output:
-        output_filename = args.output or default_output_filename
-        output_full_path = Path(results_folder) / output_filename
-        
     run_sql_query(sql_to_run, str(query_path), db_file, output_full_path)
\ No newline at end of file
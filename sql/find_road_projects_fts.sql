@@ -0,0 +1,28 @@
+-- find_road_projects.sql と同様の「道路関連事業」の抽出を、全文検索索引 (fts_search) で行う
+-- LIKE による全件走査の代わりに、DB生成時に作成される文字bigramの転置索引を使うため高速に動作する
+-- 検索語は空白区切りで複数指定でき、BM25のスコアが高い順に返る
+-- min_match := 1 で、いずれかのキーワードの全bigramを含む事業だけに絞る (「インフラ」が「オンライン」に一致するような部分一致を除く)
+WITH 検索結果 AS (
+    SELECT 予算事業ID, MAX(score) AS スコア
+    FROM fts_search('道路 国道 交通網 インフラ', k := 1000, min_match := 1)
+    WHERE 種別 = '事業'
+    GROUP BY 予算事業ID
+)
+SELECT
+    概要.予算事業ID,
+    概要.事業名,
+    組織.府省庁,
+    予算."計（歳出予算現額合計）" AS 予算額,
+    検索結果.スコア
+FROM
+    検索結果
+JOIN
+    "基本情報_事業概要等" AS 概要 ON 検索結果.予算事業ID = 概要.予算事業ID
+JOIN
+    "基本情報_組織情報" AS 組織 ON 概要.予算事業ID = 組織.予算事業ID
+JOIN
+    "予算・執行_サマリ" AS 予算 ON 概要.予算事業ID = 予算.予算事業ID
+WHERE
+    予算."計（歳出予算現額合計）" > 0
+ORDER BY
+    予算額 DESC;